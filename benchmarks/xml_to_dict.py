@@ -0,0 +1,62 @@
+"""
+Benchmark of xml decoding: xmltodict with JSON round-trip (torskel < 0.8)
+against torskel.libs.xml_utils.xml_to_dict on SOAP-style payload
+
+python benchmarks/xml_to_dict.py [items count]
+"""
+import sys
+import json
+import timeit
+
+import xmltodict
+
+from torskel.libs.xml_utils import xml_to_dict
+
+ITEM_TMPL = '<ns1:item id="{0}" type="product">' \
+            '<ns1:name>Item {0}</ns1:name>' \
+            '<ns1:price currency="USD">{0}.99</ns1:price>' \
+            '<ns1:tags><ns1:tag>a</ns1:tag><ns1:tag>b</ns1:tag></ns1:tags>' \
+            '<ns1:description/>' \
+            '</ns1:item>'
+
+
+def make_soap_payload(items_count) -> bytes:
+    """
+    Returns SOAP envelope with items_count items
+    :param items_count: count of items
+    :return: bytes
+    """
+    items = ''.join(ITEM_TMPL.format(i) for i in range(items_count))
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope '
+        'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:ns1="urn:catalog">'
+        '<soap:Body><ns1:GetItemsResponse><ns1:items>'
+        f'{items}'
+        '</ns1:items></ns1:GetItemsResponse></soap:Body></soap:Envelope>'
+    ).encode('utf-8')
+
+
+def legacy_xml_to_dict(payload):
+    """
+    Previous implementation of from_xml
+    :param payload: bytes
+    :return: dict
+    """
+    return json.loads(json.dumps(xmltodict.parse(payload.decode('utf-8'))))
+
+
+def main():
+    items_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    payload = make_soap_payload(items_count)
+    assert legacy_xml_to_dict(payload) == xml_to_dict(payload)
+    print(f'payload: {items_count} items, {len(payload) / 1024 / 1024:.1f} MB')
+    for name, func in (('xmltodict + json round-trip', legacy_xml_to_dict),
+                       ('xml_to_dict', xml_to_dict)):
+        best = min(timeit.repeat(lambda: func(payload), number=1, repeat=5))
+        print(f'{name:30} {best * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
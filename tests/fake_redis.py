@@ -0,0 +1,158 @@
+import hashlib
+
+from torskel.libs.redis_lock import ACQUIRE_SCRIPT
+from torskel.libs.redis_lock import RELEASE_SCRIPT
+from torskel.libs.redis_lock import SET_IF_OWNER_SCRIPT
+
+
+class FakeRedisConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def execute(self, command, *args):
+        return await self.pool.execute(command, *args)
+
+
+class FakeRedisPubSubConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.channels = []
+
+    async def execute_pubsub(self, command, channel):
+        if command != 'subscribe':
+            raise ValueError(f'ERR unknown command {command}')
+        self.channels.append(channel)
+        self.pool.subscribers.setdefault(to_bytes(channel.name), []).append(
+            channel
+        )
+
+    def close(self):
+        for channel in self.channels:
+            self.pool.subscribers[to_bytes(channel.name)].remove(channel)
+            channel.close()
+
+
+def to_bytes(val):
+    if isinstance(val, bytes):
+        return val
+    return str(val).encode()
+
+
+class FakeRedisPool:
+    """
+    Redis pool keeping values in dict, values are stored as bytes
+    like redis does. Expire times are kept in seconds without expiring keys.
+    Known lua scripts are evaluated by their python versions.
+    create_connection replaces aioredis.create_connection for subscriptions
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.commands = []
+        self.reads = []
+        self.scripts = {
+            ACQUIRE_SCRIPT: self.script_acquire,
+            SET_IF_OWNER_SCRIPT: self.script_set_if_owner,
+            RELEASE_SCRIPT: self.script_release,
+        }
+        self.loaded_scripts = {}
+        self.subscribers = {}
+        self.published = []
+
+    def get(self):
+        return FakeRedisConnection(self)
+
+    async def create_connection(self, *_args, **_kwargs):
+        return FakeRedisPubSubConnection(self)
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    async def execute(self, command, *args):
+        self.commands.append(command)
+        handler = getattr(self, f'cmd_{command}', None)
+        if handler is None:
+            raise ValueError(f'ERR unknown command {command}')
+        return handler(*args)
+
+    def cmd_set(self, key, val, *options):
+        options = [to_bytes(option).upper() for option in options]
+        if b'NX' in options and key in self.data:
+            return None
+        self.data[key] = to_bytes(val)
+        self.expires.pop(key, None)
+        if b'EX' in options:
+            self.expires[key] = int(options[options.index(b'EX') + 1])
+        elif b'PX' in options:
+            self.expires[key] = int(options[options.index(b'PX') + 1]) / 1000
+        return b'OK'
+
+    def cmd_get(self, key):
+        self.reads.append(key)
+        return self.data.get(key)
+
+    def cmd_mget(self, *keys):
+        self.reads.extend(keys)
+        return [self.data.get(key) for key in keys]
+
+    def cmd_del(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def cmd_expire(self, key, seconds):
+        if key not in self.data:
+            return 0
+        self.expires[key] = seconds
+        return 1
+
+    def cmd_publish(self, channel, message):
+        self.published.append((channel, message))
+        channels = self.subscribers.get(to_bytes(channel), [])
+        for sub in channels:
+            sub.put_nowait(message)
+        return len(channels)
+
+    def cmd_incr(self, key):
+        val = int(self.data.get(key, 0)) + 1
+        self.data[key] = to_bytes(val)
+        return val
+
+    def cmd_eval(self, script, numkeys, *args):
+        func = self.scripts.get(script)
+        if func is None:
+            raise ValueError('ERR unknown script')
+        self.loaded_scripts[hashlib.sha1(script.encode()).hexdigest()] = func
+        return func(list(args[:numkeys]), list(args[numkeys:]))
+
+    def cmd_evalsha(self, sha, numkeys, *args):
+        func = self.loaded_scripts.get(sha)
+        if func is None:
+            raise ValueError('NOSCRIPT No matching script')
+        return func(list(args[:numkeys]), list(args[numkeys:]))
+
+    def script_acquire(self, keys, args):
+        token = self.cmd_incr(keys[1])
+        if self.cmd_set(keys[0], token, 'NX', 'PX', args[0]):
+            return token
+        return None
+
+    def script_set_if_owner(self, keys, args):
+        if self.data.get(keys[1]) == to_bytes(args[0]):
+            self.cmd_set(keys[0], args[1], 'PX', args[2])
+            self.cmd_del(keys[1])
+            return 1
+        return 0
+
+    def script_release(self, keys, args):
+        if self.data.get(keys[0]) == to_bytes(args[0]):
+            return self.cmd_del(keys[0])
+        return 0
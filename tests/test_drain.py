@@ -0,0 +1,53 @@
+import time
+
+import tornado.gen
+import tornado.web
+from tornado.httpclient import AsyncHTTPClient
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from torskel import TorskelServer, TorskelHandler
+
+
+class SlowHandler(TorskelHandler):
+    async def get(self):
+        await tornado.gen.sleep(float(self.get_argument('delay')))
+        self.finish('done')
+
+
+class TestDrainRequests(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = TorskelServer([(r"/", SlowHandler)])
+        return self.app
+
+    async def start_request(self, delay):
+        future = AsyncHTTPClient().fetch(self.get_url(f'/?delay={delay}'))
+        while not self.app.requests_in_flight:
+            await tornado.gen.sleep(0.01)
+        return future
+
+    @gen_test
+    async def test_waits_for_requests(self):
+        future = await self.start_request(0.2)
+        await self.app.drain_requests(timeout=5)
+        self.assertEqual(self.app.requests_in_flight, 0)
+        res = await future
+        self.assertEqual(res.body, b'done')
+
+    @gen_test
+    async def test_timeout(self):
+        future = await self.start_request(1)
+        started = time.monotonic()
+        await self.app.drain_requests(timeout=0.2)
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual(self.app.requests_in_flight, 1)
+        await future
+
+
+class TestPlainApplication(AsyncHTTPTestCase):
+    def get_app(self):
+        return tornado.web.Application([(r"/", SlowHandler)])
+
+    def test_get(self):
+        res = self.fetch('/?delay=0')
+        self.assertEqual(res.code, 200)
+        self.assertEqual(res.body, b'done')
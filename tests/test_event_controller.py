@@ -0,0 +1,121 @@
+import asyncio
+from unittest import mock
+
+from tornado.options import options
+from tornado.testing import AsyncTestCase, gen_test
+
+from torskel.libs.event_controller import TorskelEventLogController
+
+
+class TestEventLogController(AsyncTestCase):
+    def setUp(self):
+        super(TestEventLogController, self).setUp()
+        self.controller = TorskelEventLogController()
+        self.written = []
+
+    async def events_writer(self, db, collection_name, bulk_list):
+        self.written.append(list(bulk_list))
+
+    @gen_test
+    async def test_flush(self):
+        for i in range(options.task_list_size * 2 + 3):
+            self.controller.add_log_event({'n': i})
+        await self.controller.flush(None, 'events', self.events_writer)
+        self.assertEqual(self.controller.queue.qsize(), 0)
+        self.assertEqual(len(self.written), 3)
+        self.assertEqual(sum(len(x) for x in self.written),
+                         options.task_list_size * 2 + 3)
+
+    async def write_events(self, events):
+        self.written.append(list(events))
+        await asyncio.sleep(0.05)
+
+    @gen_test
+    async def test_writer_batch_size(self):
+        for i in range(25):
+            self.controller.add_log_event({'n': i})
+        self.controller.start(self.write_events, batch_size=10,
+                              flush_interval=10000, concurrency=3)
+        await asyncio.sleep(0.01)
+        # full batches are written concurrently without waiting
+        self.assertEqual([len(x) for x in self.written], [10, 10])
+        self.assertEqual(self.controller.get_stats()['inserts_in_progress'],
+                         2)
+        await self.controller.stop()
+        self.assertEqual(self.controller.get_stats()['written'], 20)
+        self.assertEqual(self.controller.get_stats()['queue_size'], 5)
+
+    @gen_test
+    async def test_writer_flush_interval(self):
+        self.controller.start(self.write_events, batch_size=10,
+                              flush_interval=50)
+        for i in range(3):
+            self.controller.add_log_event({'n': i})
+        await asyncio.sleep(0.02)
+        self.assertEqual(self.written, [])
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.written, [[{'n': 0}, {'n': 1}, {'n': 2}]])
+        await self.controller.stop()
+        stats = self.controller.get_stats()
+        self.assertEqual(stats['batches'], 1)
+        self.assertGreaterEqual(stats['lag'], 0.05)
+
+    @gen_test
+    async def test_writer_errors(self):
+        async def failed_write(events):
+            raise ConnectionError()
+        self.controller.add_log_event({'n': 1})
+        self.controller.start(failed_write, flush_interval=10)
+        await asyncio.sleep(0.05)
+        await self.controller.stop()
+        self.assertEqual(self.controller.get_stats()['errors'], 1)
+
+
+class TestEventsQueueOverflow(AsyncTestCase):
+    def fill(self, controller, count):
+        return [controller.add_log_event({'n': i}) for i in range(count)]
+
+    def get_queued(self, controller):
+        return [controller.queue.get_nowait()[1]['n']
+                for _ in range(controller.queue.qsize())]
+
+    @gen_test
+    async def test_drop_newest(self):
+        controller = TorskelEventLogController(3)
+        results = [await res for res in self.fill(controller, 5)]
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(self.get_queued(controller), [0, 1, 2])
+        self.assertEqual(controller.get_stats()['dropped'], 2)
+
+    @gen_test
+    async def test_drop_oldest(self):
+        controller = TorskelEventLogController(3, 'drop_oldest')
+        self.fill(controller, 5)
+        self.assertEqual(self.get_queued(controller), [2, 3, 4])
+        self.assertEqual(controller.dropped, 2)
+
+    @gen_test
+    async def test_sample(self):
+        controller = TorskelEventLogController(100, 'sample',
+                                               sample_from=0.5)
+        # probability to keep event falls from 1 at 50 events to 0 at 100
+        with mock.patch('random.random', return_value=0.5):
+            self.fill(controller, 100)
+        self.assertEqual(controller.queue.qsize(), 75)
+        self.assertEqual(controller.dropped, 25)
+
+    @gen_test
+    async def test_block(self):
+        controller = TorskelEventLogController(2, 'block',
+                                               block_timeout=0.05)
+        results = self.fill(controller, 4)
+        self.assertEqual(controller.delayed, 2)
+        controller.queue.get_nowait()
+        self.assertEqual([await res for res in results],
+                         [True, True, True, False])
+        self.assertEqual(self.get_queued(controller), [1, 2])
+        self.assertEqual(controller.get_stats()['dropped'], 1)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            TorskelEventLogController(10, 'unknown')
@@ -0,0 +1,102 @@
+import datetime
+
+from tornado.httputil import HTTPHeaders
+from tornado.testing import AsyncHTTPTestCase
+
+from torskel import TorskelServer, TorskelHandler
+from torskel.libs.event_record import TorskelEventRecord
+from torskel.libs.event_record import get_headers_items
+
+
+UA = 'Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0'
+
+
+class EventHandler(TorskelHandler):
+    def get(self):
+        self.add_log_event({'action': 'view'})
+        self.finish('ok')
+
+
+class MutatingEventHandler(TorskelHandler):
+    def get(self):
+        event = {'action': 'view'}
+        self.add_log_event(event)
+        event['action'] = 'changed'
+        self.finish('ok')
+
+
+class SkeletonHandler(TorskelHandler):
+    def _get_event_skeleton(self, lite_event=False):
+        event = super()._get_event_skeleton(lite_event)
+        event['service'] = 'shop'
+        event['ip_copy'] = event['user_ip']
+        return event
+
+    def get(self):
+        self.add_log_event({'action': 'view'})
+        self.finish('ok')
+
+
+class TestEventRecord(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = TorskelServer([(r"/mutating", MutatingEventHandler),
+                                  (r"/skeleton", SkeletonHandler),
+                                  (r"/.*", EventHandler)])
+        return self.app
+
+    def test_event_is_copied(self):
+        self.fetch('/mutating')
+        event = self.app.event_writer._take_batch(1)[0]
+        self.assertEqual(event['action'], 'view')
+
+    def test_overridden_skeleton(self):
+        self.fetch('/skeleton', headers={'X-Real-IP': '10.0.0.1'})
+        event = self.app.event_writer._take_batch(1)[0]
+        self.assertEqual(event['service'], 'shop')
+        self.assertEqual(event['ip_copy'], '10.0.0.1')
+        self.assertEqual(event['action'], 'view')
+
+    def test_handler_event(self):
+        self.fetch('/' + 'a' * 200, headers={'User-Agent': UA,
+                                              'Referer': 'http://ref',
+                                              'Cookie': 'secret'})
+        _, record = self.app.event_writer.queue._queue[0]
+        self.assertIsInstance(record, TorskelEventRecord)
+        self.assertEqual(record.user_agent, UA)
+
+        event = self.app.event_writer._take_batch(1)[0]
+        self.assertEqual(event['user_agent'], 'PC / Linux / Firefox 115.0')
+        self.assertEqual(event['handler_url'], '/' + 'a' * 127)
+        self.assertEqual(event['method'], 'GET')
+        self.assertEqual(event['action'], 'view')
+        self.assertEqual(event['headers']['Referer'], 'http://ref')
+        self.assertNotIn('Cookie', event['headers'])
+        self.assertIsInstance(event['date_event'], datetime.datetime)
+
+    def test_lite_event(self):
+        headers = HTTPHeaders({'host': 'localhost', 'Cookie': 'secret'})
+        record = TorskelEventRecord(
+            0, None, '127.0.0.1', get_headers_items(headers, ['Host'])
+        )
+        self.assertEqual(record.to_dict(), {
+            'date_event': datetime.datetime.fromtimestamp(0),
+            'user_agent': 'Unknown',
+            'user_ip': '127.0.0.1',
+            'headers': {'Host': 'localhost'},
+        })
+        with self.assertRaises(AttributeError):
+            record.other = 1
+
+    def test_item_access(self):
+        record = TorskelEventRecord(0, None, '127.0.0.1', ())
+        record.update({'a': 1})
+        record['user_ip'] = '10.0.0.1'
+        self.assertEqual(record['a'], 1)
+        self.assertEqual(record['user_agent'], 'Unknown')
+        self.assertEqual(record.get('user_ip'), '10.0.0.1')
+        self.assertIsNone(record.get('missing'))
+        self.assertIn('a', record)
+        self.assertNotIn('handler_url', record)
+        with self.assertRaises(KeyError):
+            record['missing']
+        self.assertEqual(record.to_dict()['user_ip'], '10.0.0.1')
@@ -0,0 +1,82 @@
+import asyncio
+import datetime
+import glob
+import gzip
+import os
+import tempfile
+
+from tornado.httputil import HTTPHeaders
+from tornado.testing import AsyncTestCase, gen_test
+
+from torskel.libs.event_controller import TorskelEventLogController
+from torskel.libs.event_sinks import TorskelEventSink, TorskelFileEventSink
+from torskel.libs.json_codec import json_loads
+
+
+class MemorySink(TorskelEventSink):
+    def __init__(self, fails=0, **kwargs):
+        super().__init__(**kwargs)
+        self.fails = fails
+        self.written = []
+
+    async def write(self, events):
+        if self.fails:
+            self.fails -= 1
+            raise ConnectionError()
+        self.written.append(events)
+
+
+class TestEventSinks(AsyncTestCase):
+    @gen_test
+    async def test_fan_out(self):
+        controller = TorskelEventLogController()
+        sinks = [MemorySink(name='a', batch_size=2, flush_interval=10),
+                 MemorySink(name='b', batch_size=5, flush_interval=10,
+                            fails=1, retry_delay=0.01)]
+        for sink in sinks:
+            controller.add_sink(sink)
+            sink.start()
+        controller.start(controller.write_to_sinks, flush_interval=10)
+        for i in range(5):
+            controller.add_log_event({'n': i})
+        await asyncio.sleep(0.1)
+        await controller.stop()
+        for sink in sinks:
+            await sink.stop()
+        self.assertEqual([len(x) for x in sinks[0].written], [2, 2, 1])
+        self.assertEqual([len(x) for x in sinks[1].written], [5])
+        self.assertIsNot(sinks[0].written[0][0], sinks[1].written[0][0])
+        stats = controller.get_stats()['sinks']
+        self.assertEqual(stats['b']['retried'], 1)
+        self.assertEqual(stats['b']['written'], 5)
+
+    @gen_test
+    async def test_retries_exceeded(self):
+        sink = MemorySink(fails=3, retries=1, retry_delay=0.01)
+        sink.put([{'n': 1}])
+        await sink.stop()
+        self.assertEqual(sink.written, [])
+        self.assertEqual(sink.fails, 1)
+
+    @gen_test
+    async def test_file_rotation(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'events.jsonl')
+            sink = TorskelFileEventSink(path, max_bytes=250, backup_count=1,
+                                        batch_size=2)
+            date = datetime.datetime(2020, 1, 2)
+            for i in range(10):
+                sink.put([{'n': i, 'date': date,
+                           'headers': HTTPHeaders({'Host': 'localhost'})}])
+            await sink.stop()
+            backups = sorted(glob.glob(f'{path}.*.gz'))
+            # batches 0-1, 2-3 and 4-5, 6-7 are rotated, the oldest file
+            # is removed
+            self.assertEqual(len(backups), 1)
+            with gzip.open(backups[0]) as file:
+                event = json_loads(file.readline())
+            self.assertEqual(event['n'], 4)
+            self.assertEqual(event['date'], '2020-01-02T00:00:00')
+            self.assertEqual(event['headers'], {'Host': 'localhost'})
+            with open(path, 'rb') as file:
+                self.assertEqual(json_loads(file.readline())['n'], 8)
@@ -0,0 +1,131 @@
+import os
+import asyncio
+import tempfile
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from torskel.libs.event_controller import TorskelEventLogController
+from torskel.libs.event_spill import TorskelEventSpill
+from torskel.libs.json_codec import json_dumps_bytes, json_loads
+
+
+class TestEventSpill(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.written = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def get_spill(self, **kwargs):
+        return TorskelEventSpill(self.tmp_dir.name, encode=json_dumps_bytes,
+                                 decode=json_loads, **kwargs)
+
+    async def write_events(self, events):
+        self.written.extend(event['n'] for event in events)
+
+    @gen_test
+    async def test_replay(self):
+        spill = self.get_spill(segment_size=200, batch_size=3)
+        for i in range(0, 30, 5):
+            spill.append([{'n': n} for n in range(i, i + 5)])
+        self.assertGreater(len(spill.segments), 1)
+        await spill.replay(self.write_events)
+        self.assertEqual(self.written, list(range(30)))
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+        self.assertEqual(spill.get_stats()['replayed'], 30)
+
+    @gen_test
+    async def test_replay_after_restart(self):
+        spill = self.get_spill(batch_size=2)
+        spill.append([{'n': n} for n in range(5)])
+        spill.close_segment()
+        calls = []
+
+        async def failed_write(events):
+            calls.append(events)
+            if len(calls) == 2:
+                raise ConnectionError()
+        await spill.replay(failed_write)
+        self.assertEqual(len(spill.segments), 1)
+
+        # truncated record of crashed process
+        path = os.path.join(self.tmp_dir.name, spill.segments[0])
+        with open(path, 'ab') as file:
+            file.write(b'\x10\x00\x00\x00\x00')
+        spill = self.get_spill(batch_size=2)
+        await spill.replay(self.write_events)
+        self.assertEqual(self.written, [2, 3, 4])
+        self.assertEqual(spill.segments, [])
+
+    @gen_test
+    async def test_shared_directory(self):
+        old_spill = self.get_spill()
+        old_spill.append([{'n': n} for n in range(3)])
+        # new process of handover starts while old one writes segment
+        new_spill = self.get_spill()
+        self.assertEqual(new_spill.segments, old_spill.segments)
+        await new_spill.replay(self.write_events)
+        self.assertEqual(self.written, [])
+        self.assertEqual(len(os.listdir(self.tmp_dir.name)), 1)
+
+        old_spill.append([{'n': n} for n in range(3, 5)])
+        old_spill.close_segment()
+        await new_spill.replay(self.write_events)
+        self.assertEqual(self.written, list(range(5)))
+        self.assertEqual(new_spill.segments, [])
+        # segment is already replayed by the new process
+        await old_spill.replay(self.write_events)
+        self.assertEqual(self.written, list(range(5)))
+        self.assertEqual(old_spill.segments, [])
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    @gen_test
+    async def test_concurrent_replay(self):
+        first_spill = self.get_spill(batch_size=2)
+        first_spill.append([{'n': n} for n in range(6)])
+        first_spill.close_segment()
+        second_spill = self.get_spill(batch_size=2)
+
+        async def slow_write(events):
+            await asyncio.sleep(0.01)
+            await self.write_events(events)
+
+        await asyncio.gather(first_spill.replay(slow_write),
+                             second_spill.replay(slow_write))
+        self.assertEqual(self.written, list(range(6)))
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    @gen_test
+    async def test_replay_rate(self):
+        spill = self.get_spill(batch_size=10, replay_rate=100)
+        spill.append([{'n': n} for n in range(20)])
+        started = asyncio.get_event_loop().time()
+        await spill.replay(self.write_events)
+        self.assertGreaterEqual(asyncio.get_event_loop().time() - started,
+                                0.19)
+
+    @gen_test
+    async def test_controller(self):
+        controller = TorskelEventLogController(spill=self.get_spill())
+        is_down = True
+
+        async def write_events(events):
+            if is_down:
+                raise ConnectionError()
+            await self.write_events(events)
+
+        controller.start(write_events, batch_size=2, flush_interval=10)
+        for i in range(4):
+            controller.add_log_event({'n': i})
+        await asyncio.sleep(0.05)
+        self.assertEqual(controller.get_stats()['spill']['spilled'], 4)
+        is_down = False
+        controller.add_log_event({'n': 4})
+        await asyncio.sleep(0.05)
+        await controller.stop()
+        await controller.close()
+        self.assertEqual(sorted(self.written), [0, 1, 2, 3, 4])
+        self.assertEqual(controller.spill.get_stats()['segments'], 0)
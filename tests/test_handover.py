@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+import socket
+import unittest
+import subprocess
+from unittest import mock
+
+from torskel.libs.handover import get_inherited_sockets
+from torskel.libs.handover import get_ready_fd
+from torskel.libs.handover import notify_ready
+from torskel.libs.handover import start_successor
+from torskel.libs.handover import wait_successor
+from torskel.libs.handover import TORSKEL_LISTEN_FDS
+from torskel.libs.handover import TORSKEL_READY_FD
+
+
+class TestHandover(unittest.TestCase):
+    def setUp(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen()
+
+    def tearDown(self):
+        self.sock.close()
+
+    def test_no_inherited_sockets(self):
+        os.environ.pop(TORSKEL_LISTEN_FDS, None)
+        self.assertEqual(get_inherited_sockets(), [])
+
+    def test_inherited_sockets(self):
+        fd = os.dup(self.sock.fileno())
+        os.environ[TORSKEL_LISTEN_FDS] = str(fd)
+        sockets = get_inherited_sockets()
+        self.assertEqual(len(sockets), 1)
+        self.assertEqual(sockets[0].getsockname(), self.sock.getsockname())
+        self.assertNotIn(TORSKEL_LISTEN_FDS, os.environ)
+        sockets[0].close()
+
+
+class TestWaitSuccessor(unittest.TestCase):
+    def start(self, code):
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ, **{TORSKEL_READY_FD: str(write_fd)})
+        process = subprocess.Popen([sys.executable, '-c', code], env=env,
+                                   pass_fds=[write_fd])
+        os.close(write_fd)
+        self.addCleanup(process.wait)
+        return process, read_fd
+
+    def test_ready(self):
+        process, read_fd = self.start(
+            'import time\n'
+            'from torskel.libs.handover import get_ready_fd, notify_ready\n'
+            'notify_ready(get_ready_fd())\n'
+            'time.sleep(0.5)\n'
+        )
+        self.assertTrue(wait_successor(process, read_fd, 10))
+        self.assertIsNone(process.poll())
+
+    def test_all_workers_ready(self):
+        process, read_fd = self.start(
+            'import time\n'
+            'from torskel.libs.handover import get_ready_fd, notify_ready\n'
+            'fd = get_ready_fd()\n'
+            'notify_ready(fd)\n'
+            'time.sleep(0.3)\n'
+            'notify_ready(fd)\n'
+            'time.sleep(0.5)\n'
+        )
+        started = time.monotonic()
+        self.assertTrue(wait_successor(process, read_fd, 10, workers=2))
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+    def test_not_all_workers_ready(self):
+        process, read_fd = self.start(
+            'import time\n'
+            'from torskel.libs.handover import get_ready_fd, notify_ready\n'
+            'notify_ready(get_ready_fd())\n'
+            'time.sleep(30)\n'
+        )
+        self.assertFalse(wait_successor(process, read_fd, 0.5, workers=2))
+        self.assertIsNotNone(process.poll())
+
+    def test_exited(self):
+        process, read_fd = self.start('raise SystemExit(3)')
+        self.assertFalse(wait_successor(process, read_fd, 10))
+        self.assertEqual(process.returncode, 3)
+
+    def test_timeout(self):
+        process, read_fd = self.start('import time; time.sleep(30)')
+        self.assertFalse(wait_successor(process, read_fd, 0.3))
+        self.assertIsNotNone(process.poll())
+
+    def test_notify_ready(self):
+        read_fd, write_fd = os.pipe()
+        os.environ[TORSKEL_READY_FD] = str(write_fd)
+        fd = get_ready_fd()
+        self.assertNotIn(TORSKEL_READY_FD, os.environ)
+        notify_ready(fd)
+        self.assertEqual(os.read(read_fd, 1), b'1')
+        os.close(read_fd)
+        # the previous process does not wait any more
+        notify_ready(fd)
+        os.close(write_fd)
+        notify_ready(None)
+
+    def test_refused_under_systemd(self):
+        with mock.patch.dict(os.environ, {'INVOCATION_ID': '1'}), \
+                mock.patch('subprocess.Popen') as popen:
+            self.assertFalse(start_successor([], 10))
+        popen.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+from tornado.httputil import HTTPHeaders
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from torskel import TorskelServer, TorskelHandler
+from torskel.libs.http_cache import get_cache_ttl
+from torskel.libs.lru_cache import TorskelLRUCache
+
+
+class ReferenceHandler(TorskelHandler):
+    calls = 0
+
+    def get(self):
+        ReferenceHandler.calls += 1
+        self.set_header('Cache-Control', self.get_argument('cc', 'no-cache'))
+        self.write({'value': 1})
+
+
+class TestCacheTtl(unittest.TestCase):
+    def test_max_age(self):
+        headers = HTTPHeaders({'Cache-Control': 'public, max-age=60'})
+        self.assertEqual(get_cache_ttl(headers), 60)
+
+    def test_no_store(self):
+        headers = HTTPHeaders({'Cache-Control': 'no-store'})
+        self.assertIsNone(get_cache_ttl(headers))
+
+    def test_expires(self):
+        headers = HTTPHeaders({
+            'Date': 'Wed, 21 Oct 2015 07:28:00 GMT',
+            'Expires': 'Wed, 21 Oct 2015 07:29:00 GMT',
+        })
+        self.assertEqual(get_cache_ttl(headers), 60)
+
+    def test_default(self):
+        self.assertEqual(get_cache_ttl(HTTPHeaders(), 5), 5)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_eviction_by_bytes(self):
+        cache = TorskelLRUCache(max_items=10, max_bytes=10)
+        cache.set('a', 1, size=6)
+        cache.set('b', 2, size=6)
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+
+    def test_lru_order(self):
+        cache = TorskelLRUCache(max_items=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+
+    def test_ttl(self):
+        cache = TorskelLRUCache()
+        cache.set('a', 1, ttl=-1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get_stats()['misses'], 1)
+
+
+class TestHttpCache(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = TorskelServer([(r"/", ReferenceHandler)])
+        return self.app
+
+    def setUp(self):
+        super(TestHttpCache, self).setUp()
+        ReferenceHandler.calls = 0
+
+    @gen_test
+    async def test_fresh_hit(self):
+        url = self.get_url('/?cc=max-age%3D60')
+        for _ in range(3):
+            res = await self.app.http_request_get(url, from_json=True,
+                                                  use_cache=True)
+            self.assertEqual(res, {'value': 1})
+        self.assertEqual(ReferenceHandler.calls, 1)
+        self.assertEqual(self.app.get_http_cache_stats()['hits'], 2)
+
+    @gen_test
+    async def test_etag_revalidation(self):
+        url = self.get_url('/')
+        for _ in range(2):
+            res = await self.app.http_request_get(url, from_json=True,
+                                                  use_cache=True)
+            self.assertEqual(res, {'value': 1})
+        self.assertEqual(ReferenceHandler.calls, 2)
+        self.assertEqual(
+            self.app.get_http_cache_stats()['revalidations'], 1
+        )
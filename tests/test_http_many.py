@@ -0,0 +1,61 @@
+import tornado.gen
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from torskel import TorskelServer, TorskelHandler
+
+
+class DelayHandler(TorskelHandler):
+    active = 0
+    max_active = 0
+
+    async def get(self):
+        DelayHandler.active += 1
+        DelayHandler.max_active = max(DelayHandler.max_active,
+                                      DelayHandler.active)
+        delay = float(self.get_argument('delay'))
+        await tornado.gen.sleep(delay)
+        DelayHandler.active -= 1
+        self.write({'delay': delay})
+
+    def post(self):
+        self.write({'value': self.get_argument('value')})
+
+
+class TestHttpRequestMany(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = TorskelServer([(r"/", DelayHandler)])
+        return self.app
+
+    def setUp(self):
+        super(TestHttpRequestMany, self).setUp()
+        DelayHandler.max_active = 0
+
+    @gen_test
+    async def test_ordered_results(self):
+        requests = [self.get_url(f'/?delay={d}') for d in (0.1, 0, 0.05)]
+        requests.append({'url': self.get_url('/'), 'method': 'POST',
+                         'body': {'value': 'x'}})
+        res = await self.app.http_request_many(requests, from_json=True)
+        self.assertEqual(res, [{'delay': 0.1}, {'delay': 0},
+                               {'delay': 0.05}, {'value': 'x'}])
+
+    @gen_test
+    async def test_concurrency(self):
+        requests = [self.get_url('/?delay=0.02')] * 6
+        res = await self.app.http_request_many(requests, concurrency=2)
+        self.assertEqual(len(res), 6)
+        self.assertEqual(DelayHandler.max_active, 2)
+
+    @gen_test
+    async def test_timeout(self):
+        requests = [self.get_url(f'/?delay={d}') for d in (0, 1)]
+        res = await self.app.http_request_many(requests, timeout=0.3,
+                                               from_json=True)
+        self.assertEqual(res, [{'delay': 0}, None])
+
+    @gen_test
+    async def test_iter(self):
+        requests = [self.get_url(f'/?delay={d}') for d in (0.2, 0)]
+        res = [item async for item in self.app.http_request_many_iter(
+            requests, from_json=True)]
+        self.assertEqual(res, [(1, {'delay': 0}), (0, {'delay': 0.2})])
@@ -0,0 +1,80 @@
+import tornado.gen
+import tornado.httpclient
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application, RequestHandler
+
+from torskel.libs.http_pools import TorskelHttpPools
+
+
+class SlowHandler(RequestHandler):
+    async def get(self):
+        await tornado.gen.sleep(0.2)
+        self.write('ok')
+
+
+class TestHttpPools(AsyncHTTPTestCase):
+    def get_app(self):
+        return Application([(r"/", SlowHandler)])
+
+    def setUp(self):
+        super(TestHttpPools, self).setUp()
+        self.pools = TorskelHttpPools(max_clients=1, queue_timeout=0.05)
+
+    def tearDown(self):
+        self.pools.close()
+        super(TestHttpPools, self).tearDown()
+
+    @gen_test
+    async def test_fetch(self):
+        res = await self.pools.fetch(self.get_url('/'))
+        self.assertEqual(res.body, b'ok')
+        stats = self.pools.get_stats()[f'127.0.0.1:{self.get_http_port()}']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['active'], 0)
+
+    @gen_test
+    async def test_queue_timeout(self):
+        first = tornado.gen.convert_yielded(
+            self.pools.fetch(self.get_url('/'))
+        )
+        await tornado.gen.sleep(0.01)
+        with self.assertRaises(tornado.httpclient.HTTPError) as ctx:
+            await self.pools.fetch(self.get_url('/'))
+        self.assertEqual(ctx.exception.code, 599)
+        await first
+
+    @gen_test
+    async def test_named_upstream(self):
+        host = f'127.0.0.1:{self.get_http_port()}'
+        self.pools.configure('backend', hosts=[host], max_clients=2)
+        await self.pools.fetch(self.get_url('/'))
+        self.assertEqual(self.pools.get_stats()['backend']['requests'], 1)
+
+    @gen_test
+    async def test_not_configured_hosts_evicted(self):
+        self.pools = TorskelHttpPools(max_clients=1, max_hosts=1)
+        port = self.get_http_port()
+        first = tornado.gen.convert_yielded(
+            self.pools.fetch(f'http://127.0.0.1:{port}/')
+        )
+        await tornado.gen.sleep(0.01)
+        first_pool = self.pools.get_pool(f'http://127.0.0.1:{port}/')
+        self.pools.get_pool(f'http://localhost:{port}/')
+        self.assertEqual(list(self.pools.get_stats()), [f'localhost:{port}'])
+        # evicted pool is closed after request in progress
+        self.assertTrue(first_pool.closing)
+        self.assertFalse(first_pool.closed)
+        self.assertEqual((await first).body, b'ok')
+        self.assertTrue(first_pool.closed)
+
+    @gen_test
+    async def test_configured_pool_not_evicted(self):
+        self.pools = TorskelHttpPools(max_clients=1, max_hosts=1)
+        port = self.get_http_port()
+        self.pools.configure(f'127.0.0.1:{port}')
+        await self.pools.fetch(f'http://localhost:{port}/')
+        await self.pools.fetch(f'http://127.0.0.1:{port}/')
+        await self.pools.fetch(f'http://localhost:{port}/')
+        self.assertEqual(sorted(self.pools.get_stats()),
+                         [f'127.0.0.1:{port}', f'localhost:{port}'])
+        self.assertEqual(self.pools.host_pools.evictions, 0)
@@ -0,0 +1,203 @@
+import unittest
+
+import tornado.gen
+
+from tornado.options import options
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from torskel import TorskelServer, TorskelHandler
+from torskel.libs.http_resilience import TorskelCircuitBreaker
+from torskel.libs.http_resilience import TorskelRetryPolicy
+from torskel.libs.http_resilience import BREAKER_OPEN
+from torskel.libs.http_resilience import BREAKER_CLOSED
+from torskel.libs.http_resilience import BREAKER_HALF_OPEN
+
+
+class FlakyHandler(TorskelHandler):
+    calls = 0
+
+    def get(self):
+        FlakyHandler.calls += 1
+        if FlakyHandler.calls <= int(self.get_argument('fail', 0)):
+            self.set_status(503)
+        self.write('ok')
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_should_retry(self):
+        policy = TorskelRetryPolicy(max_retries=2)
+        self.assertTrue(policy.should_retry('GET', 503, 0))
+        self.assertTrue(policy.should_retry('GET', None, 1))
+        self.assertFalse(policy.should_retry('GET', 503, 2))
+        self.assertFalse(policy.should_retry('GET', 404, 0))
+        self.assertFalse(policy.should_retry('POST', 503, 0))
+
+    def test_delay(self):
+        policy = TorskelRetryPolicy(backoff=0.1, max_backoff=0.3)
+        for attempt in range(5):
+            self.assertLessEqual(policy.get_delay(attempt), 0.3)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_open_and_reset(self):
+        breaker = TorskelCircuitBreaker('host', failure_threshold=2,
+                                        reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, BREAKER_CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, BREAKER_OPEN)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, BREAKER_CLOSED)
+
+    def test_reject(self):
+        breaker = TorskelCircuitBreaker('host', failure_threshold=1,
+                                        reset_timeout=60)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.get_stats()['rejected'], 1)
+
+
+    def test_half_open_one_trial(self):
+        breaker = TorskelCircuitBreaker('host', failure_threshold=1,
+                                        reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual([breaker.allow() for _ in range(5)],
+                         [True, False, False, False, False])
+        self.assertEqual(breaker.state, BREAKER_HALF_OPEN)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, BREAKER_OPEN)
+        self.assertTrue(breaker.allow())
+        breaker.release()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual([breaker.allow() for _ in range(3)],
+                         [True, True, True])
+
+
+class SlowStatusHandler(TorskelHandler):
+    calls = 0
+
+    async def get(self):
+        SlowStatusHandler.calls += 1
+        await tornado.gen.sleep(0.1)
+        self.set_status(int(self.get_argument('status', 200)))
+        self.write('ok')
+
+
+class TestHalfOpenBreaker(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = TorskelServer([(r"/", SlowStatusHandler)])
+        return self.app
+
+    def setUp(self):
+        super(TestHalfOpenBreaker, self).setUp()
+        SlowStatusHandler.calls = 0
+        options.use_http_circuit_breaker = True
+        self.breaker = self.app.get_http_breaker(
+            f'127.0.0.1:{self.get_http_port()}'
+        )
+        self.breaker.reset_timeout = 0
+        for _ in range(self.breaker.failure_threshold):
+            self.breaker.record_failure()
+
+    def tearDown(self):
+        options.use_http_circuit_breaker = False
+        super(TestHalfOpenBreaker, self).tearDown()
+
+    async def request_many(self, status):
+        return await tornado.gen.multi([
+            self.app.http_request_get(self.get_url(f'/?status={status}'))
+            for _ in range(10)
+        ])
+
+    @gen_test
+    async def test_one_trial_request(self):
+        res = await self.request_many(200)
+        self.assertEqual(SlowStatusHandler.calls, 1)
+        self.assertEqual(res.count('ok'), 1)
+        self.assertEqual(self.breaker.state, BREAKER_CLOSED)
+        self.assertEqual(self.breaker.get_stats()['rejected'], 9)
+
+    @gen_test
+    async def test_failed_trial_request(self):
+        await self.request_many(503)
+        self.assertEqual(SlowStatusHandler.calls, 1)
+        self.assertEqual(self.breaker.state, BREAKER_OPEN)
+
+    @gen_test
+    async def test_client_error_closes_breaker(self):
+        await self.request_many(404)
+        self.assertEqual(SlowStatusHandler.calls, 1)
+        self.assertEqual(self.breaker.state, BREAKER_CLOSED)
+
+    @gen_test
+    async def test_cancelled_trial_request(self):
+        trial = tornado.gen.convert_yielded(
+            self.app.http_fetch(self.get_url('/'))
+        )
+        await tornado.gen.sleep(0.01)
+        trial.cancel()
+        await tornado.gen.sleep(0.01)
+        self.assertFalse(self.breaker.half_open_in_flight)
+        res = await self.app.http_request_get(self.get_url('/'))
+        self.assertEqual(res, 'ok')
+        self.assertEqual(self.breaker.state, BREAKER_CLOSED)
+
+
+class TestHttpRetries(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = TorskelServer([(r"/", FlakyHandler)])
+        return self.app
+
+    def setUp(self):
+        super(TestHttpRetries, self).setUp()
+        FlakyHandler.calls = 0
+
+    @gen_test
+    async def test_retry(self):
+        res = await self.app.http_request_get(self.get_url('/?fail=2'),
+                                              max_retries=2)
+        self.assertEqual(res, 'ok')
+        self.assertEqual(FlakyHandler.calls, 3)
+
+    @gen_test
+    async def test_no_retry(self):
+        res = await self.app.http_request_get(self.get_url('/?fail=2'))
+        self.assertIsNone(res)
+        self.assertEqual(FlakyHandler.calls, 1)
+
+    @gen_test
+    async def test_circuit_breaker(self):
+        options.use_http_circuit_breaker = True
+        try:
+            for _ in range(options.http_breaker_failures + 2):
+                await self.app.http_request_get(self.get_url('/?fail=100'))
+        finally:
+            options.use_http_circuit_breaker = False
+        self.assertEqual(FlakyHandler.calls, options.http_breaker_failures)
+
+
+class SlowFirstHandler(TorskelHandler):
+    calls = 0
+
+    async def get(self):
+        SlowFirstHandler.calls += 1
+        if SlowFirstHandler.calls == 1:
+            await tornado.gen.sleep(0.5)
+        self.write(str(SlowFirstHandler.calls))
+
+
+class TestHttpHedging(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = TorskelServer([(r"/", SlowFirstHandler)])
+        return self.app
+
+    @gen_test
+    async def test_hedged_request(self):
+        host = f'127.0.0.1:{self.get_http_port()}'
+        for _ in range(self.app.http_latency.min_samples):
+            self.app.http_latency.add(host, 0.01)
+        res = await self.app.http_request_get(self.get_url('/'), hedge=True)
+        self.assertEqual(res, '2')
@@ -0,0 +1,93 @@
+import unittest
+
+import tornado.gen
+import tornado.iostream
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from torskel import TorskelServer, TorskelHandler
+from torskel.libs.stream_parsers import TorskelJsonLinesStreamParser
+from torskel.libs.xml_utils import TorskelXmlStreamParser
+
+ITEMS_COUNT = 1000
+
+
+class FeedHandler(TorskelHandler):
+    async def get(self):
+        self.write('<feed><items>')
+        for i in range(ITEMS_COUNT):
+            self.write(f'<item id="{i}"><name>item {i}</name></item>')
+            if i % 100 == 0:
+                await self.flush()
+        self.write('</items></feed>')
+
+
+class EndlessFeedHandler(TorskelHandler):
+    chunks = 0
+    closed = False
+
+    async def get(self):
+        try:
+            for i in range(ITEMS_COUNT):
+                self.write(f'{{"id": {i}}}\n')
+                await self.flush()
+                EndlessFeedHandler.chunks += 1
+                await tornado.gen.sleep(0.005)
+        except tornado.iostream.StreamClosedError:
+            EndlessFeedHandler.closed = True
+
+
+class TestStreamParsers(unittest.TestCase):
+    def test_xml_chunks(self):
+        parser = TorskelXmlStreamParser(item_depth=2)
+        doc = b'<r><i a="1">x</i><i><b>y</b></i></r>'
+        records = []
+        for i in range(0, len(doc), 3):
+            records.extend(parser.feed(doc[i:i + 3]))
+        records.extend(parser.close())
+        self.assertEqual(records, [{'@a': '1', '#text': 'x'}, {'b': 'y'}])
+
+    def test_json_lines(self):
+        parser = TorskelJsonLinesStreamParser()
+        records = parser.feed(b'{"a": 1}\n{"a"') + parser.feed(b': 2}')
+        records.extend(parser.close())
+        self.assertEqual(records, [{'a': 1}, {'a': 2}])
+
+
+class TestHttpStream(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = TorskelServer([(r"/", FeedHandler),
+                                  (r"/endless", EndlessFeedHandler)])
+        return self.app
+
+    @gen_test
+    async def test_stream_xml(self):
+        records = [record async for record in self.app.http_request_stream(
+            self.get_url('/'), 'xml', item_depth=3)]
+        self.assertEqual(len(records), ITEMS_COUNT)
+        self.assertEqual(records[-1], {'@id': str(ITEMS_COUNT - 1),
+                                       'name': f'item {ITEMS_COUNT - 1}'})
+
+    @gen_test
+    async def test_cancel_stream(self):
+        EndlessFeedHandler.chunks = 0
+        EndlessFeedHandler.closed = False
+        stream = self.app.http_request_stream(self.get_url('/endless'),
+                                              'jsonl')
+        async for record in stream:
+            if record['id'] == 5:
+                break
+        await stream.aclose()
+        await tornado.gen.sleep(0.2)
+        self.assertTrue(EndlessFeedHandler.closed)
+        self.assertLess(EndlessFeedHandler.chunks, ITEMS_COUNT)
+
+    @gen_test
+    async def test_not_consumed_records(self):
+        stream = self.app.http_request_stream(self.get_url('/'), 'xml',
+                                              item_depth=3, max_records=10)
+        records = []
+        with self.assertRaises(BufferError):
+            async for record in stream:
+                records.append(record)
+                await tornado.gen.sleep(0.001)
+        self.assertLess(len(records), ITEMS_COUNT)
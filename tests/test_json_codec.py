@@ -0,0 +1,46 @@
+import datetime
+import unittest
+
+from torskel.libs.json_codec import get_json_codec
+from torskel.str_utils import default_json_dt
+
+CODECS = ['json']
+try:
+    get_json_codec('orjson')
+    CODECS.append('orjson')
+except ImportError:
+    pass
+
+
+class TestJsonCodec(unittest.TestCase):
+    def test_round_trip(self):
+        obj = {'a': [1, 2.5, None, True], 'b': {'c': 'строка'}}
+        for name in CODECS:
+            codec = get_json_codec(name)
+            self.assertEqual(codec.loads(codec.dumps(obj)), obj)
+            self.assertEqual(codec.loads(codec.dumps_bytes(obj)), obj)
+
+    def test_datetime_uses_default(self):
+        obj = {'date': datetime.datetime(2020, 1, 2, 3, 4, 5)}
+        for name in CODECS:
+            codec = get_json_codec(name)
+            with self.assertRaises(TypeError):
+                codec.dumps(obj)
+            res = codec.loads(codec.dumps(obj, default=default_json_dt))
+            self.assertEqual(res, {'date': '2020-01-02T03:04:05'})
+
+    def test_object_hook(self):
+        def hook(obj):
+            return {key.upper(): value for key, value in obj.items()}
+
+        for name in CODECS:
+            codec = get_json_codec(name)
+            res = codec.loads(b'{"a": {"b": 1}}', object_hook=hook)
+            self.assertEqual(res, {'A': {'B': 1}})
+
+    def test_auto(self):
+        self.assertEqual(get_json_codec('auto').name, CODECS[-1])
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            get_json_codec('unknown')
@@ -0,0 +1,119 @@
+import signal
+import unittest
+from unittest import mock
+
+from torskel.libs.prefork import TorskelPreforkSupervisor
+
+
+def exit_status(code):
+    return code << 8
+
+
+@mock.patch('signal.signal')
+@mock.patch('os.kill')
+class TestPreforkSupervisor(unittest.TestCase):
+    def test_worker(self, kill, _signal):
+        supervisor = TorskelPreforkSupervisor(2)
+        with mock.patch('os.fork', side_effect=[101, 0]):
+            self.assertEqual(supervisor.start(), 1)
+        self.assertTrue(supervisor.is_worker)
+        self.assertEqual(supervisor.children, {})
+        kill.assert_not_called()
+
+    def test_worker_signals(self, _kill, signal_mock):
+        supervisor = TorskelPreforkSupervisor(1)
+        with mock.patch('os.fork', return_value=0):
+            supervisor.start()
+        self.assertIn(mock.call(signal.SIGUSR2, signal.SIG_IGN),
+                      signal_mock.call_args_list)
+        self.assertIn(mock.call(signal.SIGTERM, signal.SIG_DFL),
+                      signal_mock.call_args_list)
+
+    def test_respawn(self, _kill, _signal):
+        supervisor = TorskelPreforkSupervisor(2)
+        wait = [(101, exit_status(1)), (102, signal.SIGKILL),
+                ChildProcessError()]
+        with mock.patch('os.fork', side_effect=[101, 102, 103, 104]), \
+                mock.patch('os.wait', side_effect=wait):
+            with self.assertRaises(SystemExit) as ctx:
+                supervisor.start()
+        self.assertEqual(ctx.exception.code, 0)
+        self.assertEqual(supervisor.num_restarts, 2)
+        self.assertEqual(supervisor.children, {103: 0, 104: 1})
+
+    def test_respawned_worker(self, _kill, _signal):
+        supervisor = TorskelPreforkSupervisor(2)
+        with mock.patch('os.fork', side_effect=[101, 102, 0]), \
+                mock.patch('os.wait', return_value=(102, exit_status(1))):
+            self.assertEqual(supervisor.start(), 1)
+
+    def test_normal_exit_not_restarted(self, _kill, _signal):
+        supervisor = TorskelPreforkSupervisor(1)
+        with mock.patch('os.fork', side_effect=[101]) as fork, \
+                mock.patch('os.wait', return_value=(101, 0)):
+            with self.assertRaises(SystemExit):
+                supervisor.start()
+        self.assertEqual(fork.call_count, 1)
+
+    def test_restart_budget(self, kill, _signal):
+        supervisor = TorskelPreforkSupervisor(2, max_restarts=1)
+        wait = [(101, exit_status(1)), (103, exit_status(1))]
+        with mock.patch('os.fork', side_effect=[101, 102, 103]), \
+                mock.patch('os.wait', side_effect=wait), \
+                mock.patch('os.waitpid', return_value=(102, 0)) as waitpid:
+            with self.assertRaises(SystemExit) as ctx:
+                supervisor.start()
+        self.assertEqual(ctx.exception.code, 1)
+        kill.assert_called_once_with(102, signal.SIGTERM)
+        waitpid.assert_called_with(102, mock.ANY)
+        self.assertEqual(supervisor.children, {})
+
+    def test_restart_budget_kill(self, kill, _signal):
+        supervisor = TorskelPreforkSupervisor(1, max_restarts=0,
+                                              kill_timeout=0)
+        supervisor.children = {102: 1}
+        with mock.patch('os.waitpid', return_value=(0, 0)):
+            supervisor._terminate_workers()
+        self.assertEqual(kill.call_args_list,
+                         [mock.call(102, signal.SIGTERM),
+                          mock.call(102, signal.SIGKILL)])
+        self.assertEqual(supervisor.children, {})
+
+    def test_signal_forwarding(self, kill, _signal):
+        supervisor = TorskelPreforkSupervisor(2)
+        wait = [(101, signal.SIGTERM), (102, signal.SIGTERM)]
+
+        def stop(*_args):
+            supervisor._stop_workers(signal.SIGTERM, None)
+            return wait.pop(0)
+
+        with mock.patch('os.fork', side_effect=[101, 102]) as fork, \
+                mock.patch('os.wait', side_effect=stop):
+            with self.assertRaises(SystemExit):
+                supervisor.start()
+        self.assertTrue(supervisor.stopping)
+        self.assertIn(mock.call(101, signal.SIGTERM), kill.call_args_list)
+        self.assertIn(mock.call(102, signal.SIGTERM), kill.call_args_list)
+        self.assertEqual(fork.call_count, 2)
+
+    def test_handover(self, kill, _signal):
+        on_handover = mock.Mock()
+        supervisor = TorskelPreforkSupervisor(1, on_handover=on_handover)
+        supervisor.children = {101: 0}
+        supervisor._handover(signal.SIGUSR2, None)
+        on_handover.assert_called_once_with()
+        kill.assert_called_once_with(101, signal.SIGUSR2)
+        self.assertTrue(supervisor.stopping)
+
+    def test_handover_cancelled(self, kill, _signal):
+        supervisor = TorskelPreforkSupervisor(
+            1, on_handover=mock.Mock(return_value=False)
+        )
+        supervisor.children = {101: 0}
+        supervisor._handover(signal.SIGUSR2, None)
+        kill.assert_not_called()
+        self.assertFalse(supervisor.stopping)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+from tornado.testing import AsyncHTTPTestCase, AsyncTestCase, gen_test
+
+from torskel import TorskelServer, TorskelHandler
+from torskel.libs.rate_limit import TorskelRateLimiter
+from torskel.libs.rate_limit import rate_limit
+
+
+class CounterApp(TorskelServer):
+    """
+    Answers of redis script by fixed window counter
+    """
+    def __init__(self, *args, **kwargs):
+        super(CounterApp, self).__init__(*args, **kwargs)
+        self.counters = {}
+        self.scripts_calls = 0
+
+    async def eval_redis_script(self, script, keys, args):
+        self.scripts_calls += 1
+        limit, cost, pending = args[1], args[2], args[3]
+        used = self.counters.get(keys[0], 0) + pending
+        if used + cost > limit:
+            self.counters[keys[0]] = used
+            return [0, 0, 500]
+        self.counters[keys[0]] = used + cost
+        return [1, limit - used - cost, 0]
+
+
+class LimitedHandler(TorskelHandler):
+    @rate_limit(3, 1, algorithm='sliding_window', precheck_ratio=0)
+    async def get(self):
+        self.write('ok')
+
+
+class TestRateLimiter(AsyncTestCase):
+    @gen_test
+    async def test_local_precheck(self):
+        app = CounterApp([])
+        limiter = TorskelRateLimiter('test', 100, 60,
+                                     algorithm='sliding_window')
+        results = [await limiter.hit(app, 'key') for _ in range(100)]
+        self.assertTrue(all(allowed for allowed, _, _ in results))
+        self.assertLess(app.scripts_calls, 60)
+        self.assertEqual(limiter.local_allowed, 100 - app.scripts_calls)
+
+        allowed, _, retry_after = await limiter.hit(app, 'key')
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 0.5)
+        self.assertEqual(app.counters['torskel:ratelimit:test:key'], 100)
+        calls = app.scripts_calls
+        allowed, _, retry_after = await limiter.hit(app, 'key')
+        self.assertFalse(allowed)
+        self.assertEqual(app.scripts_calls, calls)
+        self.assertEqual(limiter.get_stats()['local_rejected'], 1)
+
+    @gen_test
+    async def test_local_precheck_shared_by_workers(self):
+        app = CounterApp([])
+        limiter = TorskelRateLimiter('test', 1000, 60, precheck_ratio=0.1,
+                                     workers=4)
+        await limiter.hit(app, 'key')
+        # 999 remaining, every of 4 workers allows 24 without redis
+        for _ in range(24):
+            await limiter.hit(app, 'key')
+        self.assertEqual((app.scripts_calls, limiter.local_allowed), (1, 24))
+        await limiter.hit(app, 'key')
+        self.assertEqual(app.scripts_calls, 2)
+
+    def test_scripts_replicate_effects(self):
+        for algorithm in ('token_bucket', 'sliding_window'):
+            limiter = TorskelRateLimiter('test', 1, 1, algorithm=algorithm)
+            script, _ = limiter._get_script_args(1, 0)
+            self.assertTrue(script.lstrip().startswith(
+                'redis.replicate_commands()'
+            ))
+
+    @gen_test
+    async def test_redis_errors(self):
+        app = TorskelServer([])
+
+        async def failed_eval(*args):
+            raise ConnectionRefusedError()
+        app.eval_redis_script = failed_eval
+        limiter = TorskelRateLimiter('test', 1, 60)
+        self.assertEqual(await limiter.hit(app, 'key'), (True, None, 0))
+        self.assertEqual(limiter.errors, 1)
+
+
+class TestRateLimitHandler(AsyncHTTPTestCase):
+    def get_app(self):
+        return CounterApp([(r"/", LimitedHandler)])
+
+    def test_too_many_requests(self):
+        codes = [self.fetch('/').code for _ in range(4)]
+        self.assertEqual(codes, [200, 200, 200, 429])
+        response = self.fetch('/', headers={'X-Real-IP': '10.0.0.1'})
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['X-RateLimit-Remaining'], '2')
+        response = self.fetch('/')
+        self.assertEqual(response.headers['Retry-After'], '1')
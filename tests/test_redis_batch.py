@@ -0,0 +1,87 @@
+from tornado.testing import AsyncTestCase, gen_test
+
+from torskel import TorskelServer
+from torskel.torskel_mixins.redis_mixin import RedisApplicationMixin
+from tests.fake_redis import FakeRedisPool
+
+
+class TestRedisBatch(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = TorskelServer([])
+        self.pool = FakeRedisPool()
+        self.app.redis_connection_pool = self.pool
+
+    def test_mixin_attributes(self):
+        self.assertLessEqual(set(vars(RedisApplicationMixin())),
+                             set(vars(self.app)))
+
+    @gen_test
+    async def test_get_vals_order_and_missing(self):
+        self.pool.data.update({'a': b'1', 'c': b'3'})
+        res = await self.app.get_redis_vals(['c', 'missing', 'a'])
+        self.assertEqual(res, ['3', None, '1'])
+        self.assertEqual(self.pool.commands, ['mget'])
+        self.assertEqual(await self.app.get_redis_vals([]), [])
+
+    @gen_test
+    async def test_set_vals_expiry(self):
+        await self.app.set_redis_vals({'a': 1, 'b': 'x', 'c': {'k': 2}},
+                                      exp={'a': 10, 'c': 30},
+                                      convert_to_json=True)
+        self.assertEqual(self.pool.expires, {'a': 10, 'c': 30})
+        res = await self.app.get_redis_vals(['a', 'b', 'c'], from_json=True)
+        self.assertEqual(res, [1, 'x', {'k': 2}])
+
+        await self.app.set_redis_vals({'a': 'y', 'b': 'z'}, exp=5)
+        self.assertEqual(self.pool.expires, {'a': 5, 'b': 5, 'c': 30})
+
+    @gen_test
+    async def test_del_vals(self):
+        self.pool.data.update({'a': b'1', 'b': b'2'})
+        self.assertEqual(await self.app.del_redis_vals(['a', 'b', 'c']), 2)
+        self.assertEqual(self.pool.data, {})
+        self.assertEqual(await self.app.del_redis_vals([]), 0)
+
+    @gen_test
+    async def test_pipeline(self):
+        async with self.app.redis_pipeline() as pipe:
+            pipe.set_val('a', {'k': 1}, 10, convert_to_json=True)
+            pipe.get_val('a', from_json=True)
+            pipe.get_val('missing')
+            pipe.expire('a', 20)
+            pipe.del_val('a', 'missing')
+        self.assertEqual(pipe.results, [b'OK', {'k': 1}, None, 1, 1])
+        self.assertEqual(self.pool.expires, {'a': 20})
+
+    @gen_test
+    async def test_transaction(self):
+        self.pool.data['a'] = b'1'
+        results = [b'OK', b'1']
+
+        async def execute(command, *args):
+            self.pool.commands.append(command)
+            return results if command == 'exec' else b'QUEUED'
+
+        self.pool.execute = execute
+        async with self.app.redis_pipeline(transaction=True) as pipe:
+            pipe.set_val('b', '2')
+            pipe.get_val('a')
+        self.assertEqual(self.pool.commands, ['multi', 'set', 'get', 'exec'])
+        self.assertEqual(pipe.results, [b'OK', '1'])
+
+    @gen_test
+    async def test_pipeline_error(self):
+        with self.assertRaises(ValueError):
+            async with self.app.redis_pipeline() as pipe:
+                pipe.set_val('a', '1')
+                pipe.execute_command('unknown', 'a')
+        self.assertIsNone(pipe.results)
+
+    @gen_test
+    async def test_pipeline_not_sent_on_exception(self):
+        with self.assertRaises(RuntimeError):
+            async with self.app.redis_pipeline() as pipe:
+                pipe.set_val('a', '1')
+                raise RuntimeError()
+        self.assertEqual(self.pool.commands, [])
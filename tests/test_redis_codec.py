@@ -0,0 +1,62 @@
+import importlib.util
+import unittest
+
+from torskel.libs.redis_codec import TorskelRedisValueCodec
+from torskel.libs.redis_codec import is_encoded
+from torskel.torskel_mixins.redis_mixin import RedisApplicationMixin
+
+VALUE = {'id': 1, 'name': 'name', 'items': list(range(300))}
+
+
+class TestRedisValueCodec(unittest.TestCase):
+    def test_legacy(self):
+        codec = TorskelRedisValueCodec()
+        data = codec.encode(VALUE)
+        self.assertFalse(is_encoded(data))
+        self.assertEqual(data[:1], b'{')
+        self.assertEqual(codec.decode(data), VALUE)
+
+    def test_compression_threshold(self):
+        codec = TorskelRedisValueCodec('json', 'zlib', threshold=100)
+        small = codec.encode({'id': 1})
+        self.assertEqual(small, b'\x10{"id": 1}')
+        data = codec.encode(VALUE)
+        self.assertEqual(data[0], 0x11)
+        self.assertLess(len(data), len(TorskelRedisValueCodec().encode(VALUE)))
+        self.assertEqual(codec.decode(data), VALUE)
+        self.assertEqual(codec.decode(small), {'id': 1})
+
+    def test_mixed_formats(self):
+        codec = TorskelRedisValueCodec('json', 'zlib', threshold=0)
+        self.assertEqual(codec.decode(b'{"id": 1}'), {'id': 1})
+        legacy = TorskelRedisValueCodec()
+        self.assertEqual(legacy.decode(codec.encode(VALUE)), VALUE)
+
+    def test_object_hook(self):
+        codec = TorskelRedisValueCodec('json', 'zlib', threshold=0)
+        res = codec.decode(codec.encode({'a': {'b': 1}}),
+                           object_hook=lambda obj: dict(obj, hooked=True))
+        self.assertEqual(res, {'a': {'b': 1, 'hooked': True}, 'hooked': True})
+
+    def test_raw_value(self):
+        mixin = RedisApplicationMixin()
+        self.assertEqual(mixin._decode_redis_val(b'\x11raw'), '\x11raw')
+        self.assertEqual(mixin._decode_redis_val(b'\x11raw', from_json=False),
+                         '\x11raw')
+        codec = TorskelRedisValueCodec('json', 'zlib', threshold=0)
+        mixin = RedisApplicationMixin(value_codec=codec)
+        self.assertEqual(mixin._decode_redis_val(codec.encode(VALUE)), VALUE)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            TorskelRedisValueCodec('xml')
+        with self.assertRaises(ValueError):
+            TorskelRedisValueCodec('json', 'bz2')
+
+    @unittest.skipUnless(importlib.util.find_spec('msgpack'),
+                         'msgpack is not installed')
+    def test_msgpack(self):
+        codec = TorskelRedisValueCodec('msgpack', 'zlib', threshold=100)
+        data = codec.encode(VALUE)
+        self.assertEqual(data[0], 0x15)
+        self.assertEqual(TorskelRedisValueCodec().decode(data), VALUE)
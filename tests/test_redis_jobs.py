@@ -0,0 +1,86 @@
+from tornado.testing import AsyncTestCase, gen_test
+
+from torskel.libs.redis_jobs import TorskelJobQueue, TorskelJobWorker
+from torskel.libs.redis_shards import TorskelHashRing, get_command_keys
+
+
+class RecordingPipeline:
+    def __init__(self, commands):
+        self.commands = commands
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def execute_command(self, command, *args):
+        self.commands.append((command, ) + args)
+
+
+class RecordingApp:
+    def __init__(self):
+        self.commands = []
+
+    def redis_pipeline(self, transaction=False):
+        return RecordingPipeline(self.commands)
+
+
+class TestJobQueue(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.queue = TorskelJobQueue('mail', job_timeout=1, retry_delay=2,
+                                     max_attempts=2)
+        self.calls = []
+
+        @self.queue.job('send')
+        async def send(app, payload):
+            self.calls.append(payload)
+            if payload.get('fail'):
+                raise RuntimeError('failed')
+
+        self.app = RecordingApp()
+        self.worker = TorskelJobWorker(self.app, self.queue, consumer='c1')
+
+    def test_keys(self):
+        ring = TorskelHashRing(['a', 'b', 'c'])
+        self.assertEqual(ring.get_node(self.queue.key),
+                         ring.get_node(self.queue.dead_key))
+        self.assertEqual(get_command_keys(
+            'xgroup', ('CREATE', self.queue.key, 'g', '0')
+        ), [self.queue.key])
+        with self.assertRaises(ValueError):
+            TorskelJobQueue('mail', job_timeout=10, retry_delay=5)
+
+    @gen_test
+    async def test_ack(self):
+        await self.worker._run_job(b'1-0', [b'job', b'send',
+                                            b'payload', b'{"to": 1}'], 1)
+        self.assertEqual(self.calls, [{'to': 1}])
+        self.assertEqual(self.app.commands, [
+            ('xack', self.queue.key, 'torskel', b'1-0'),
+            ('xdel', self.queue.key, b'1-0'),
+        ])
+        self.assertEqual(self.worker.processed, 1)
+
+    @gen_test
+    async def test_retry_and_dead_letter(self):
+        fields = [b'job', b'send', b'payload', b'{"fail": true}']
+        await self.worker._run_job(b'1-0', fields, 1)
+        self.assertEqual(self.app.commands, [])
+        await self.worker._run_job(b'1-0', fields, 2)
+        self.assertEqual(self.app.commands[0][:2],
+                         ('xadd', self.queue.dead_key))
+        self.assertIn("RuntimeError('failed')", self.app.commands[0])
+        self.assertEqual(self.app.commands[1:], [
+            ('xack', self.queue.key, 'torskel', b'1-0'),
+            ('xdel', self.queue.key, b'1-0'),
+        ])
+        self.assertEqual(self.worker.get_stats()['dead'], 1)
+        self.assertEqual(self.worker.failed, 2)
+
+    @gen_test
+    async def test_unknown_job(self):
+        await self.worker._run_job(b'1-0', [b'job', b'unknown',
+                                            b'payload', b'null'], 1)
+        self.assertEqual(self.worker.dead, 1)
@@ -0,0 +1,137 @@
+import time
+import asyncio
+import unittest
+from unittest import mock
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from torskel import TorskelServer
+from torskel.libs.json_codec import json_dumps_bytes
+from torskel.libs.redis_lock import TorskelRedisLock
+from torskel.libs.redis_lock import is_early_expired
+from torskel.libs.redis_shards import get_related_key
+from tests.fake_redis import FakeRedisPool
+
+
+class TestEarlyExpiration(unittest.TestCase):
+    def test_expired(self):
+        self.assertTrue(is_early_expired(0.1, time.time() - 1))
+
+    def test_far_from_expiration(self):
+        with mock.patch('random.random', return_value=0.5):
+            self.assertFalse(is_early_expired(0.1, time.time() + 60))
+
+    def test_probability_grows_with_delta(self):
+        expires_at = time.time() + 1
+        with mock.patch('random.random', return_value=0.5):
+            self.assertFalse(is_early_expired(0.1, expires_at))
+            self.assertTrue(is_early_expired(2, expires_at))
+            self.assertTrue(is_early_expired(0.1, expires_at, beta=20))
+
+
+class TestRedisLock(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = TorskelServer([])
+        self.pool = self.app.redis_connection_pool = FakeRedisPool()
+
+    @gen_test
+    async def test_acquire(self):
+        lock = TorskelRedisLock(self.app, 'lock', 1000)
+        self.assertEqual(await lock.acquire(), 1)
+        self.assertEqual(self.pool.expires['lock'], 1)
+        self.assertIsNone(await TorskelRedisLock(self.app, 'lock').acquire())
+        # script is sent once, then it is called by sha
+        self.assertEqual(self.pool.commands, ['evalsha', 'eval', 'evalsha'])
+
+    @gen_test
+    async def test_set_if_owner(self):
+        lock = TorskelRedisLock(self.app, 'lock')
+        await lock.acquire()
+        self.assertTrue(await lock.set_val('key', b'val', 60000))
+        self.assertEqual(self.pool.data['key'], b'val')
+        self.assertEqual(self.pool.expires['key'], 60)
+        self.assertNotIn('lock', self.pool.data)
+
+    @gen_test
+    async def test_lost_lock(self):
+        lock = TorskelRedisLock(self.app, 'lock')
+        self.assertEqual(await lock.acquire(), 1)
+        # lock expired and was taken by other owner with newer token
+        del self.pool.data['lock']
+        other = TorskelRedisLock(self.app, 'lock')
+        self.assertEqual(await other.acquire(), 2)
+        self.assertFalse(await lock.set_val('key', b'old', 60000))
+        self.assertNotIn('key', self.pool.data)
+        self.assertFalse(await lock.release())
+        self.assertEqual(self.pool.data['lock'], b'2')
+        self.assertTrue(await other.release())
+        self.assertNotIn('lock', self.pool.data)
+        self.assertFalse(await other.release())
+
+
+class TestGetOrCompute(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = TorskelServer([])
+        self.pool = self.app.redis_connection_pool = FakeRedisPool()
+        self.calls = 0
+
+    async def compute(self):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return {'calls': self.calls}
+
+    @gen_test
+    async def test_single_flight(self):
+        results = await asyncio.gather(*[
+            self.app.get_or_compute_redis_val('key', self.compute, 60)
+            for _ in range(5)
+        ])
+        self.assertEqual(results, [{'calls': 1}] * 5)
+        self.assertEqual(self.calls, 1)
+        res = await self.app.get_or_compute_redis_val('key', self.compute, 60)
+        self.assertEqual(res, {'calls': 1})
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.pool.expires['key'], 60)
+
+    @gen_test
+    async def test_early_refresh(self):
+        await self.app.get_or_compute_redis_val('key', self.compute, 60)
+        with mock.patch('torskel.torskel_mixins.redis_mixin.'
+                        'is_early_expired', return_value=True):
+            res = await self.app.get_or_compute_redis_val('key', self.compute,
+                                                          60)
+        self.assertEqual(res, {'calls': 2})
+        res = await self.app.get_or_compute_redis_val('key', self.compute, 60)
+        self.assertEqual(res, {'calls': 2})
+
+    @gen_test
+    async def test_stale_while_other_computes(self):
+        await self.app.get_or_compute_redis_val('key', self.compute, 60)
+        # other process holds lock of key
+        await TorskelRedisLock(self.app, get_related_key('key', 'lock'),
+                               5000).acquire()
+        with mock.patch('torskel.torskel_mixins.redis_mixin.'
+                        'is_early_expired', return_value=True):
+            res = await self.app.get_or_compute_redis_val('key', self.compute,
+                                                          60)
+        self.assertEqual(res, {'calls': 1})
+        self.assertEqual(self.calls, 1)
+
+    @gen_test
+    async def test_waits_for_other(self):
+        lock = TorskelRedisLock(self.app, get_related_key('key', 'lock'),
+                                5000)
+        await lock.acquire()
+
+        async def compute_in_other_process():
+            await asyncio.sleep(0.05)
+            await lock.set_val('key', json_dumps_bytes(
+                [{'calls': 0}, 0.05, time.time() + 60]
+            ), 60000)
+
+        asyncio.ensure_future(compute_in_other_process())
+        res = await self.app.get_or_compute_redis_val('key', self.compute, 60)
+        self.assertEqual(res, {'calls': 0})
+        self.assertEqual(self.calls, 0)
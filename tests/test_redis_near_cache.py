@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import aioredis
+from tornado.options import options
+from tornado.testing import AsyncTestCase, gen_test
+
+from torskel import TorskelServer
+from torskel.libs.json_codec import json_loads
+from torskel.libs.redis_near_cache import TorskelRedisNearCache
+from tests.fake_redis import FakeRedisPool
+
+
+class TestRedisNearCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = TorskelRedisNearCache(max_items=10, ttl=60)
+        self.cache.set_online(True)
+
+    def test_get_store(self):
+        self.assertIsNone(self.cache.get('key', (True, False)))
+        self.cache.store('key', (True, False), {'a': 1},
+                         self.cache.generation)
+        self.assertEqual(self.cache.get(b'key', (True, False)), {'a': 1})
+        self.assertIsNone(self.cache.get('key', (False, False)))
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+
+    def test_invalidate(self):
+        self.cache.store('key', (False, False), 'val', self.cache.generation)
+        self.cache.invalidate([b'key'])
+        self.assertIsNone(self.cache.get('key', (False, False)))
+        self.assertEqual(self.cache.get_stats()['invalidations'], 1)
+
+    def test_stale_store_is_skipped(self):
+        generation = self.cache.generation
+        self.cache.invalidate(['other'])
+        self.cache.store('key', (False, False), 'old', generation)
+        self.assertIsNone(self.cache.get('key', (False, False)))
+
+    def test_offline(self):
+        self.cache.store('key', (False, False), 'val', self.cache.generation)
+        self.cache.set_online(False)
+        self.assertIsNone(self.cache.get('key', (False, False)))
+        self.cache.store('key', (False, False), 'val', self.cache.generation)
+        self.assertEqual(len(self.cache.cache), 0)
+
+
+class TestNearCacheInvalidation(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = FakeRedisPool()
+        self.reader = self.get_app()
+        self.writer = self.get_app()
+
+    def get_app(self):
+        app = TorskelServer([])
+        app.redis_connection_pool = self.pool
+        app.redis_near_cache = TorskelRedisNearCache(ttl=60)
+        return app
+
+    async def start_listener(self, app):
+        with mock.patch.object(aioredis, 'create_connection',
+                               self.pool.create_connection):
+            app.start_redis_invalidation_listener()
+            while not app.redis_near_cache.is_online:
+                await asyncio.sleep(0.01)
+
+    @gen_test
+    async def test_write_publishes_invalidation(self):
+        self.writer.redis_near_cache.set_online(True)
+        self.pool.data['key'] = b'old'
+        self.assertEqual(await self.writer.get_redis_val('key'), 'old')
+        await self.writer.set_redis_exp_val('key', 'new', 10)
+        self.assertEqual(self.pool.commands[-2:], ['set', 'publish'])
+        channel, message = self.pool.published[-1]
+        self.assertEqual(channel, options.redis_invalidation_channel)
+        self.assertEqual(json_loads(message), ['key'])
+        self.assertEqual(await self.writer.get_redis_val('key'), 'new')
+
+        await self.writer.del_redis_vals(['key', 'other'])
+        self.assertEqual(json_loads(self.pool.published[-1][1]),
+                         ['key', 'other'])
+
+    @gen_test
+    async def test_listener_evicts_keys(self):
+        await self.start_listener(self.reader)
+        self.pool.data['key'] = b'old'
+        self.assertEqual(await self.reader.get_redis_val('key'), 'old')
+        self.assertEqual(await self.reader.get_redis_val('key'), 'old')
+        self.assertEqual(self.pool.reads, ['key'])
+
+        await self.writer.set_redis_exp_val('key', 'new', 10)
+        await asyncio.sleep(0.01)
+        self.assertEqual(
+            self.reader.get_redis_near_cache_stats()['invalidations'], 1
+        )
+        self.assertEqual(await self.reader.get_redis_val('key'), 'new')
+
+        await self.reader.close_redis_pool()
+        self.assertFalse(self.reader.redis_near_cache.is_online)
+        self.assertEqual(self.pool.subscribers[
+            options.redis_invalidation_channel.encode()
+        ], [])
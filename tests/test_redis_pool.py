@@ -0,0 +1,39 @@
+from tornado.options import options
+from tornado.testing import AsyncTestCase, gen_test
+
+from torskel import TorskelServer
+from torskel.libs.redis_pool import TorskelRedisHealth
+
+
+class TestRedisHealth(AsyncTestCase):
+    def setUp(self):
+        super(TestRedisHealth, self).setUp()
+        self.saved_options = (options.use_redis_socket, options.redis_port)
+        options.use_redis_socket = False
+        # nothing listens on port 1
+        options.redis_port = 1
+
+    def tearDown(self):
+        options.use_redis_socket, options.redis_port = self.saved_options
+        super(TestRedisHealth, self).tearDown()
+
+    def test_health_state(self):
+        health = TorskelRedisHealth()
+        health.record_failure(ConnectionRefusedError())
+        self.assertFalse(health.is_healthy)
+        health.record_success(0.001)
+        stats = health.get_stats()
+        self.assertTrue(stats['healthy'])
+        self.assertEqual((stats['checks'], stats['failures']), (2, 1))
+
+    @gen_test
+    async def test_unavailable_redis(self):
+        app = TorskelServer([])
+        with self.assertRaises(OSError):
+            await app.get_redis_val('key')
+        self.assertFalse(await app.check_redis_health())
+        stats = app.get_redis_pool_stats()
+        self.assertFalse(stats['healthy'])
+        self.assertEqual(stats['failures'], 2)
+        self.assertEqual(stats['pools'], {})
+        self.assertIsNone(app.redis_pool_future)
@@ -0,0 +1,61 @@
+import unittest
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from torskel.libs.redis_shards import TorskelHashRing
+from torskel.libs.redis_shards import TorskelShardedRedisPool
+from torskel.libs.redis_shards import get_command_keys
+from torskel.libs.redis_shards import get_hash_tag
+from torskel.libs.redis_shards import get_related_key
+from torskel.libs.redis_shards import parse_redis_node
+from tests.fake_redis import FakeRedisPool
+
+
+class TestHashRing(unittest.TestCase):
+    def test_moved_keys(self):
+        keys = [f'key{i}' for i in range(10000)]
+        ring = TorskelHashRing(['a', 'b', 'c', 'd'])
+        before = {key: ring.get_node(key) for key in keys}
+        self.assertEqual(set(before.values()), {'a', 'b', 'c', 'd'})
+        ring = TorskelHashRing(['a', 'b', 'c', 'd', 'e'])
+        moved = [key for key in keys if ring.get_node(key) != before[key]]
+        self.assertLess(len(moved), len(keys) * 0.3)
+        self.assertTrue(all(ring.get_node(key) == 'e' for key in moved))
+
+    def test_hash_tags(self):
+        self.assertEqual(get_hash_tag('{user:1}:name'), b'user:1')
+        self.assertEqual(get_hash_tag('a{}b'), b'a{}b')
+        self.assertEqual(get_related_key('key', 'lock'), '{key}:lock')
+        self.assertEqual(get_related_key('{user:1}:name', 'lock'),
+                         '{user:1}:name:lock')
+        ring = TorskelHashRing(['a', 'b', 'c'])
+        self.assertEqual(ring.get_node('key'), ring.get_node('{key}:lock'))
+
+    def test_command_keys(self):
+        self.assertEqual(get_command_keys('mget', ('a', 'b')), ['a', 'b'])
+        self.assertEqual(get_command_keys('set', ('a', 1, 'EX', 5)), ['a'])
+        self.assertEqual(get_command_keys('evalsha', ('sha', 2, 'a', 'b', 1)),
+                         ['a', 'b'])
+        self.assertEqual(get_command_keys('publish', ('ch', 'msg')), [])
+
+    def test_parse_node(self):
+        self.assertEqual(parse_redis_node('127.0.0.1:6379'),
+                         ('127.0.0.1', 6379))
+        self.assertEqual(parse_redis_node('/tmp/redis.sock'),
+                         '/tmp/redis.sock')
+
+
+class TestShardedPool(AsyncTestCase):
+    @gen_test
+    async def test_split_commands(self):
+        pools = {'a': FakeRedisPool(), 'b': FakeRedisPool()}
+        pool = TorskelShardedRedisPool(pools)
+        keys = [f'key{i}' for i in range(20)]
+        for key in keys:
+            await pool.execute('set', key, key.upper())
+        self.assertTrue(pools['a'].data and pools['b'].data)
+        self.assertEqual(await pool.execute('mget', *keys),
+                         [key.upper().encode() for key in keys])
+        self.assertEqual(await pool.execute('del', *keys, 'none'), 20)
+        with self.assertRaises(ValueError):
+            await pool.execute('eval', 'script', 2, *keys[:20:19])
@@ -0,0 +1,217 @@
+import time
+from unittest import mock
+
+import tornado.gen
+import tornado.ioloop
+from tornado.httpclient import AsyncHTTPClient
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from torskel import TorskelServer, TorskelHandler
+from torskel.libs.redis_lock import TorskelRedisLock
+from torskel.libs.response_cache import TorskelCachedResponse
+from torskel.libs.response_cache import cache_response
+from tests.fake_redis import FakeRedisPool
+
+
+class CachedHandler(TorskelHandler):
+    calls = 0
+
+    @cache_response(60, query_args=['id'], headers=['X-Custom'])
+    async def get(self):
+        CachedHandler.calls += 1
+        await tornado.gen.sleep(float(self.get_argument('delay', 0)))
+        self.set_header('X-Custom', 'custom')
+        if self.get_argument('fail', None):
+            self.set_status(500)
+        self.write({'id': self.get_argument('id', None),
+                    'calls': CachedHandler.calls})
+
+
+class StaleHandler(TorskelHandler):
+    calls = 0
+
+    @cache_response(0.1, stale_ttl=60)
+    async def get(self):
+        StaleHandler.calls += 1
+        await tornado.gen.sleep(0.2)
+        self.finish(str(StaleHandler.calls))
+
+
+class RedisCachedHandler(TorskelHandler):
+    calls = 0
+
+    @cache_response(60, storage='redis', lock_timeout=1)
+    async def get(self):
+        RedisCachedHandler.calls += 1
+        self.finish('computed')
+
+
+class ChunkedHandler(TorskelHandler):
+    calls = 0
+
+    @cache_response(60)
+    async def get(self):
+        ChunkedHandler.calls += 1
+        self.write('first ')
+        self.write(b'second ')
+        if self.get_argument('flush', None):
+            await self.flush()
+        self.finish('last')
+
+
+class TestResponseCache(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = TorskelServer([(r"/", CachedHandler),
+                                  (r"/stale", StaleHandler),
+                                  (r"/redis", RedisCachedHandler),
+                                  (r"/chunked", ChunkedHandler)])
+        return self.app
+
+    def setUp(self):
+        super(TestResponseCache, self).setUp()
+        CachedHandler.calls = 0
+        StaleHandler.calls = 0
+        RedisCachedHandler.calls = 0
+        ChunkedHandler.calls = 0
+
+    def test_hit(self):
+        first = self.fetch('/?id=1&other=1')
+        second = self.fetch('/?id=1&other=2')
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.headers['X-Custom'], 'custom')
+        self.assertEqual(second.headers['Content-Type'],
+                         first.headers['Content-Type'])
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(CachedHandler.calls, 1)
+        self.assertEqual(self.fetch('/?id=2').headers['X-Cache'], 'MISS')
+        self.assertEqual(CachedHandler.calls, 2)
+
+    def test_chunks(self):
+        first = self.fetch('/chunked')
+        second = self.fetch('/chunked')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(first.body, b'first second last')
+        self.assertEqual(second.body, first.body)
+        self.assertEqual(ChunkedHandler.calls, 1)
+
+    def test_flushed_response_is_not_cached(self):
+        first = self.fetch('/chunked?flush=1')
+        second = self.fetch('/chunked?flush=1')
+        self.assertEqual(first.body, b'first second last')
+        self.assertEqual(second.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.body, first.body)
+        self.assertEqual(ChunkedHandler.calls, 2)
+
+    def test_error_is_not_cached(self):
+        self.fetch('/?id=3&fail=1')
+        self.assertEqual(self.fetch('/?id=3&fail=1').headers['X-Cache'],
+                         'MISS')
+        self.assertEqual(CachedHandler.calls, 2)
+
+    @gen_test
+    async def test_one_request_computes(self):
+        client = AsyncHTTPClient()
+        responses = await tornado.gen.multi([
+            client.fetch(self.get_url('/?id=4&delay=0.1')) for _ in range(5)
+        ])
+        self.assertEqual(CachedHandler.calls, 1)
+        self.assertEqual(len({res.body for res in responses}), 1)
+        self.assertEqual(self.app.get_response_cache_stats()['waits'], 4)
+
+    @gen_test
+    async def test_stale_while_revalidate(self):
+        client = AsyncHTTPClient()
+        await client.fetch(self.get_url('/stale'))
+        await tornado.gen.sleep(0.15)
+        responses = await tornado.gen.multi([
+            client.fetch(self.get_url('/stale')) for _ in range(3)
+        ])
+        self.assertEqual(sorted(res.headers['X-Cache'] for res in responses),
+                         ['MISS', 'STALE', 'STALE'])
+        self.assertEqual(sorted(res.body for res in responses),
+                         [b'1', b'1', b'2'])
+        self.assertEqual(StaleHandler.calls, 2)
+
+    @gen_test
+    async def test_concurrent_not_cached_responses(self):
+        client = AsyncHTTPClient()
+        responses = await tornado.gen.multi([
+            client.fetch(self.get_url('/?id=5&delay=0.05&fail=1'),
+                         raise_error=False)
+            for _ in range(4)
+        ])
+        self.assertEqual([res.code for res in responses], [500] * 4)
+        self.assertEqual([res.headers['X-Cache'] for res in responses],
+                         ['MISS'] * 4)
+        self.assertEqual(CachedHandler.calls, 4)
+        self.assertEqual(self.app.get_response_cache_stats()['computing'], 0)
+        res = await client.fetch(self.get_url('/?id=5'))
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+
+    @gen_test
+    async def test_redis_lock(self):
+        pool = self.app.redis_connection_pool = FakeRedisPool()
+        with mock.patch.object(TorskelRedisLock, 'acquire',
+                               return_value=1) as acquire, \
+                mock.patch.object(TorskelRedisLock, 'release') as release:
+            res = await AsyncHTTPClient().fetch(self.get_url('/redis'))
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        acquire.assert_called_once_with()
+        release.assert_called_once_with()
+        self.assertEqual(len(pool.data), 1)
+
+    @gen_test
+    async def test_redis_lock_taken(self):
+        pool = self.app.redis_connection_pool = FakeRedisPool()
+
+        async def compute_in_other_worker():
+            await tornado.gen.sleep(0.1)
+            now = time.time()
+            entry = TorskelCachedResponse(200, [], b'other', now + 60,
+                                          now + 60)
+            for key in pool.reads:
+                pool.data[key] = entry.to_bytes()
+
+        with mock.patch.object(TorskelRedisLock, 'acquire',
+                               return_value=None):
+            tornado.ioloop.IOLoop.current().spawn_callback(
+                compute_in_other_worker
+            )
+            res = await AsyncHTTPClient().fetch(self.get_url('/redis'))
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        self.assertEqual(res.body, b'other')
+        self.assertEqual(RedisCachedHandler.calls, 0)
+
+    @gen_test
+    async def test_redis_lock_taken_with_stale(self):
+        pool = self.app.redis_connection_pool = FakeRedisPool()
+        client = AsyncHTTPClient()
+        with mock.patch.object(TorskelRedisLock, 'acquire', return_value=1), \
+                mock.patch.object(TorskelRedisLock, 'release'):
+            await client.fetch(self.get_url('/redis'))
+        key, = pool.data
+        now = time.time()
+        pool.data[key] = TorskelCachedResponse(200, [], b'stale', now - 1,
+                                               now + 60).to_bytes()
+
+        async def acquire_in_other_worker():
+            await tornado.gen.sleep(0.1)
+
+        async def fetch_without_stale():
+            await tornado.gen.sleep(0.02)
+            # stale response expired, request waits for the first one
+            del pool.data[key]
+            return await client.fetch(self.get_url('/redis'))
+
+        with mock.patch.object(TorskelRedisLock, 'acquire',
+                               side_effect=acquire_in_other_worker):
+            responses = await tornado.gen.multi([
+                client.fetch(self.get_url('/redis')), fetch_without_stale()
+            ])
+        self.assertEqual([res.headers['X-Cache'] for res in responses],
+                         ['STALE', 'STALE'])
+        self.assertEqual([res.body for res in responses], [b'stale'] * 2)
+        stats = self.app.get_response_cache_stats()
+        self.assertEqual((stats['hits'], stats['stale_hits']), (0, 2))
+        self.assertEqual(RedisCachedHandler.calls, 1)
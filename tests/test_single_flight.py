@@ -0,0 +1,46 @@
+import tornado.gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from torskel.libs.single_flight import TorskelSingleFlight
+from torskel.libs.single_flight import get_request_key
+
+
+class TestSingleFlight(AsyncTestCase):
+    def setUp(self):
+        super(TestSingleFlight, self).setUp()
+        self.single_flight = TorskelSingleFlight()
+        self.calls = 0
+
+    async def fetch(self, value):
+        self.calls += 1
+        await tornado.gen.sleep(0.05)
+        return value
+
+    @gen_test
+    async def test_coalescing(self):
+        res = await tornado.gen.multi([
+            self.single_flight.do('key', self.fetch, 1) for _ in range(5)
+        ])
+        self.assertEqual(res, [1] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.single_flight.get_stats()['shared'], 4)
+        self.assertEqual(self.single_flight.in_flight, {})
+
+    @gen_test
+    async def test_different_keys(self):
+        res = await tornado.gen.multi([
+            self.single_flight.do(i, self.fetch, i) for i in range(3)
+        ])
+        self.assertEqual(res, [0, 1, 2])
+        self.assertEqual(self.calls, 3)
+
+    def test_request_key(self):
+        key_headers = ['Authorization']
+        self.assertEqual(
+            get_request_key('get', '/a', {'authorization': 'x'}, key_headers),
+            get_request_key('GET', '/a', {'Authorization': 'x'}, key_headers)
+        )
+        self.assertNotEqual(
+            get_request_key('GET', '/a', {'Authorization': 'x'}, key_headers),
+            get_request_key('GET', '/a', {'Authorization': 'y'}, key_headers)
+        )
@@ -0,0 +1,43 @@
+import json
+import unittest
+
+import xmltodict
+
+from torskel.libs.xml_utils import xml_to_dict
+from torskel.str_utils import xml_str_to_dict
+
+SOAP_XML = '<?xml version="1.0"?>' \
+           '<soap:Envelope xmlns:soap="urn:soap" xmlns:m="urn:m">' \
+           '<soap:Body><m:Result code="0">' \
+           '<m:item>1</m:item><m:item>2.5</m:item>' \
+           '<m:ok>true</m:ok><m:empty/><m:text> a b </m:text>' \
+           '</m:Result></soap:Body></soap:Envelope>'
+
+
+class TestXmlToDict(unittest.TestCase):
+    def test_same_as_xmltodict(self):
+        expected = json.loads(json.dumps(xmltodict.parse(SOAP_XML)))
+        self.assertEqual(xml_to_dict(SOAP_XML), expected)
+        self.assertEqual(xml_to_dict(SOAP_XML.encode('utf-8')), expected)
+        self.assertEqual(xml_str_to_dict(SOAP_XML), expected)
+
+    def test_strip_namespaces(self):
+        res = xml_to_dict(SOAP_XML, strip_namespaces=True)
+        self.assertEqual(list(res), ['Envelope'])
+        self.assertEqual(res['Envelope']['Body']['Result']['@code'], '0')
+
+    def test_coerce_types(self):
+        res = xml_to_dict(SOAP_XML, strip_namespaces=True, coerce_types=True,
+                          xml_attribs=False)
+        self.assertEqual(res['Envelope']['Body']['Result'], {
+            'item': [1, 2.5], 'ok': True, 'empty': None, 'text': 'a b'
+        })
+
+    def test_coerce_only_plain_numbers(self):
+        values = ['007', 'nan', 'inf', '1_000', '+5', '1.', '0x10', '-0',
+                  '-12', '3.25', '1e3', '-2.5E-2']
+        doc = '<r>' + ''.join(f'<v>{value}</v>' for value in values) + '</r>'
+        res = xml_to_dict(doc, coerce_types=True)
+        self.assertEqual(res['r']['v'], ['007', 'nan', 'inf', '1_000', '+5',
+                                         '1.', '0x10', 0, -12, 3.25, 1000.0,
+                                         -0.025])
@@ -10,6 +10,8 @@ from torskel.libs.str_consts import INIT_MONGO_LABEL
 # pylint: disable=C0103
 logger = tornado.log.gen_log
 
+DUPLICATE_KEY_CODE = 11000
+
 
 # pylint: disable=W1203
 def get_mongo_pool(**kwargs):
@@ -67,12 +69,28 @@ def get_mongo_pool(**kwargs):
     return res
 
 
-async def bulk_mongo_insert(db, collection_name, bulk_list):
+async def bulk_mongo_insert(db, collection_name, bulk_list, **kwargs):
     """
     Bulk insert into collection
     :param db: database name
     :param collection_name:  collection name
     :param bulk_list: list of documents
+    param ordered: stop on the first error, default True
     :return:
     """
-    await db[collection_name].insert_many(bulk_list)
+    await db[collection_name].insert_many(bulk_list, **kwargs)
+
+
+def is_duplicate_key_error(exc) -> bool:
+    """
+    Returns True if bulk insert failed only because of documents
+    which are already inserted
+    :param exc: exception
+    :return: bool
+    """
+    details = getattr(exc, 'details', None)
+    if not isinstance(details, dict) or details.get('writeConcernErrors'):
+        return False
+    errors = details.get('writeErrors')
+    return bool(errors) and all(error.get('code') == DUPLICATE_KEY_CODE
+                                for error in errors)
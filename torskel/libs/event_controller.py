@@ -1,44 +1,407 @@
 """
 Writing evet logs into base
 """
+import time
+import random
+import asyncio
+import datetime
+
+import tornado.gen
 import tornado.log
 from tornado.queues import Queue
+from tornado.queues import QueueFull
 from tornado.options import options
 
+from torskel.libs.event_record import TorskelEventRecord
+
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_SAMPLE = 'sample'
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_POLICIES = (OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST,
+                     OVERFLOW_SAMPLE, OVERFLOW_BLOCK)
+DROPS_LOG_INTERVAL = 10
+
+
+class TorskelEventAdded:
+    """
+    Result of adding event which is known at once, awaiting returns
+    True if event is added
+    """
+    __slots__ = ('added',)
+
+    def __init__(self, added):
+        self.added = added
+
+    def __await__(self):
+        yield from ()
+        return self.added
+
+
+EVENT_ADDED = TorskelEventAdded(True)
+EVENT_DROPPED = TorskelEventAdded(False)
+
 
 class TorskelEventLogController:
     """
-    Class for write events
+    Class for write events.
+    Queue holds up to max_size events, 0 - unbounded. On overflow new event
+    is dropped, or the oldest one, or events are sampled with probability
+    falling from 1 at sample_from share of max_size to 0 at max_size,
+    or adding waits up to block_timeout seconds for free place.
+    Writer coroutine takes events by batches of batch_size, incomplete
+    batch is written after flush_interval milliseconds since its first
+    event. Up to concurrency batches are written at the same time.
+    With spill batches which are failed or not written in write_timeout
+    seconds are saved on disk and replayed after the next successful write
     """
 
-    def __init__(self):
+    def __init__(self, max_size=0, overflow=OVERFLOW_DROP_NEWEST,
+                 **kwargs):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown events queue overflow policy '
+                             f'{overflow}')
         self.logger = tornado.log.gen_log
-        self.queue = Queue()
+        self.queue = Queue(maxsize=max_size)
+        self.overflow = overflow
+        self.block_timeout = kwargs.get('block_timeout', 1)
+        self.sample_from = int(max_size * kwargs.get('sample_from', 0.8))
+        self.dropped = 0
+        self.delayed = 0
+        self.drops_logged_at = 0
+        self.spill = kwargs.get('spill')
+        self.sinks = []
+        self.write_timeout = None
+        self.replay_func = None
+        self.writer_task = None
+        self.batch = []
+        self.inserts = set()
+        self.started_at = time.monotonic()
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.write_time = 0.0
+        self.lag = 0.0
+        self.max_lag = 0.0
 
     def add_log_event(self, event):
         """
         Put event into queue
         :param event:
+        :return: awaitable, result is False if event is dropped
+        """
+        if not isinstance(event, (dict, TorskelEventRecord)):
+            return EVENT_DROPPED
+        self.logger.debug(event)
+        item = (time.monotonic(), event)
+        if self.overflow == OVERFLOW_SAMPLE and self._is_sampled_out():
+            self._drop()
+            return EVENT_DROPPED
+        try:
+            self.queue.put_nowait(item)
+            return EVENT_ADDED
+        except QueueFull:
+            pass
+        if self.overflow == OVERFLOW_BLOCK:
+            self.delayed += 1
+            return asyncio.ensure_future(self._put_with_timeout(item))
+        if self.overflow == OVERFLOW_DROP_OLDEST:
+            self.queue.get_nowait()
+            self.queue.put_nowait(item)
+        self._drop()
+        return EVENT_ADDED if self.overflow == OVERFLOW_DROP_OLDEST \
+            else EVENT_DROPPED
+
+    async def _put_with_timeout(self, item) -> bool:
+        """
+        Waits free place in queue for block_timeout seconds
+        :param item: enqueue time and event
+        :return: bool, False if event is dropped
+        """
+        try:
+            await self.queue.put(
+                item, timeout=datetime.timedelta(seconds=self.block_timeout)
+            )
+        except tornado.gen.TimeoutError:
+            self._drop()
+            return False
+        return True
+
+    def _is_sampled_out(self) -> bool:
+        """
+        Returns True if event must be dropped by sampling
+        :return: bool
+        """
+        size, max_size = self.queue.qsize(), self.queue.maxsize
+        if not max_size or size < self.sample_from:
+            return False
+        return random.random() * (max_size - self.sample_from) \
+            >= max_size - size
+
+    def _drop(self):
+        """
+        Counts dropped event, logs drops once per DROPS_LOG_INTERVAL
+        :return:
+        """
+        self.dropped += 1
+        now = time.monotonic()
+        if now - self.drops_logged_at >= DROPS_LOG_INTERVAL:
+            self.drops_logged_at = now
+            self.logger.warning('Events queue is full, %s events dropped',
+                                self.dropped)
+
+    def _take_batch(self, batch_size) -> list:
+        """
+        Returns collected events as dicts, records lag of the oldest one
+        :param batch_size: max count of events
+        :return: list of events
+        """
+        batch, self.batch = self.batch, []
+        while len(batch) < batch_size and self.queue.qsize():
+            batch.append(self.queue.get_nowait())
+        if batch:
+            self.lag = time.monotonic() - batch[0][0]
+            self.max_lag = max(self.max_lag, self.lag)
+        return [event.to_dict() if isinstance(event, TorskelEventRecord)
+                else event for _, event in batch]
+
+    async def _collect_batch(self, batch_size, flush_interval) -> list:
+        """
+        Waits batch_size events or flush_interval milliseconds
+        since the first event
+        :param batch_size: max count of events
+        :param flush_interval: milliseconds
+        :return: list of events
+        """
+        if not self.batch:
+            self.batch.append(await self.queue.get())
+        while len(self.batch) < batch_size:
+            if self.queue.qsize():
+                self.batch.append(self.queue.get_nowait())
+                continue
+            timeout = flush_interval / 1000 - \
+                (time.monotonic() - self.batch[0][0])
+            if timeout <= 0:
+                break
+            try:
+                self.batch.append(await self.queue.get(
+                    timeout=datetime.timedelta(seconds=timeout)
+                ))
+            except tornado.gen.TimeoutError:
+                break
+        return self._take_batch(batch_size)
+
+    async def _write_batch(self, write_func, batch):
+        """
+        Writes batch of events, errors are logged
+        :param write_func: coroutine function of list of events
+        :param batch: list of events
         :return:
         """
-        if isinstance(event, dict):
-            self.logger.debug(event)
-            self.queue.put(event)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(write_func(batch), self.write_timeout)
+        except Exception as exc:  # pylint: disable=W0703
+            self.errors += 1
+            self.logger.error('Writing %s events failed: %r', len(batch), exc)
+            self.spill_events(batch)
+            return
+        if self.spill is not None:
+            self.spill.start_replay(self.replay_func or write_func)
+        self.write_time += time.monotonic() - started
+        self.written += len(batch)
+        self.batches += 1
+        if options.show_log_event_writer:
+            self.logger.info('Written %s events, queue size = %s',
+                             len(batch), self.queue.qsize())
+
+    def spill_events(self, events):
+        """
+        Saves events on disk if spill is enabled
+        :param events: list of events
+        :return: bool
+        """
+        if self.spill is None or not events:
+            return False
+        try:
+            self.spill.append(events)
+        except Exception as exc:  # pylint: disable=W0703
+            self.logger.error('Saving %s events on disk failed: %r',
+                              len(events), exc)
+            return False
+        return True
+
+    def spill_queue(self) -> int:
+        """
+        Saves all events from the queue on disk
+        :return: count of saved events
+        """
+        count = 0
+        while self.batch or self.queue.qsize():
+            events = self._take_batch(options.task_list_size)
+            if not self.spill_events(events):
+                break
+            count += len(events)
+        return count
+
+    async def drain(self, write_func, batch_size=None):
+        """
+        Writes all events from the queue by batches,
+        on error the rest of events is saved on disk if spill is enabled
+        :param write_func: coroutine function of list of events
+        :param batch_size: max events in batch, default task_list_size
+        :return:
+        """
+        while self.batch or self.queue.qsize():
+            events = self._take_batch(batch_size or options.task_list_size)
+            try:
+                await write_func(events)
+            except Exception:
+                self.spill_events(events)
+                self.spill_queue()
+                raise
+
+    def add_sink(self, sink):
+        """
+        Adds destination of events, every event is written into all sinks
+        :param sink: TorskelEventSink
+        :return:
+        """
+        self.sinks.append(sink)
+
+    async def write_to_sinks(self, events):
+        """
+        Puts batch into queues of sinks, every sink except the first one
+        gets copies of events, because sinks can modify them
+        :param events: list of events
+        :return:
+        """
+        for i, sink in enumerate(self.sinks):
+            sink.put(events if not i else [dict(event) for event in events])
+
+    async def run_writer(self, write_func, batch_size=None,
+                         flush_interval=None, concurrency=None):
+        """
+        Writes events from the queue until cancelled
+        :param write_func: coroutine function of list of events
+        :param batch_size: max events in batch, default task_list_size
+        :param flush_interval: milliseconds, default writer_period
+        :param concurrency: max batches written at the same time,
+         default writer_concurrency
+        :return:
+        """
+        batch_size = batch_size or options.task_list_size
+        flush_interval = flush_interval or options.writer_period
+        semaphore = asyncio.Semaphore(
+            concurrency or options.writer_concurrency
+        )
+        while True:
+            await semaphore.acquire()
+            try:
+                batch = await self._collect_batch(batch_size, flush_interval)
+            except BaseException:
+                semaphore.release()
+                raise
+            task = asyncio.ensure_future(self._write_batch(write_func, batch))
+            self.inserts.add(task)
+            task.add_done_callback(self.inserts.discard)
+            task.add_done_callback(lambda _: semaphore.release())
+
+    def start(self, write_func, **kwargs):
+        """
+        Starts writer coroutine, starts replay of events saved on disk
+        :param write_func: coroutine function of list of events
+        param batch_size: max events in batch
+        param flush_interval: milliseconds
+        param concurrency: max batches written at the same time
+        param write_timeout: seconds
+        param replay_func: coroutine function for replay of events saved
+         on disk, default write_func
+        :return:
+        """
+        self.write_timeout = kwargs.pop('write_timeout', None)
+        self.replay_func = kwargs.pop('replay_func', None)
+        if self.spill is not None:
+            self.spill.start_replay(self.replay_func or write_func)
+        if self.writer_task is None:
+            self.started_at = time.monotonic()
+            self.writer_task = asyncio.ensure_future(
+                self.run_writer(write_func, **kwargs)
+            )
+
+    async def stop(self):
+        """
+        Stops writer coroutine and waits batches in progress,
+        collected events stay for flush
+        :return:
+        """
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+            try:
+                await self.writer_task
+            except asyncio.CancelledError:
+                pass
+            self.writer_task = None
+        if self.inserts:
+            await asyncio.wait(self.inserts)
+
+    async def close(self):
+        """
+        Stops replay and closes segment of spill
+        :return:
+        """
+        if self.spill is not None:
+            await self.spill.close()
 
     # pylint: disable=C0103
     async def write_log_from_queue(self, db, collection_name,
                                    events_writer_func) -> type(None):
         """
         Retrieves events from the queue.
-        and performs the insert into the database
+        and performs the insert into the database
         """
-
-        qsize = self.queue.qsize()
         if options.show_log_event_writer:
-            self.logger.info('Writing events... queue size = %s', qsize)
-        if qsize > 0:
-            step = qsize if qsize <= options.task_list_size else \
-                options.task_list_size
-            inserts_list = [await self.queue.get() for _ in range(step)]
-            if inserts_list:
+            self.logger.info('Writing events... queue size = %s',
+                             self.queue.qsize() + len(self.batch))
+        inserts_list = self._take_batch(options.task_list_size)
+        if inserts_list:
+            try:
                 await events_writer_func(db, collection_name, inserts_list)
+            except Exception:
+                self.spill_events(inserts_list)
+                raise
+
+    async def flush(self, db, collection_name,
+                    events_writer_func) -> type(None):
+        """
+        Writes all events from the queue by batches of task_list_size
+        """
+        while self.batch or self.queue.qsize() > 0:
+            await self.write_log_from_queue(db, collection_name,
+                                            events_writer_func)
+
+    def get_stats(self) -> dict:
+        """
+        Returns throughput of writer and lag of events in queue
+        :return: dict
+        """
+        elapsed = time.monotonic() - self.started_at
+        return {
+            'queue_size': self.queue.qsize() + len(self.batch),
+            'max_queue_size': self.queue.maxsize,
+            'dropped': self.dropped,
+            'delayed': self.delayed,
+            'spill': self.spill.get_stats() if self.spill is not None
+            else None,
+            'sinks': {sink.name: sink.get_stats() for sink in self.sinks},
+            'written': self.written,
+            'batches': self.batches,
+            'errors': self.errors,
+            'inserts_in_progress': len(self.inserts),
+            'throughput': self.written / elapsed if elapsed else 0.0,
+            'avg_write_time': self.write_time / self.batches
+            if self.batches else 0.0,
+            'lag': self.lag,
+            'max_lag': self.max_lag,
+        }
+
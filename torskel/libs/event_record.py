@@ -0,0 +1,126 @@
+"""
+Module contains compact record of request event, which is converted into
+dict only by events writer
+"""
+from datetime import datetime
+from functools import lru_cache
+
+from user_agents import parse
+
+from torskel.libs.str_consts import EVENTS_USER_AGENT
+from torskel.libs.str_consts import EVENTS_DATE
+from torskel.libs.str_consts import EVENTS_IP
+from torskel.libs.str_consts import EVENTS_METHOD
+from torskel.libs.str_consts import EVENTS_URL
+from torskel.libs.str_consts import EVENTS_SRV_NAME
+from torskel.libs.str_consts import EVENTS_HTTP_HEADERS
+
+EVENT_STR_MAX_LEN = 128
+
+
+@lru_cache(maxsize=4096)
+def get_user_agent_name(ua_string) -> str:
+    """
+    Defines the device, OS and browser by the User-Agent header,
+    results are cached, clients send the same headers
+    :param ua_string: value of User-Agent header or None
+    :return: str
+    """
+    if ua_string is None:
+        return 'Unknown'
+    return str(parse(ua_string))
+
+
+def get_headers_items(headers, names) -> tuple:
+    """
+    Returns items of headers from whitelist
+    :param headers: HTTPHeaders
+    :param names: names of headers
+    :return: tuple of name, value pairs
+    """
+    items = []
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            items.append((name, value))
+    return tuple(items)
+
+
+class TorskelEventRecord:
+    """
+    Event of request with raw values. Parsing of user agent, truncating
+    and building of document are done by to_dict in events writer.
+    Lite event has no url, server name and method.
+    Supports item access like dict event: assigned fields are kept in
+    extra and override fields of document
+    """
+    __slots__ = ('timestamp', 'user_agent', 'ip', 'headers', 'url',
+                 'server_name', 'method', 'extra')
+
+    def __init__(self, timestamp, user_agent, ip, headers, **kwargs):
+        self.timestamp = timestamp
+        self.user_agent = user_agent
+        self.ip = ip
+        self.headers = headers
+        self.url = kwargs.get('url')
+        self.server_name = kwargs.get('server_name')
+        self.method = kwargs.get('method')
+        self.extra = kwargs.get('extra')
+
+    def to_dict(self) -> dict:
+        """
+        Returns document of event
+        :return: dict
+        """
+        res = {
+            EVENTS_DATE: datetime.fromtimestamp(self.timestamp),
+            EVENTS_USER_AGENT: get_user_agent_name(
+                self.user_agent
+            )[:EVENT_STR_MAX_LEN],
+            EVENTS_IP: self.ip,
+            EVENTS_HTTP_HEADERS: dict(self.headers),
+        }
+        if self.method is not None:
+            res[EVENTS_URL] = self.url[:EVENT_STR_MAX_LEN] \
+                if self.url is not None else None
+            res[EVENTS_SRV_NAME] = self.server_name
+            res[EVENTS_METHOD] = self.method
+        if self.extra:
+            res.update(self.extra)
+        return res
+
+    def __getitem__(self, key):
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        return self.to_dict()[key]
+
+    def __setitem__(self, key, value):
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.to_dict()
+
+    def get(self, key, default=None):
+        """
+        Returns field of document
+        :param key: name of field
+        :param default: value if field is missing
+        :return: value
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, fields):
+        """
+        Adds fields into extra, they are copied
+        :param fields: dict
+        :return:
+        """
+        if fields:
+            if self.extra is None:
+                self.extra = {}
+            self.extra.update(fields)
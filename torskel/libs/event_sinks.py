@@ -0,0 +1,290 @@
+"""
+Module contains destinations of events: MongoDB, rotating JSONL files
+and redis streams
+"""
+import os
+import glob
+import gzip
+import time
+import shutil
+import asyncio
+import datetime
+from collections.abc import Mapping
+
+import tornado.ioloop
+import tornado.log
+
+from torskel.libs.db_utils.mongo import bulk_mongo_insert
+from torskel.libs.db_utils.mongo import is_duplicate_key_error
+from torskel.libs.event_controller import TorskelEventLogController
+from torskel.libs.event_controller import OVERFLOW_DROP_NEWEST
+from torskel.libs.json_codec import json_dumps_bytes
+
+# pylint: disable=C0103
+logger = tornado.log.gen_log
+
+
+def default_event_json(obj):
+    """
+    Returns JSON serializable value of event field
+    :param obj: value
+    :return: str or dict
+    """
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    return str(obj)
+
+
+class TorskelEventSink:
+    """
+    Destination of events with its own queue and writer: batch_size,
+    flush_interval, concurrency, max_queue_size and overflow policy.
+    Failed batch is written again up to retries times with exponential
+    delay, then it is saved into spill if it is set
+    """
+    name = 'sink'
+
+    def __init__(self, **kwargs):
+        self.name = kwargs.get('name', self.name)
+        self.batch_size = kwargs.get('batch_size')
+        self.flush_interval = kwargs.get('flush_interval')
+        self.concurrency = kwargs.get('concurrency')
+        self.write_timeout = kwargs.get('write_timeout')
+        self.retries = kwargs.get('retries', 2)
+        self.retry_delay = kwargs.get('retry_delay', 0.5)
+        self.retried = 0
+        self.controller = TorskelEventLogController(
+            kwargs.get('max_queue_size', 0),
+            kwargs.get('overflow', OVERFLOW_DROP_NEWEST),
+            spill=kwargs.get('spill')
+        )
+
+    async def write(self, events):
+        """
+        Writes batch of events
+        :param events: list of events
+        :return:
+        """
+        raise NotImplementedError()
+
+    async def replay(self, events):
+        """
+        Writes batch of events saved in spill
+        :param events: list of events
+        :return:
+        """
+        await self.write(events)
+
+    async def close(self):
+        """
+        Releases resources of sink
+        :return:
+        """
+
+    async def write_with_retries(self, events):
+        """
+        Writes batch, repeats failed writing
+        :param events: list of events
+        :return:
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return await asyncio.wait_for(self.write(events),
+                                              self.write_timeout)
+            except Exception as exc:  # pylint: disable=W0703
+                if attempt == self.retries:
+                    raise
+                self.retried += 1
+                logger.warning('Writing %s events into %s failed: %r, '
+                               'retrying', len(events), self.name, exc)
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    def put(self, events):
+        """
+        Adds events into queue of sink
+        :param events: list of events
+        :return:
+        """
+        for event in events:
+            self.controller.add_log_event(event)
+
+    def start(self):
+        """
+        Starts writer of sink
+        :return:
+        """
+        kwargs = {'replay_func': self.replay}
+        for name in ('batch_size', 'flush_interval', 'concurrency'):
+            if getattr(self, name) is not None:
+                kwargs[name] = getattr(self, name)
+        self.controller.start(self.write_with_retries, **kwargs)
+
+    async def stop(self):
+        """
+        Stops writer, writes events left in queue and closes sink
+        :return:
+        """
+        await self.controller.stop()
+        try:
+            await self.controller.drain(self.write_with_retries,
+                                        self.batch_size)
+        except Exception as exc:  # pylint: disable=W0703
+            logger.error('Writing events into %s failed: %r', self.name, exc)
+        await self.controller.close()
+        await self.close()
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of writer of sink
+        :return: dict
+        """
+        stats = self.controller.get_stats()
+        stats['retried'] = self.retried
+        return stats
+
+
+class TorskelMongoEventSink(TorskelEventSink):
+    """
+    Inserts events into MongoDB collection, get_db returns database or None
+    if connection is missing
+    """
+    name = 'mongo'
+
+    def __init__(self, get_db, collection_name, **kwargs):
+        super().__init__(**kwargs)
+        self.get_db = get_db
+        self.collection_name = collection_name
+
+    async def write(self, events):
+        """
+        Writes batch of events
+        :param events: list of events
+        :return:
+        """
+        db = self.get_db()
+        if db is None:
+            raise ConnectionError('Connection to database is missing')
+        await bulk_mongo_insert(db, self.collection_name, events)
+
+    async def replay(self, events):
+        """
+        Inserts events saved in spill. Events of batch which was partially
+        inserted before have _id, they are skipped
+        :param events: list of events
+        :return:
+        """
+        db = self.get_db()
+        if db is None:
+            raise ConnectionError('Connection to database is missing')
+        try:
+            await bulk_mongo_insert(db, self.collection_name, events,
+                                    ordered=False)
+        except Exception as exc:  # pylint: disable=W0703
+            if not is_duplicate_key_error(exc):
+                raise
+
+
+class TorskelFileEventSink(TorskelEventSink):
+    """
+    Appends events as JSON lines to file, file is rotated after max_bytes
+    and compressed by gzip, backup_count compressed files are kept.
+    Files are written in thread pool by one batch at a time
+    """
+    name = 'file'
+
+    def __init__(self, path, max_bytes=100 * 1024 * 1024, backup_count=10,
+                 **kwargs):
+        # cancelled writing goes on in thread, so it can not be repeated
+        kwargs['concurrency'] = 1
+        kwargs['write_timeout'] = None
+        super().__init__(**kwargs)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.file = None
+        self.file_size = 0
+
+    async def write(self, events):
+        """
+        Writes batch of events
+        :param events: list of events
+        :return:
+        """
+        data = b''.join(
+            json_dumps_bytes(event, default=default_event_json) + b'\n'
+            for event in events
+        )
+        await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, self._write, data
+        )
+
+    def _write(self, data):
+        """
+        Appends data to file, rotates file
+        :param data: bytes
+        :return:
+        """
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+            self.file_size = self.file.tell()
+        self.file.write(data)
+        self.file.flush()
+        self.file_size += len(data)
+        if self.file_size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        """
+        Compresses current file and removes old compressed files
+        :return:
+        """
+        self.file.close()
+        self.file = None
+        rotated_path = f'{self.path}.{time.time_ns()}'
+        os.replace(self.path, rotated_path)
+        with open(rotated_path, 'rb') as src, \
+                gzip.open(f'{rotated_path}.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated_path)
+        backups = sorted(glob.glob(f'{glob.escape(self.path)}.*.gz'))
+        for path in backups[:-self.backup_count or None]:
+            os.remove(path)
+
+    async def close(self):
+        """
+        Closes file
+        :return:
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class TorskelRedisStreamEventSink(TorskelEventSink):
+    """
+    Adds events as JSON into redis stream of redis_app, stream is trimmed
+    to about max_len events
+    """
+    name = 'redis'
+
+    def __init__(self, redis_app, stream, max_len=1000000, **kwargs):
+        super().__init__(**kwargs)
+        self.redis_app = redis_app
+        self.stream = stream
+        self.max_len = max_len
+
+    async def write(self, events):
+        """
+        Writes batch of events
+        :param events: list of events
+        :return:
+        """
+        async with self.redis_app.redis_pipeline() as pipeline:
+            for event in events:
+                pipeline.execute_command(
+                    'xadd', self.stream, 'MAXLEN', '~', self.max_len, '*',
+                    'event', json_dumps_bytes(event,
+                                              default=default_event_json)
+                )
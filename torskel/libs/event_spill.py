@@ -0,0 +1,340 @@
+"""
+Module contains local spill of events: batches which can not be written
+into the database are appended to segment files and replayed later
+"""
+import os
+import mmap
+import fcntl
+import time
+import zlib
+import struct
+import asyncio
+import importlib
+
+import tornado.ioloop
+import tornado.log
+
+# pylint: disable=C0103
+logger = tornado.log.gen_log
+
+SEGMENT_PREFIX = 'events-'
+SEGMENT_SUFFIX = '.seg'
+# length and crc32 of record
+RECORD_HEADER = struct.Struct('<II')
+
+
+def get_bson_codec() -> tuple:
+    """
+    Returns functions encoding event into BSON and decoding it
+    :return: tuple encode, decode
+    """
+    try:
+        bson = importlib.import_module('bson')
+    except ImportError:
+        raise ImportError('Required package pymongo is missing')
+    return bson.BSON.encode, lambda data: bson.BSON(data).decode()
+
+
+def _fsync(fd):
+    """
+    Fsyncs and closes duplicate of file descriptor, so segment can be
+    closed while fsync is running
+    :param fd: file descriptor
+    :return:
+    """
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def iter_records(buf, offset=0):
+    """
+    Iterates records of segment, stops on truncated or corrupted record
+    which can be left by crash
+    :param buf: bytes or mmap of segment
+    :param offset: offset of the first record
+    :return: generator of offset of record end and record
+    """
+    size = len(buf)
+    while offset + RECORD_HEADER.size <= size:
+        length, crc = RECORD_HEADER.unpack_from(buf, offset)
+        start = offset + RECORD_HEADER.size
+        record = buf[start:start + length]
+        if len(record) < length or zlib.crc32(record) != crc:
+            logger.error('Events segment is corrupted at %s, %s bytes '
+                         'are skipped', offset, size - offset)
+            return
+        offset = start + length
+        yield offset, record
+
+
+class TorskelEventSpill:
+    """
+    Append-only segment files in directory. Records are flushed on every
+    append and fsynced at most every fsync_interval seconds, segment is
+    closed after segment_size bytes. Closed segments are replayed from
+    the oldest one with rate limit and deleted after replay, offset of
+    replayed part is kept in {segment}.pos file. Segment is locked with
+    flock while it is written or replayed, so processes sharing directory
+    during handover replay only segments which their owners closed
+    """
+
+    def __init__(self, directory, **kwargs):
+        self.directory = directory
+        self.segment_size = kwargs.get('segment_size', 16 * 1024 * 1024)
+        self.fsync_interval = kwargs.get('fsync_interval', 1.0)
+        self.replay_rate = kwargs.get('replay_rate', 1000)
+        self.batch_size = kwargs.get('batch_size', 500)
+        if 'encode' in kwargs:
+            self.encode, self.decode = kwargs['encode'], kwargs['decode']
+        else:
+            self.encode, self.decode = get_bson_codec()
+        os.makedirs(directory, exist_ok=True)
+        self.segments = self._find_segments()
+        self.file = None
+        self.file_name = None
+        self.file_size = 0
+        self.sync_handle = None
+        self.replay_task = None
+        self.spilled = 0
+        self.replayed = 0
+
+    def _find_segments(self) -> list:
+        """
+        Returns names of segments in order of writing
+        :return: list
+        """
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX)
+            and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _get_path(self, name) -> str:
+        """
+        Returns path of segment
+        :param name: name of segment
+        :return: str
+        """
+        return os.path.join(self.directory, name)
+
+    def _open_segment(self):
+        """
+        Opens new segment for appending. Writing never continues old
+        segment, it can end with record truncated by crash. Names are
+        unique for processes sharing directory during handover
+        :return:
+        """
+        name = f'{SEGMENT_PREFIX}{time.time_ns():020d}-{os.getpid()}' \
+            f'{SEGMENT_SUFFIX}'
+        self.file = open(self._get_path(name), 'ab')
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        self.file_name = name
+        self.file_size = 0
+        self.segments.append(name)
+
+    def close_segment(self):
+        """
+        Fsyncs and closes segment in progress, so it can be replayed
+        :return:
+        """
+        if self.file is None:
+            return
+        if self.sync_handle is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self.sync_handle)
+            self.sync_handle = None
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+        self.file_name = None
+
+    def append(self, events):
+        """
+        Appends batch of events to segment
+        :param events: list of events
+        :return:
+        """
+        if self.file is None:
+            self._open_segment()
+        data = bytearray()
+        for event in events:
+            record = self.encode(event)
+            data += RECORD_HEADER.pack(len(record), zlib.crc32(record))
+            data += record
+        self.file.write(data)
+        self.file.flush()
+        self.file_size += len(data)
+        self.spilled += len(events)
+        if self.file_size >= self.segment_size:
+            self.close_segment()
+        elif self.sync_handle is None:
+            self.sync_handle = tornado.ioloop.IOLoop.current().call_later(
+                self.fsync_interval, self.sync
+            )
+
+    def sync(self):
+        """
+        Fsyncs segment in progress in thread pool
+        :return:
+        """
+        self.sync_handle = None
+        if self.file is not None:
+            tornado.ioloop.IOLoop.current().run_in_executor(
+                None, _fsync, os.dup(self.file.fileno())
+            )
+
+    def has_pending(self) -> bool:
+        """
+        Returns True if there are events for replay
+        :return: bool
+        """
+        return bool(self.segments)
+
+    def start_replay(self, write_func):
+        """
+        Starts replay of segments if it is not running
+        :param write_func: coroutine function of list of events
+        :return:
+        """
+        if self.has_pending() and (self.replay_task is None or
+                                   self.replay_task.done()):
+            self.replay_task = asyncio.ensure_future(self.replay(write_func))
+
+    async def replay(self, write_func):
+        """
+        Writes events of segments, stops on the first error,
+        replayed segments are deleted. Events of failed batch are written
+        again on next replay. Segments locked by other process are skipped
+        :param write_func: coroutine function of list of events
+        :return:
+        """
+        self.segments = self._find_segments()
+        busy = set()
+        while True:
+            names = [name for name in self.segments if name not in busy]
+            if not names:
+                return
+            name = names[0]
+            if name == self.file_name:
+                self.close_segment()
+            try:
+                done = await self._replay_segment(name, write_func)
+            except Exception as exc:  # pylint: disable=W0703
+                logger.warning('Replay of events segment %s is stopped: %r',
+                               name, exc)
+                return
+            if not done:
+                busy.add(name)
+                continue
+            self.segments.remove(name)
+            logger.info('Events segment %s is replayed', name)
+
+    @staticmethod
+    def _remove(path):
+        """
+        Removes file which can be already removed by other process
+        :param path: path of file
+        :return:
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def _replay_segment(self, name, write_func) -> bool:
+        """
+        Writes events of segment by batches, not faster than replay_rate
+        events per second, and deletes segment. Offset of written part
+        is saved after every batch, so it is not replayed again after restart
+        :param name: name of segment
+        :param write_func: coroutine function of list of events
+        :return: False if segment is locked by other process
+        """
+        path = self._get_path(name)
+        pos_path = f'{path}.pos'
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return True
+        with file:
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            stat = os.fstat(file.fileno())
+            if not stat.st_nlink:
+                # replayed by other process
+                return True
+            start = 0
+            if os.path.exists(pos_path):
+                with open(pos_path) as pos_file:
+                    start = int(pos_file.read() or 0)
+            if stat.st_size > start:
+                await self._replay_file(file, start, pos_path, write_func)
+            self._remove(path)
+            self._remove(pos_path)
+        return True
+
+    async def _replay_file(self, file, start, pos_path, write_func):
+        """
+        Writes events of segment file from offset start
+        :param file: file of segment
+        :param start: offset of the first record
+        :param pos_path: path of file with offset of written part
+        :param write_func: coroutine function of list of events
+        :return:
+        """
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            batch = []
+            for offset, record in iter_records(buf, start):
+                batch.append(self.decode(record))
+                if len(batch) >= self.batch_size:
+                    await self._replay_batch(write_func, batch)
+                    with open(pos_path, 'w') as pos_file:
+                        pos_file.write(str(offset))
+                    batch = []
+            if batch:
+                await self._replay_batch(write_func, batch)
+
+    async def _replay_batch(self, write_func, batch):
+        """
+        Writes batch and sleeps for rate limit
+        :param write_func: coroutine function of list of events
+        :param batch: list of events
+        :return:
+        """
+        started = time.monotonic()
+        await write_func(batch)
+        self.replayed += len(batch)
+        delay = len(batch) / self.replay_rate - (time.monotonic() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of spill
+        :return: dict
+        """
+        return {
+            'spilled': self.spilled,
+            'replayed': self.replayed,
+            'segments': len(self.segments),
+            'replaying': self.replay_task is not None
+            and not self.replay_task.done(),
+        }
+
+    async def close(self):
+        """
+        Stops replay and closes segment in progress
+        :return:
+        """
+        if self.replay_task is not None:
+            self.replay_task.cancel()
+            try:
+                await self.replay_task
+            except asyncio.CancelledError:
+                pass
+            self.replay_task = None
+        self.close_segment()
@@ -0,0 +1,181 @@
+"""
+Module contains functions for passing listening sockets between processes
+"""
+import os
+import sys
+import time
+import select
+import socket
+import subprocess
+
+import tornado.log
+
+# pylint: disable=C0103
+logger = tornado.log.gen_log
+
+# fds passed by the previous torskel process on restart
+TORSKEL_LISTEN_FDS = 'TORSKEL_LISTEN_FDS'
+# write end of pipe, new process writes into it when it accepts connections
+TORSKEL_READY_FD = 'TORSKEL_READY_FD'
+# set by systemd for every service
+SD_INVOCATION_ID = 'INVOCATION_ID'
+# systemd socket activation protocol
+SD_LISTEN_FDS = 'LISTEN_FDS'
+SD_LISTEN_PID = 'LISTEN_PID'
+SD_LISTEN_FDS_START = 3
+
+
+def _get_inherited_fds() -> list:
+    """
+    Returns list of file descriptors passed by systemd or by the previous
+    torskel process
+    :return: list
+    """
+    fds = []
+    if os.environ.get(SD_LISTEN_PID) == str(os.getpid()):
+        count = int(os.environ.get(SD_LISTEN_FDS, 0))
+        fds = list(range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + count))
+    elif os.environ.get(TORSKEL_LISTEN_FDS):
+        fds = [int(fd) for fd in os.environ[TORSKEL_LISTEN_FDS].split(',')]
+
+    # do not pass them to processes started by application
+    for env_name in (SD_LISTEN_PID, SD_LISTEN_FDS, TORSKEL_LISTEN_FDS):
+        os.environ.pop(env_name, None)
+    return fds
+
+
+def get_inherited_sockets() -> list:
+    """
+    Returns listening sockets inherited from systemd or from
+    the previous torskel process
+    :return: list of sockets
+    """
+    sockets = []
+    for fd in _get_inherited_fds():
+        sock = socket.socket(fileno=fd)
+        sock.setblocking(False)
+        sockets.append(sock)
+        logger.info('Inherited listening socket fd=%s %s', fd,
+                    sock.getsockname())
+    return sockets
+
+
+def get_ready_fd():
+    """
+    Returns fd for notification of the previous torskel process
+    that current process is ready
+    :return: int or None
+    """
+    fd = os.environ.pop(TORSKEL_READY_FD, None)
+    return int(fd) if fd else None
+
+
+def notify_ready(fd):
+    """
+    Notifies the previous torskel process that current process
+    accepts connections. In prefork mode every worker notifies it,
+    the previous process waits for all of them
+    :param fd: fd from get_ready_fd or None
+    :return:
+    """
+    if fd is None:
+        return
+    try:
+        os.write(fd, b'1')
+    except OSError:
+        # the previous process has already stopped waiting
+        pass
+
+
+def spawn_successor(sockets) -> tuple:
+    """
+    Starts new copy of current process, which inherits listening sockets
+    and write end of readiness pipe
+    :param sockets: list of listening sockets
+    :return: tuple of Popen and read end of readiness pipe
+    """
+    read_fd, write_fd = os.pipe()
+    fds = [sock.fileno() for sock in sockets]
+    env = dict(os.environ)
+    if fds:
+        env[TORSKEL_LISTEN_FDS] = ','.join(str(fd) for fd in fds)
+    env[TORSKEL_READY_FD] = str(write_fd)
+    try:
+        process = subprocess.Popen(
+            [sys.executable] + sys.argv, env=env, pass_fds=fds + [write_fd]
+        )
+    except Exception:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    logger.info('Started new process pid=%s with listening fds %s',
+                process.pid, fds)
+    return process, read_fd
+
+
+def wait_successor(process, ready_fd, timeout, workers=1) -> bool:
+    """
+    Waits until every worker of new process notifies that it accepts
+    connections. Process which exits or is not ready in timeout seconds
+    is terminated
+    :param process: Popen
+    :param ready_fd: read end of readiness pipe
+    :param timeout: seconds
+    :param workers: count of worker processes of new process
+    :return: bool, True if new process is ready
+    """
+    deadline = time.monotonic() + timeout
+    ready = 0
+    try:
+        while process.poll() is None:
+            wait_time = min(deadline - time.monotonic(), 0.1)
+            if wait_time <= 0:
+                logger.error('New process pid=%s is not ready in %ss, '
+                             'terminating it', process.pid, timeout)
+                process.terminate()
+                try:
+                    process.wait(5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+                return False
+            readable, _, _ = select.select([ready_fd], [], [], wait_time)
+            if not readable:
+                continue
+            data = os.read(ready_fd, workers)
+            if not data:
+                # all writers are closed, process is exiting
+                time.sleep(wait_time)
+                continue
+            ready += len(data)
+            if ready >= workers:
+                logger.info('New process pid=%s is ready', process.pid)
+                return True
+        logger.error('New process pid=%s exited with status %s',
+                     process.pid, process.returncode)
+        return False
+    finally:
+        os.close(ready_fd)
+
+
+def start_successor(sockets, timeout, workers=1) -> bool:
+    """
+    Starts new copy of current process and waits until it is ready.
+    Under systemd main process must not exit, so it is refused:
+    restart service with socket activation instead
+    :param sockets: list of listening sockets
+    :param timeout: seconds to wait for new process
+    :param workers: count of worker processes of new process
+    :return: bool, True if new process is ready and current one can stop
+    """
+    if os.environ.get(SD_INVOCATION_ID):
+        logger.error('Handover is not supported under systemd, '
+                     'use socket activation and restart service')
+        return False
+    try:
+        process, ready_fd = spawn_successor(sockets)
+    except OSError as exc:
+        logger.error('Starting new process failed: %r', exc)
+        return False
+    return wait_successor(process, ready_fd, timeout, workers)
@@ -0,0 +1,180 @@
+"""
+Module contains cache of decoded http responses
+"""
+import time
+from email.utils import parsedate_to_datetime
+
+from torskel.libs.lru_cache import TorskelLRUCache
+
+
+def _parse_http_date(value):
+    """
+    Returns timestamp from http date header
+    :param value: header value
+    :return: float or None
+    """
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def get_cache_ttl(headers, default_ttl=0):
+    """
+    Returns time in seconds while response is fresh by Cache-Control
+    or Expires headers
+    :param headers: response headers
+    :param default_ttl: ttl of response without cache headers
+    :return: int or None if response must not be stored
+    """
+    directives = {}
+    for item in headers.get('Cache-Control', '').split(','):
+        name, _, value = item.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0
+    if 'max-age' in directives:
+        try:
+            ttl = int(directives['max-age'])
+        except ValueError:
+            return 0
+        try:
+            ttl -= int(headers.get('Age', 0))
+        except ValueError:
+            pass
+        return max(ttl, 0)
+    if 'Expires' in headers:
+        expires = _parse_http_date(headers['Expires'])
+        if expires is None:
+            return 0
+        date = _parse_http_date(headers.get('Date')) or time.time()
+        return max(int(expires - date), 0)
+    return default_ttl
+
+
+class TorskelHttpCacheEntry:
+    """
+    Cached result of request with its validators
+    """
+    __slots__ = ('result', 'etag', 'last_modified', 'fresh_until', 'size')
+
+    def __init__(self, result, etag, last_modified, ttl, size):
+        self.result = result
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fresh_until = time.monotonic() + ttl
+        self.size = size
+
+    @property
+    def is_fresh(self) -> bool:
+        """
+        Returns True if entry can be used without revalidation
+        :return: bool
+        """
+        return self.fresh_until > time.monotonic()
+
+    @property
+    def can_revalidate(self) -> bool:
+        """
+        Returns True if entry has validators for conditional request
+        :return: bool
+        """
+        return bool(self.etag or self.last_modified)
+
+    def get_validators(self) -> dict:
+        """
+        Returns headers of conditional request
+        :return: dict
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class TorskelHttpCache:
+    """
+    In-memory LRU cache of decoded http responses.
+    Stale entries with ETag or Last-Modified are kept for revalidation.
+    Any object with get, store, revalidated and get_stats methods
+    can be used instead
+    """
+
+    def __init__(self, max_items=1000, max_bytes=None, default_ttl=0):
+        self.cache = TorskelLRUCache(max_items=max_items, max_bytes=max_bytes)
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def get(self, key):
+        """
+        Returns fresh entry or stale entry which can be revalidated
+        :param key: key
+        :return: TorskelHttpCacheEntry or None
+        """
+        entry = self.cache.get(key, count_stats=False)
+        if entry is None:
+            self.misses += 1
+        elif entry.is_fresh:
+            self.hits += 1
+        elif not entry.can_revalidate:
+            self.cache.delete(key)
+            self.misses += 1
+            entry = None
+        return entry
+
+    def store(self, key, response, result):
+        """
+        Stores decoded result of response if it is cacheable
+        :param key: key
+        :param response: HTTPResponse
+        :param result: decoded body
+        :return: TorskelHttpCacheEntry or None
+        """
+        headers = response.headers
+        ttl = get_cache_ttl(headers, self.default_ttl)
+        if ttl is None:
+            self.cache.delete(key)
+            return None
+        entry = TorskelHttpCacheEntry(
+            result, headers.get('ETag'), headers.get('Last-Modified'), ttl,
+            len(response.body or b'')
+        )
+        if ttl > 0 or entry.can_revalidate:
+            self.cache.set(key, entry, size=entry.size)
+        return entry
+
+    def revalidated(self, key, entry, response):
+        """
+        Updates freshness of entry after 304 Not Modified response
+        :param key: key
+        :param entry: TorskelHttpCacheEntry
+        :param response: HTTPResponse
+        :return: TorskelHttpCacheEntry
+        """
+        self.revalidations += 1
+        ttl = get_cache_ttl(response.headers, self.default_ttl) \
+            if response is not None else self.default_ttl
+        entry.fresh_until = time.monotonic() + (ttl or 0)
+        self.cache.set(key, entry, size=entry.size)
+        return entry
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of cache
+        :return: dict
+        """
+        stats = self.cache.get_stats()
+        stats.update({
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+        })
+        return stats
@@ -0,0 +1,232 @@
+"""
+Module contains per-host pools of http connections
+"""
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import tornado.log
+import tornado.util
+import tornado.locks
+import tornado.httpclient
+from tornado.httpclient import AsyncHTTPClient
+
+from torskel.libs.lru_cache import TorskelLRUCache
+
+# pylint: disable=C0103
+logger = tornado.log.gen_log
+
+
+class TorskelHttpPool:
+    """
+    Pool of connections to one upstream with own concurrency limit.
+    Every pool has own http-client instance, so keep-alive connections
+    (CurlAsyncHTTPClient) are reused only for this upstream.
+    SimpleAsyncHTTPClient opens new connection for every request,
+    with it counter of reused connections is always 0
+    """
+
+    def __init__(self, name, max_clients=10, queue_timeout=10):
+        self.name = name
+        self.max_clients = max_clients
+        self.queue_timeout = queue_timeout
+        self.semaphore = tornado.locks.Semaphore(max_clients)
+        self.http_client = AsyncHTTPClient(
+            force_instance=True, max_clients=max_clients
+        )
+        self.active = 0
+        self.queued = 0
+        self.requests = 0
+        self.reused = 0
+        self.queue_timeouts = 0
+        self.closing = False
+        self.closed = False
+
+    async def fetch(self, request, **kwargs):
+        """
+        Waits for free slot in the pool and performs request
+        :param request: url or HTTPRequest
+        :param kwargs: params of HTTPRequest
+        :return: HTTPResponse
+        """
+        self.queued += 1
+        try:
+            await self.semaphore.acquire(
+                timeout=timedelta(seconds=self.queue_timeout)
+            )
+        except tornado.util.TimeoutError:
+            self.queued -= 1
+            self.queue_timeouts += 1
+            if self.closing:
+                self.close_when_idle()
+            raise tornado.httpclient.HTTPError(
+                599, f'Timeout in request queue of pool {self.name}'
+            )
+        except BaseException:
+            self.queued -= 1
+            raise
+
+        self.queued -= 1
+        self.active += 1
+        self.requests += 1
+        try:
+            response = await self.http_client.fetch(request, **kwargs)
+            # curl reports zero connect time for reused connection
+            if response.time_info.get('connect') == 0:
+                self.reused += 1
+            return response
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+            if self.closing:
+                self.close_when_idle()
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of pool
+        :return: dict
+        """
+        return {
+            'max_clients': self.max_clients,
+            'active': self.active,
+            'queued': self.queued,
+            'requests': self.requests,
+            'reused': self.reused,
+            'queue_timeouts': self.queue_timeouts,
+        }
+
+    def close(self):
+        """
+        Closes http-client of pool
+        :return:
+        """
+        self.closed = True
+        self.http_client.close()
+
+    def close_when_idle(self):
+        """
+        Closes http-client of pool after requests in progress
+        :return:
+        """
+        self.closing = True
+        if not self.closed and not self.active and not self.queued:
+            self.close()
+
+
+class TorskelHttpPools:
+    """
+    Registry of http pools. Requests are routed to pool by host of url,
+    hosts can be grouped into named upstream with common pool.
+    Pools of not configured hosts are created on demand, up to max_hosts
+    of them are kept, the least recently used one is closed after
+    its requests in progress
+    """
+
+    def __init__(self, max_clients=10, queue_timeout=10, max_hosts=100):
+        self.max_clients = max_clients
+        self.queue_timeout = queue_timeout
+        self.pools = {}
+        self.host_pools = TorskelLRUCache(
+            max_items=max_hosts, on_evict=self._evict_pool
+        )
+        self.upstreams = {}
+
+    @staticmethod
+    def _evict_pool(name, pool):
+        """
+        Closes pool evicted from pools of not configured hosts
+        :param name: host
+        :param pool: TorskelHttpPool
+        :return:
+        """
+        logger.info('Closing http pool %s of not configured host', name)
+        pool.close_when_idle()
+
+    def _create_pool(self, name, max_clients=None, queue_timeout=None):
+        """
+        Creates pool with default limits if limits are not set
+        :param name: host or name of upstream
+        :param max_clients: max count of concurrent requests
+        :param queue_timeout: max time in seconds to wait for free slot
+        :return: TorskelHttpPool
+        """
+        return TorskelHttpPool(
+            name,
+            max_clients=max_clients or self.max_clients,
+            queue_timeout=queue_timeout or self.queue_timeout
+        )
+
+    def configure(self, name, hosts=None, max_clients=None,
+                  queue_timeout=None):
+        """
+        Creates pool for host or for named upstream
+        :param name: host or name of upstream
+        :param hosts: list of hosts of upstream, default [name]
+        :param max_clients: max count of concurrent requests
+        :param queue_timeout: max time in seconds to wait for free slot
+        :return: TorskelHttpPool
+        """
+        pool = self._create_pool(name, max_clients, queue_timeout)
+        for old_pool in (self.pools.pop(name, None),
+                         self.host_pools.get(name, count_stats=False)):
+            if old_pool is not None:
+                old_pool.close_when_idle()
+        self.host_pools.delete(name)
+        self.pools[name] = pool
+        for host in hosts or [name]:
+            self.upstreams[host.lower()] = name
+        logger.info('Configured http pool %s max_clients=%s', name,
+                    pool.max_clients)
+        return pool
+
+    def get_pool(self, url) -> TorskelHttpPool:
+        """
+        Returns pool for url, pool of not configured host is created
+        with default limits
+        :param url: url
+        :return: TorskelHttpPool
+        """
+        host = urlsplit(url).netloc.lower()
+        name = self.upstreams.get(host, host)
+        pool = self.pools.get(name)
+        if pool is None:
+            pool = self.host_pools.get(name)
+            if pool is None:
+                pool = self._create_pool(name)
+                self.host_pools.set(name, pool)
+        return pool
+
+    async def fetch(self, request, **kwargs):
+        """
+        Performs request through pool of its host
+        :param request: url or HTTPRequest
+        :param kwargs: params of HTTPRequest
+        :return: HTTPResponse
+        """
+        url = request.url if isinstance(
+            request, tornado.httpclient.HTTPRequest
+        ) else request
+        return await self.get_pool(url).fetch(request, **kwargs)
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of all pools
+        :return: dict
+        """
+        stats = {name: pool.get_stats()
+                 for name, (pool, _, _) in self.host_pools.items.items()}
+        stats.update(
+            (name, pool.get_stats()) for name, pool in self.pools.items()
+        )
+        return stats
+
+    def close(self):
+        """
+        Closes all pools
+        :return:
+        """
+        for pool in self.pools.values():
+            pool.close()
+        for pool, _, _ in self.host_pools.items.values():
+            pool.close()
+        self.pools = {}
+        self.host_pools.clear()
@@ -0,0 +1,183 @@
+"""
+Module contains retry policy, circuit breaker and latency tracker
+for http requests
+"""
+import time
+import random
+from collections import deque
+
+import tornado.log
+
+# pylint: disable=C0103
+logger = tornado.log.gen_log
+
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+RETRY_HTTP_CODES = frozenset((502, 503, 504, 599))
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+
+def is_upstream_failure(code) -> bool:
+    """
+    Returns True if http code means that upstream is unavailable
+    :param code: http code, None for connection errors
+    :return: bool
+    """
+    return code is None or code >= 500
+
+
+class TorskelRetryPolicy:
+    """
+    Retries with exponential backoff and full jitter
+    """
+
+    def __init__(self, max_retries=0, backoff=0.1, max_backoff=2.0,
+                 idempotent_only=True, retry_codes=RETRY_HTTP_CODES):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.idempotent_only = idempotent_only
+        self.retry_codes = retry_codes
+
+    def should_retry(self, method, code, attempt, max_retries=None) -> bool:
+        """
+        Checks whether failed request can be retried
+        :param method: http method
+        :param code: http code, None for connection errors
+        :param attempt: number of failed attempt, starts from 0
+        :param max_retries: overrides max_retries of policy
+        :return: bool
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        if attempt >= max_retries:
+            return False
+        if self.idempotent_only and method.upper() not in IDEMPOTENT_METHODS:
+            return False
+        return code is None or code in self.retry_codes
+
+    def get_delay(self, attempt) -> float:
+        """
+        Returns delay before retry
+        :param attempt: number of failed attempt, starts from 0
+        :return: seconds
+        """
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt)
+        )
+
+
+class TorskelCircuitBreaker:
+    """
+    Fails fast after failure_threshold consecutive failures,
+    lets one trial request through after reset_timeout, other requests
+    are rejected until result of the trial one is recorded
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.half_open_in_flight = False
+        self.opened_at = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """
+        Checks whether request can be sent
+        :return: bool
+        """
+        if self.state == BREAKER_OPEN and \
+                time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = BREAKER_HALF_OPEN
+        if self.state == BREAKER_HALF_OPEN and not self.half_open_in_flight:
+            self.half_open_in_flight = True
+            return True
+        if self.state != BREAKER_CLOSED:
+            self.rejected += 1
+            return False
+        return True
+
+    def record_success(self):
+        """
+        Closes breaker after successful request
+        :return:
+        """
+        if self.state != BREAKER_CLOSED:
+            logger.info('Circuit breaker %s is closed', self.name)
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.half_open_in_flight = False
+
+    def record_failure(self):
+        """
+        Counts failed request, opens breaker when threshold is reached
+        :return:
+        """
+        self.failures += 1
+        self.half_open_in_flight = False
+        if self.state == BREAKER_HALF_OPEN or \
+                self.failures >= self.failure_threshold:
+            if self.state != BREAKER_OPEN:
+                logger.warning('Circuit breaker %s is open', self.name)
+            self.state = BREAKER_OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """
+        Lets next trial request through if the trial one is finished
+        without result, e.g. cancelled
+        :return:
+        """
+        self.half_open_in_flight = False
+
+    def get_stats(self) -> dict:
+        """
+        Returns state of breaker
+        :return: dict
+        """
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'rejected': self.rejected,
+        }
+
+
+class TorskelLatencyTracker:
+    """
+    Keeps latencies of last requests to every host
+    """
+
+    def __init__(self, window=100, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self.latencies = {}
+
+    def add(self, host, latency):
+        """
+        Adds latency of request
+        :param host: host
+        :param latency: seconds
+        :return:
+        """
+        if host not in self.latencies:
+            self.latencies[host] = deque(maxlen=self.window)
+        self.latencies[host].append(latency)
+
+    def get_percentile(self, host, percentile):
+        """
+        Returns latency percentile of host
+        :param host: host
+        :param percentile: percentile, 0-100
+        :return: seconds or None if there are not enough samples
+        """
+        samples = self.latencies.get(host)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
@@ -0,0 +1,191 @@
+"""
+Module contains registry of JSON codecs. Codec is selected by json_codec
+option: json (stdlib), orjson, ujson or auto - the fastest installed one
+"""
+import json
+import importlib
+
+from tornado.options import options
+
+JSON_CODEC_AUTO = 'auto'
+JSON_CODECS_PRIORITY = ('orjson', 'ujson', 'json')
+
+
+def _apply_object_hook(obj, object_hook):
+    """
+    Applies object_hook to every dict from the innermost ones, as
+    json.loads does
+    :param obj: decoded object
+    :param object_hook: hook
+    :return: object
+    """
+    if isinstance(obj, dict):
+        return object_hook({
+            key: _apply_object_hook(value, object_hook)
+            for key, value in obj.items()
+        })
+    if isinstance(obj, list):
+        return [_apply_object_hook(value, object_hook) for value in obj]
+    return obj
+
+
+class TorskelStdJsonCodec:
+    """
+    Codec based on stdlib json
+    """
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj, default=None) -> str:
+        """
+        Serializes object to JSON string
+        :param obj: object
+        :param default: hook for objects which are not serializable
+        :return: str
+        """
+        return json.dumps(obj, default=default)
+
+    def dumps_bytes(self, obj, default=None) -> bytes:
+        """
+        Serializes object to JSON bytes
+        :param obj: object
+        :param default: hook for objects which are not serializable
+        :return: bytes
+        """
+        return self.dumps(obj, default).encode('utf-8')
+
+    @staticmethod
+    def loads(data, object_hook=None):
+        """
+        Deserializes JSON str or bytes
+        :param data: str or bytes
+        :param object_hook: hook for decoded dicts
+        :return: object
+        """
+        return json.loads(data, object_hook=object_hook)
+
+
+class TorskelOrjsonCodec(TorskelStdJsonCodec):
+    """
+    Codec based on orjson. Datetime objects are passed to default hook
+    and non-str keys are allowed, like in stdlib json
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        self.orjson = importlib.import_module('orjson')
+        self.option = self.orjson.OPT_PASSTHROUGH_DATETIME | \
+            self.orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, default=None) -> str:
+        return self.dumps_bytes(obj, default).decode('utf-8')
+
+    def dumps_bytes(self, obj, default=None) -> bytes:
+        return self.orjson.dumps(obj, default=default, option=self.option)
+
+    def loads(self, data, object_hook=None):
+        res = self.orjson.loads(data)
+        return _apply_object_hook(res, object_hook) if object_hook else res
+
+
+class TorskelUjsonCodec(TorskelStdJsonCodec):
+    """
+    Codec based on ujson
+    """
+    name = 'ujson'
+
+    def __init__(self):
+        self.ujson = importlib.import_module('ujson')
+
+    def dumps(self, obj, default=None) -> str:
+        if default is None:
+            return self.ujson.dumps(obj)
+        return self.ujson.dumps(obj, default=default)
+
+    def loads(self, data, object_hook=None):
+        res = self.ujson.loads(data)
+        return _apply_object_hook(res, object_hook) if object_hook else res
+
+
+_codec_classes = {
+    TorskelStdJsonCodec.name: TorskelStdJsonCodec,
+    TorskelOrjsonCodec.name: TorskelOrjsonCodec,
+    TorskelUjsonCodec.name: TorskelUjsonCodec,
+}
+_codecs = {}
+
+
+def register_json_codec(name, codec_class):
+    """
+    Registers codec class, codec must have dumps, dumps_bytes and loads
+    :param name: name for json_codec option
+    :param codec_class: class of codec
+    :return:
+    """
+    _codec_classes[name] = codec_class
+    _codecs.pop(name, None)
+
+
+def _create_codec(name):
+    """
+    Creates codec by name
+    :param name: name of codec or auto
+    :return: codec
+    """
+    if name == JSON_CODEC_AUTO:
+        for codec_name in JSON_CODECS_PRIORITY:
+            try:
+                return _create_codec(codec_name)
+            except ImportError:
+                continue
+    if name not in _codec_classes:
+        raise ValueError(f'Unknown json codec {name}')
+    try:
+        return _codec_classes[name]()
+    except ImportError:
+        raise ImportError(f'Required package {name} is missing')
+
+
+def get_json_codec(name=None):
+    """
+    Returns codec by name, default by json_codec option
+    :param name: name of codec
+    :return: codec
+    """
+    if name is None:
+        name = options.json_codec if 'json_codec' in options \
+            else TorskelStdJsonCodec.name
+    codec = _codecs.get(name)
+    if codec is None:
+        codec = _codecs[name] = _create_codec(name)
+    return codec
+
+
+def json_dumps(obj, default=None) -> str:
+    """
+    Serializes object to JSON string by selected codec
+    :param obj: object
+    :param default: hook for objects which are not serializable
+    :return: str
+    """
+    return get_json_codec().dumps(obj, default)
+
+
+def json_dumps_bytes(obj, default=None) -> bytes:
+    """
+    Serializes object to JSON bytes by selected codec
+    :param obj: object
+    :param default: hook for objects which are not serializable
+    :return: bytes
+    """
+    return get_json_codec().dumps_bytes(obj, default)
+
+
+def json_loads(data, object_hook=None):
+    """
+    Deserializes JSON str or bytes by selected codec
+    :param data: str or bytes
+    :param object_hook: hook for decoded dicts
+    :return: object
+    """
+    return get_json_codec().loads(data, object_hook)
@@ -0,0 +1,112 @@
+"""
+Module contains in-memory LRU cache
+"""
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TorskelLRUCache:
+    """
+    In-memory LRU cache bounded by count of items and by their size.
+    Items can have time to live. on_evict is called with key and value
+    of item evicted by limits
+    """
+
+    def __init__(self, max_items=1024, max_bytes=None, on_evict=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.items = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count_stats=False) is not _MISSING
+
+    def get(self, key, default=None, count_stats=True):
+        """
+        Returns value by key
+        :param key: key
+        :param default: value if key is missing or expired
+        :param count_stats: count hit or miss
+        :return: value
+        """
+        item = self.items.get(key)
+        if item is not None:
+            value, expires_at, _ = item
+            if expires_at is None or expires_at > time.monotonic():
+                self.items.move_to_end(key)
+                if count_stats:
+                    self.hits += 1
+                return value
+            self.delete(key)
+        if count_stats:
+            self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None, size=1):
+        """
+        Puts value into cache
+        :param key: key
+        :param value: value
+        :param ttl: time to live in seconds, None - without expiration
+        :param size: size of value in bytes
+        :return:
+        """
+        self.delete(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self.items[key] = (value, expires_at, size)
+        self.current_bytes += size
+        while len(self.items) > self.max_items or (
+                self.max_bytes is not None
+                and self.current_bytes > self.max_bytes):
+            evicted_key, (evicted, _, evicted_size) = \
+                self.items.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted)
+
+    def delete(self, key):
+        """
+        Removes value from cache
+        :param key: key
+        :return: bool, True if key existed
+        """
+        item = self.items.pop(key, None)
+        if item is None:
+            return False
+        self.current_bytes -= item[2]
+        return True
+
+    def clear(self):
+        """
+        Removes all values
+        :return:
+        """
+        self.items.clear()
+        self.current_bytes = 0
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of cache
+        :return: dict
+        """
+        total = self.hits + self.misses
+        return {
+            'items': len(self.items),
+            'bytes': self.current_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,197 @@
+"""
+Module contains supervisor for running application in several processes
+"""
+import os
+import sys
+import time
+import random
+import signal
+
+import tornado.log
+
+# pylint: disable=C0103
+logger = tornado.log.gen_log
+
+
+def get_workers_count(workers: int) -> int:
+    """
+    Returns count of worker processes
+    :param workers: count from options, 0 or less means count of cpu cores
+    :return: int
+    """
+    if workers is None or workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+class TorskelPreforkSupervisor:
+    """
+    Forks worker processes, restarts them when they die
+    and forwards stop signals to them
+    """
+
+    def __init__(self, num_workers: int, max_restarts: int = 100,
+                 on_handover=None, kill_timeout: int = 60):
+        self.on_handover = on_handover
+        self.kill_timeout = kill_timeout
+        self.num_workers = get_workers_count(num_workers)
+        self.max_restarts = max_restarts
+        self.num_restarts = 0
+        self.children = {}
+        self.stopping = False
+        self.task_id = None
+
+    @property
+    def is_worker(self) -> bool:
+        """
+        Returns True in worker process
+        :return: bool
+        """
+        return self.task_id is not None
+
+    def _init_worker(self, task_id):
+        """
+        Resets parent state in the forked process
+        :param task_id: number of worker
+        :return:
+        """
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        if hasattr(signal, 'SIGUSR2'):
+            # ignored until application sets its handler
+            signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+        random.seed()
+        self.task_id = task_id
+        self.children = {}
+
+    def _start_worker(self, task_id):
+        """
+        Forks one worker process
+        :param task_id: number of worker
+        :return: task_id in worker, None in parent
+        """
+        pid = os.fork()
+        if pid == 0:
+            self._init_worker(task_id)
+            return task_id
+        self.children[pid] = task_id
+        return None
+
+    def send_signal(self, signum):
+        """
+        Sends signal to all workers
+        :param signum: signal number
+        :return:
+        """
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+
+    def _stop_workers(self, signum, _frame):
+        """
+        Signal handler of parent process. Stops workers without restart
+        :param signum: signal number
+        :param _frame: stack frame
+        :return:
+        """
+        logger.info('Got signal %s, stopping workers', signum)
+        self.stopping = True
+        self.send_signal(signum)
+
+    def _terminate_workers(self):
+        """
+        Sends SIGTERM to workers and waits for them, workers which are not
+        stopped in kill_timeout seconds are killed
+        :return:
+        """
+        self.stopping = True
+        self.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + self.kill_timeout
+        while self.children:
+            for pid in list(self.children):
+                try:
+                    res_pid, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    res_pid = pid
+                if res_pid:
+                    self.children.pop(pid, None)
+            if not self.children:
+                break
+            if time.monotonic() >= deadline:
+                logger.error('Killing %s workers not stopped in %ss',
+                             len(self.children), self.kill_timeout)
+                self.send_signal(signal.SIGKILL)
+                for pid in list(self.children):
+                    try:
+                        os.waitpid(pid, 0)
+                    except ChildProcessError:
+                        pass
+                self.children = {}
+                break
+            time.sleep(0.1)
+
+    def _handover(self, signum, frame):
+        """
+        Signal handler of parent process. Starts the new server process,
+        on_handover returns True when it is ready, then stops workers
+        after draining
+        :param signum: signal number
+        :param frame: stack frame
+        :return:
+        """
+        if self.on_handover is not None and not self.on_handover():
+            logger.error('Handover is cancelled, workers are not stopped')
+            return
+        self._stop_workers(signum, frame)
+
+    def start(self) -> int:
+        """
+        Starts workers. Returns only in the worker processes,
+        the parent process waits for workers and exits when all of them
+        are stopped. If workers are restarted more than max_restarts times,
+        the rest of them are stopped and the parent exits with status 1
+        :return: task_id of worker
+        """
+        logger.info('Starting %s worker processes', self.num_workers)
+        for i in range(self.num_workers):
+            task_id = self._start_worker(i)
+            if task_id is not None:
+                return task_id
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._stop_workers)
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2, self._handover)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            task_id = self.children.pop(pid, None)
+            if task_id is None:
+                continue
+            if os.WIFSIGNALED(status):
+                logger.warning('Worker %s (pid %s) killed by signal %s',
+                               task_id, pid, os.WTERMSIG(status))
+            elif os.WEXITSTATUS(status) != 0:
+                logger.warning('Worker %s (pid %s) exited with status %s',
+                               task_id, pid, os.WEXITSTATUS(status))
+            else:
+                logger.info('Worker %s (pid %s) exited normally',
+                            task_id, pid)
+                continue
+            if self.stopping:
+                continue
+            self.num_restarts += 1
+            if self.num_restarts > self.max_restarts:
+                logger.error('Too many worker restarts, giving up')
+                self._terminate_workers()
+                sys.exit(1)
+            new_id = self._start_worker(task_id)
+            if new_id is not None:
+                return new_id
+
+        sys.exit(0)
@@ -0,0 +1,301 @@
+"""
+Module contains distributed rate limiting of handlers by redis
+"""
+import math
+import time
+import asyncio
+import functools
+
+import tornado.log
+from tornado.options import options
+
+from torskel.libs.lru_cache import TorskelLRUCache
+from torskel.libs.prefork import get_workers_count
+
+# pylint: disable=C0103
+logger = tornado.log.gen_log
+
+ALGORITHM_TOKEN_BUCKET = 'token_bucket'
+ALGORITHM_SLIDING_WINDOW = 'sliding_window'
+RATE_LIMIT_KEY_PREFIX = 'torskel:ratelimit:'
+
+# ARGV: refill rate per ms, capacity, cost, cost of locally allowed requests
+# returns: allowed, remaining, retry after in ms.
+# Redis before 5 rejects writes after TIME without effects replication
+TOKEN_BUCKET_SCRIPT = """
+redis.replicate_commands()
+local t = redis.call('time')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local data = redis.call('hmget', KEYS[1], 't', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate) - tonumber(ARGV[4])
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry = math.ceil((cost - tokens) / rate)
+end
+redis.call('hset', KEYS[1], 't', tokens, 'ts', now)
+redis.call('pexpire', KEYS[1], math.ceil(capacity / rate) + 1000)
+return {allowed, math.max(math.floor(tokens), 0), retry}
+"""
+
+# ARGV: window in ms, limit, cost, cost of locally allowed requests.
+# Count is current window plus previous one weighted by its overlap
+# returns: allowed, remaining, retry after in ms
+SLIDING_WINDOW_SCRIPT = """
+redis.replicate_commands()
+local t = redis.call('time')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local start = now - now % window
+local data = redis.call('hmget', KEYS[1], 'w', 'c', 'p')
+local w = tonumber(data[1]) or start
+local current = tonumber(data[2]) or 0
+local previous = tonumber(data[3]) or 0
+if w ~= start then
+    if start - w == window then
+        previous = current
+    else
+        previous = 0
+    end
+    current = 0
+end
+current = current + tonumber(ARGV[4])
+local count = previous * (window - (now - start)) / window + current
+local allowed = 0
+local retry = 0
+if count + cost <= limit then
+    current = current + cost
+    count = count + cost
+    allowed = 1
+else
+    retry = window - (now - start)
+    if previous > 0 then
+        retry = math.min(retry, math.ceil(
+            (count + cost - limit) / previous * window))
+    end
+end
+redis.call('hset', KEYS[1], 'w', start, 'c', current, 'p', previous)
+redis.call('pexpire', KEYS[1], window * 2)
+return {allowed, math.max(math.floor(limit - count), 0), retry}
+"""
+
+
+class TorskelRateLimitState:
+    """
+    Local state of key: last answer of redis and requests allowed
+    without redis since it
+    """
+    __slots__ = ('remaining', 'pending', 'synced_at', 'blocked_until')
+
+    def __init__(self):
+        self.remaining = 0
+        self.pending = 0
+        self.synced_at = 0
+        self.blocked_until = 0
+
+
+class TorskelRateLimiter:
+    """
+    Rate limiter with state in redis: token bucket with capacity burst and
+    refill of limit tokens per period, or sliding window of limit
+    requests per period.
+    Before redis local state is checked: rejected key is rejected until
+    retry time without redis, a key far from limit is allowed without redis
+    while local requests are less than precheck_ratio of remaining ones
+    divided by count of processes sharing limit, so all of them together
+    exceed limit by at most precheck_ratio of remaining requests.
+    These requests are sent to redis with the next check.
+    workers is count of processes sharing limit, default count of workers
+    of this server, with several servers set it to total count
+    """
+
+    def __init__(self, name, limit, period, **kwargs):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.algorithm = kwargs.get('algorithm', ALGORITHM_TOKEN_BUCKET)
+        if self.algorithm not in (ALGORITHM_TOKEN_BUCKET,
+                                  ALGORITHM_SLIDING_WINDOW):
+            raise ValueError(f'Unknown rate limit algorithm {self.algorithm}')
+        self.burst = kwargs.get('burst') or limit
+        self.precheck_ratio = kwargs.get('precheck_ratio', 0.1)
+        self.precheck_ttl = kwargs.get('precheck_ttl', 1)
+        self.workers = kwargs.get('workers')
+        self.states = TorskelLRUCache(max_items=kwargs.get('max_keys', 10000))
+        self.allowed = 0
+        self.rejected = 0
+        self.local_allowed = 0
+        self.local_rejected = 0
+        self.errors = 0
+
+    def _get_script_args(self, cost, pending) -> tuple:
+        """
+        Returns lua script and its arguments
+        :param cost: cost of request
+        :param pending: cost of locally allowed requests
+        :return: tuple
+        """
+        period_ms = int(self.period * 1000)
+        if self.algorithm == ALGORITHM_TOKEN_BUCKET:
+            return TOKEN_BUCKET_SCRIPT, [
+                self.limit / period_ms, self.burst, cost, pending
+            ]
+        return SLIDING_WINDOW_SCRIPT, [period_ms, self.limit, cost, pending]
+
+    def _check_locally(self, state, cost):
+        """
+        Returns result without redis if it is possible
+        :param state: TorskelRateLimitState
+        :param cost: cost of request
+        :return: tuple or None
+        """
+        now = time.monotonic()
+        if state.blocked_until > now:
+            self.local_rejected += 1
+            return False, 0, state.blocked_until - now
+        # options are parsed after creating limiter by decorator
+        workers = self.workers or get_workers_count(options.workers)
+        if now - state.synced_at < self.precheck_ttl \
+                and state.pending + cost <= \
+                state.remaining * self.precheck_ratio / workers:
+            state.pending += cost
+            self.local_allowed += 1
+            return True, state.remaining - state.pending, 0
+        return None
+
+    async def hit(self, redis_app, key, cost=1):
+        """
+        Counts request
+        :param redis_app: application with RedisApplicationMixin
+        :param key: key of client
+        :param cost: cost of request
+        :return: tuple allowed, remaining, retry after in seconds
+        """
+        state = self.states.get(key, count_stats=False)
+        if state is None:
+            state = TorskelRateLimitState()
+            self.states.set(key, state)
+        res = self._check_locally(state, cost)
+        if res is not None:
+            return res
+
+        pending, state.pending = state.pending, 0
+        script, args = self._get_script_args(cost, pending)
+        try:
+            allowed, remaining, retry_ms = await redis_app.eval_redis_script(
+                script, [f'{RATE_LIMIT_KEY_PREFIX}{self.name}:{key}'], args
+            )
+        except Exception as exc:  # pylint: disable=W0703
+            # limiter must not break handlers when redis is unavailable
+            self.errors += 1
+            logger.warning('Rate limiter %s failed: %r', self.name, exc)
+            return True, None, 0
+        state.remaining = remaining
+        state.synced_at = time.monotonic()
+        if allowed:
+            self.allowed += 1
+            return True, remaining, 0
+        self.rejected += 1
+        state.blocked_until = state.synced_at + retry_ms / 1000
+        return False, 0, retry_ms / 1000
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of limiter
+        :return: dict
+        """
+        return {
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+            'local_allowed': self.local_allowed,
+            'local_rejected': self.local_rejected,
+            'errors': self.errors,
+            'keys': len(self.states),
+        }
+
+
+def get_jwt_subject(handler):
+    """
+    Returns subject of JWT token, ip of user if there is no token
+    :param handler: TorskelHandler
+    :return: str
+    """
+    token = handler.get_auth_token()
+    if token:
+        payload = handler.decode_jwt_token(token)
+        if payload.get('result') and payload.get('sub') is not None:
+            return f"sub:{payload['sub']}"
+    return f'ip:{handler.get_user_ip()}'
+
+
+RATE_LIMIT_KEYS = {
+    'ip': lambda handler: f'ip:{handler.get_user_ip()}',
+    'jwt': get_jwt_subject,
+}
+
+
+def rate_limit(limit, period, key='ip', **kwargs):
+    """
+    Decorator of TorskelHandler methods, rejects requests over limit
+    with 429 and Retry-After header before calling method:
+        @rate_limit(100, 60, key='jwt')
+        async def post(self):
+            ...
+    :param limit: requests per period
+    :param period: seconds
+    :param key: ip, jwt (subject of token) or function of handler
+    param algorithm: token_bucket or sliding_window
+    param burst: capacity of token bucket, default limit
+    param cost: cost of request, default 1
+    param name: name of limit, limits with the same name share counters
+    param precheck_ratio: share of remaining requests which are allowed
+     without redis by all processes, 0 - check every request in redis
+    param workers: count of processes sharing limit, default workers option
+    param max_in_flight: reject with 503 when application has more
+     requests in progress
+    :return: decorator
+    """
+    get_key = RATE_LIMIT_KEYS[key] if isinstance(key, str) else key
+    cost = kwargs.pop('cost', 1)
+    name = kwargs.pop('name', None)
+    max_in_flight = kwargs.pop('max_in_flight', None)
+
+    def decorator(method):
+        limiter = TorskelRateLimiter(
+            name or method.__qualname__, limit, period, **kwargs
+        )
+
+        @functools.wraps(method)
+        async def wrapper(handler, *args, **method_kwargs):
+            if max_in_flight is not None and \
+                    handler.application.requests_in_flight > max_in_flight:
+                handler.set_status(503)
+                handler.set_header('Retry-After', 1)
+                return handler.finish()
+            allowed, remaining, retry_after = await limiter.hit(
+                handler.application, get_key(handler), cost
+            )
+            handler.set_header('X-RateLimit-Limit', limit)
+            if remaining is not None:
+                handler.set_header('X-RateLimit-Remaining', remaining)
+            if not allowed:
+                handler.set_status(429)
+                handler.set_header('Retry-After', math.ceil(retry_after))
+                return handler.finish()
+            res = method(handler, *args, **method_kwargs)
+            if asyncio.iscoroutine(res) or asyncio.isfuture(res):
+                res = await res
+            return res
+        wrapper.rate_limiter = limiter
+        return wrapper
+    return decorator
@@ -0,0 +1,182 @@
+"""
+Module contains codec of values stored in redis: JSON or msgpack with
+optional compression. Encoded value starts with header byte
+0x10 | format << 2 | compression, values without header are plain JSON
+written by previous versions, so both can be read during migration
+"""
+import zlib
+import importlib
+
+from torskel.libs.json_codec import json_dumps_bytes
+from torskel.libs.json_codec import json_loads
+
+VALUE_FORMAT_LEGACY = 'legacy'
+VALUE_FORMAT_JSON = 'json'
+VALUE_FORMAT_MSGPACK = 'msgpack'
+VALUE_FORMATS = (VALUE_FORMAT_JSON, VALUE_FORMAT_MSGPACK)
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_LZ4 = 'lz4'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_LZ4,
+                COMPRESSION_ZSTD)
+
+HEADER_BASE = 0x10
+HEADER_MASK = 0xF0
+
+
+def _import(module_name, package_name):
+    """
+    Imports optional package
+    :param module_name: name of module
+    :param package_name: name of package for pip
+    :return: module
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise ImportError(f'Required package {package_name} is missing')
+
+
+def is_encoded(data) -> bool:
+    """
+    Returns True if value has header of codec
+    :param data: bytes
+    :return: bool
+    """
+    return bool(data) and data[0] & HEADER_MASK == HEADER_BASE
+
+
+class TorskelRedisValueCodec:
+    """
+    Encodes values in value_format, compresses them if they are not less
+    than threshold bytes. Values in any format and compression are decoded
+    """
+
+    def __init__(self, value_format=VALUE_FORMAT_LEGACY,
+                 compression=COMPRESSION_NONE, threshold=1024):
+        if value_format not in VALUE_FORMATS + (VALUE_FORMAT_LEGACY,):
+            raise ValueError(f'Unknown redis value format {value_format}')
+        if compression not in COMPRESSIONS:
+            raise ValueError(f'Unknown redis compression {compression}')
+        self.value_format = value_format
+        self.compression = compression
+        self.threshold = threshold
+        self.modules = {}
+        # check that optional packages are installed on start
+        if value_format == VALUE_FORMAT_MSGPACK:
+            self._get_module(VALUE_FORMAT_MSGPACK)
+        if compression in (COMPRESSION_LZ4, COMPRESSION_ZSTD):
+            self._get_module(compression)
+
+    def _get_module(self, name):
+        """
+        Returns module of optional format or compression
+        :param name: msgpack, lz4 or zstd
+        :return: module
+        """
+        module = self.modules.get(name)
+        if module is None:
+            if name == VALUE_FORMAT_MSGPACK:
+                module = _import('msgpack', 'msgpack')
+            elif name == COMPRESSION_LZ4:
+                module = _import('lz4.frame', 'lz4')
+            else:
+                module = _import('zstandard', 'zstandard')
+            self.modules[name] = module
+        return module
+
+    def _dumps(self, val, default=None) -> bytes:
+        """
+        Serializes value
+        :param val: value
+        :param default: hook for objects which are not serializable
+        :return: bytes
+        """
+        if self.value_format == VALUE_FORMAT_MSGPACK:
+            return self._get_module(VALUE_FORMAT_MSGPACK).packb(
+                val, default=default, use_bin_type=True
+            )
+        return json_dumps_bytes(val, default=default)
+
+    def _loads(self, value_format, data, object_hook=None):
+        """
+        Deserializes value
+        :param value_format: json or msgpack
+        :param data: bytes
+        :param object_hook: hook for decoded dicts
+        :return: value
+        """
+        if value_format == VALUE_FORMAT_MSGPACK:
+            return self._get_module(VALUE_FORMAT_MSGPACK).unpackb(
+                data, raw=False, object_hook=object_hook,
+                strict_map_key=False
+            )
+        return json_loads(data, object_hook=object_hook)
+
+    def _compress(self, compression, data) -> bytes:
+        """
+        Compresses data
+        :param compression: zlib, lz4 or zstd
+        :param data: bytes
+        :return: bytes
+        """
+        if compression == COMPRESSION_ZLIB:
+            return zlib.compress(data)
+        if compression == COMPRESSION_LZ4:
+            return self._get_module(COMPRESSION_LZ4).compress(data)
+        return self._get_module(COMPRESSION_ZSTD).ZstdCompressor().compress(
+            data
+        )
+
+    def _decompress(self, compression, data) -> bytes:
+        """
+        Decompresses data
+        :param compression: zlib, lz4 or zstd
+        :param data: bytes
+        :return: bytes
+        """
+        if compression == COMPRESSION_ZLIB:
+            return zlib.decompress(data)
+        if compression == COMPRESSION_LZ4:
+            return self._get_module(COMPRESSION_LZ4).decompress(data)
+        return self._get_module(COMPRESSION_ZSTD).ZstdDecompressor(
+        ).decompress(data)
+
+    def encode(self, val, default=None) -> bytes:
+        """
+        Encodes value
+        :param val: value
+        :param default: hook for objects which are not serializable
+        :return: bytes
+        """
+        data = self._dumps(val, default)
+        if self.value_format == VALUE_FORMAT_LEGACY:
+            return data
+        compression = COMPRESSION_NONE
+        if self.compression != COMPRESSION_NONE \
+                and len(data) >= self.threshold:
+            compressed = self._compress(self.compression, data)
+            if len(compressed) < len(data):
+                data, compression = compressed, self.compression
+        header = HEADER_BASE | VALUE_FORMATS.index(self.value_format) << 2 \
+            | COMPRESSIONS.index(compression)
+        return bytes((header,)) + data
+
+    def decode(self, data, object_hook=None):
+        """
+        Decodes value with header or plain JSON value
+        :param data: bytes
+        :param object_hook: hook for decoded dicts
+        :return: value
+        """
+        if not is_encoded(data):
+            return json_loads(data, object_hook=object_hook)
+        header = data[0]
+        compression = COMPRESSIONS[header & 0x03]
+        data = data[1:]
+        if compression != COMPRESSION_NONE:
+            data = self._decompress(compression, data)
+        return self._loads(VALUE_FORMATS[header >> 2 & 0x03], data,
+                           object_hook)
@@ -0,0 +1,358 @@
+"""
+Module contains queue of background jobs on redis streams
+"""
+import os
+import time
+import socket
+import asyncio
+
+import tornado.log
+
+from torskel.libs.json_codec import json_dumps_bytes
+from torskel.libs.json_codec import json_loads
+from torskel.libs.redis_shards import get_related_key
+
+# pylint: disable=C0103
+logger = tornado.log.gen_log
+
+JOB_QUEUE_KEY_PREFIX = 'torskel:jobs:'
+
+
+def get_consumer_name() -> str:
+    """
+    Returns name of consumer unique in cluster
+    :return: str
+    """
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def _to_str(val) -> str:
+    """
+    Returns str of redis reply
+    :param val: bytes or str
+    :return: str
+    """
+    return val.decode('utf-8') if isinstance(val, bytes) else val
+
+
+class TorskelJobQueue:
+    """
+    Queue of jobs in redis stream read by consumer group. Job is acked
+    after success, failed job stays pending and is claimed again after
+    retry_delay seconds, also jobs of crashed workers. After max_attempts
+    job is moved into dead-letter stream {key}:dead
+    """
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+        self.key = f'{JOB_QUEUE_KEY_PREFIX}{name}'
+        self.dead_key = get_related_key(self.key, 'dead')
+        self.group = kwargs.get('group', 'torskel')
+        self.max_attempts = kwargs.get('max_attempts', 3)
+        self.job_timeout = kwargs.get('job_timeout', 30)
+        self.retry_delay = kwargs.get('retry_delay', 60)
+        if self.retry_delay <= self.job_timeout:
+            raise ValueError('retry_delay must be greater than job_timeout, '
+                             'otherwise running jobs are claimed again')
+        self.max_len = kwargs.get('max_len')
+        self.jobs = {}
+
+    def job(self, name=None):
+        """
+        Decorator which registers coroutine function as job:
+            @queue.job('send_mail')
+            async def send_mail(app, payload):
+                ...
+        :param name: name of job, default name of function
+        :return: decorator
+        """
+        def decorator(func):
+            self.jobs[name or func.__name__] = func
+            return func
+        return decorator
+
+    async def enqueue(self, redis_app, job, payload=None) -> str:
+        """
+        Adds job into queue
+        :param redis_app: application with RedisApplicationMixin
+        :param job: name of job
+        :param payload: JSON serializable arguments of job
+        :return: id of job
+        """
+        pool = await redis_app.get_redis_pool()
+        args = [self.key]
+        if self.max_len:
+            args.extend(('MAXLEN', '~', self.max_len))
+        args.extend(('*', 'job', job, 'payload', json_dumps_bytes(payload),
+                     'enqueued_at', time.time()))
+        return _to_str(await pool.execute('xadd', *args))
+
+    async def create_group(self, redis_app):
+        """
+        Creates consumer group and stream if they do not exist,
+        group reads jobs added before its creation too
+        :param redis_app: application with RedisApplicationMixin
+        :return:
+        """
+        pool = await redis_app.get_redis_pool()
+        try:
+            await pool.execute('xgroup', 'CREATE', self.key, self.group, '0',
+                               'MKSTREAM')
+        except Exception as exc:  # pylint: disable=W0703
+            if 'BUSYGROUP' not in str(exc):
+                raise
+
+    async def get_stats(self, redis_app) -> dict:
+        """
+        Returns lengths of queue and dead-letter stream and count of
+        pending jobs
+        :param redis_app: application with RedisApplicationMixin
+        :return: dict
+        """
+        async with redis_app.redis_pipeline() as pipeline:
+            pipeline.execute_command('xlen', self.key)
+            pipeline.execute_command('xlen', self.dead_key)
+            pipeline.execute_command('xpending', self.key, self.group)
+        length, dead, pending = pipeline.results
+        return {'length': length, 'dead': dead, 'pending': pending[0]}
+
+
+class TorskelJobWorker:
+    """
+    Consumer of job queue, runs up to concurrency jobs at the same time.
+    New jobs are read by blocking XREADGROUP on dedicated connection,
+    pending jobs of failed attempts are claimed every claim_interval seconds
+    """
+
+    def __init__(self, redis_app, queue, **kwargs):
+        self.redis_app = redis_app
+        self.queue = queue
+        self.consumer = kwargs.get('consumer') or get_consumer_name()
+        self.concurrency = kwargs.get('concurrency', 10)
+        self.block_timeout = kwargs.get('block_timeout', 5)
+        self.claim_interval = kwargs.get('claim_interval',
+                                         queue.retry_delay / 4)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.running = set()
+        self.tasks = []
+        self.conn = None
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.dead = 0
+
+    def start(self):
+        """
+        Starts reading and claiming jobs
+        :return:
+        """
+        if not self.tasks:
+            self.tasks = [asyncio.ensure_future(self.read_jobs()),
+                          asyncio.ensure_future(self.claim_jobs())]
+
+    async def stop(self, timeout=None):
+        """
+        Stops reading jobs and waits running ones, jobs which are not
+        finished in timeout are cancelled and claimed later by other workers
+        :param timeout: seconds, default job_timeout of queue
+        :return:
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.running:
+            _, not_done = await asyncio.wait(
+                self.running, timeout=timeout or self.queue.job_timeout
+            )
+            for task in not_done:
+                task.cancel()
+
+    async def _wait_slots(self) -> int:
+        """
+        Waits free slot, returns count of free slots
+        :return: int
+        """
+        await self.semaphore.acquire()
+        self.semaphore.release()
+        return max(self.concurrency - len(self.running), 1)
+
+    async def read_jobs(self):
+        """
+        Reads new jobs while worker is not stopped
+        :return:
+        """
+        delay = 0.1
+        while True:
+            try:
+                if self.conn is None or self.conn.closed:
+                    await self.queue.create_group(self.redis_app)
+                    self.conn = await self.redis_app.create_redis_connection(
+                        self.queue.key
+                    )
+                count = await self._wait_slots()
+                reply = await self.conn.execute(
+                    'xreadgroup', 'GROUP', self.queue.group,
+                    self.consumer, 'COUNT', count,
+                    'BLOCK', int(self.block_timeout * 1000),
+                    'STREAMS', self.queue.key, '>'
+                )
+                delay = 0.1
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pylint: disable=W0703
+                logger.warning('Job queue %s read error: %r',
+                               self.queue.name, exc)
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+                continue
+            for _, messages in reply or []:
+                for job_id, fields in messages:
+                    await self.run_job(job_id, fields, 1)
+
+    async def claim_jobs(self):
+        """
+        Claims jobs pending longer than retry_delay, moves jobs without
+        attempts left into dead-letter stream
+        :return:
+        """
+        retry_delay_ms = int(self.queue.retry_delay * 1000)
+        while True:
+            await asyncio.sleep(self.claim_interval)
+            try:
+                pool = await self.redis_app.get_redis_pool()
+                pending = await pool.execute(
+                    'xpending', self.queue.key, self.queue.group,
+                    '-', '+', self.concurrency * 10
+                )
+                for job_id, _, idle, attempts in pending:
+                    if idle < retry_delay_ms:
+                        continue
+                    claimed = await pool.execute(
+                        'xclaim', self.queue.key, self.queue.group,
+                        self.consumer, retry_delay_ms, job_id
+                    )
+                    # job is claimed by other worker or deleted
+                    if not claimed or claimed[0][1] is None:
+                        continue
+                    fields = claimed[0][1]
+                    if attempts >= self.queue.max_attempts:
+                        await self.move_to_dead(job_id, fields, attempts,
+                                                'no attempts left')
+                        continue
+                    self.retried += 1
+                    await self.run_job(job_id, fields, attempts + 1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pylint: disable=W0703
+                logger.warning('Job queue %s claim error: %r',
+                               self.queue.name, exc)
+
+    async def run_job(self, job_id, fields, attempt):
+        """
+        Starts job when slot is free
+        :param job_id: id of message
+        :param fields: fields of message
+        :param attempt: number of attempt
+        :return:
+        """
+        await self.semaphore.acquire()
+        task = asyncio.ensure_future(
+            self._run_job(job_id, fields, attempt)
+        )
+        self.running.add(task)
+        task.add_done_callback(self._job_done)
+
+    def _job_done(self, task):
+        """
+        Releases slot of finished job
+        :param task: task of job
+        :return:
+        """
+        self.running.discard(task)
+        self.semaphore.release()
+
+    async def _run_job(self, job_id, fields, attempt):
+        """
+        Runs job, acks it on success
+        :param job_id: id of message
+        :param fields: fields of message
+        :param attempt: number of attempt
+        :return:
+        """
+        fields = dict(zip(fields[::2], fields[1::2]))
+        job = _to_str(fields.get(b'job', b''))
+        func = self.queue.jobs.get(job)
+        try:
+            if func is None:
+                raise ValueError(f'Unknown job {job}')
+            await asyncio.wait_for(
+                func(self.redis_app, json_loads(fields[b'payload'])),
+                self.queue.job_timeout
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # pylint: disable=W0703
+            self.failed += 1
+            logger.warning('Job %s %s attempt %s failed: %r',
+                           job, _to_str(job_id), attempt, exc)
+            if attempt >= self.queue.max_attempts or func is None:
+                await self.move_to_dead(job_id, fields, attempt, repr(exc))
+            return
+        await self.ack(job_id)
+        self.processed += 1
+
+    async def ack(self, job_id):
+        """
+        Acks job and deletes it from stream
+        :param job_id: id of message
+        :return:
+        """
+        async with self.redis_app.redis_pipeline(True) as pipeline:
+            pipeline.execute_command('xack', self.queue.key,
+                                     self.queue.group, job_id)
+            pipeline.execute_command('xdel', self.queue.key, job_id)
+
+    async def move_to_dead(self, job_id, fields, attempts, error):
+        """
+        Moves job into dead-letter stream
+        :param job_id: id of message
+        :param fields: fields of message, list or dict
+        :param attempts: count of attempts
+        :param error: description of last error
+        :return:
+        """
+        if isinstance(fields, dict):
+            fields = [item for pair in fields.items() for item in pair]
+        self.dead += 1
+        logger.error('Job %s is moved to dead-letter stream %s: %s',
+                     _to_str(job_id), self.queue.dead_key, error)
+        async with self.redis_app.redis_pipeline(True) as pipeline:
+            pipeline.execute_command(
+                'xadd', self.queue.dead_key, '*', *fields, 'id', job_id,
+                'attempts', attempts, 'error', error,
+                'consumer', self.consumer
+            )
+            pipeline.execute_command('xack', self.queue.key,
+                                     self.queue.group, job_id)
+            pipeline.execute_command('xdel', self.queue.key, job_id)
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of worker
+        :return: dict
+        """
+        return {
+            'consumer': self.consumer,
+            'running': len(self.running),
+            'processed': self.processed,
+            'failed': self.failed,
+            'retried': self.retried,
+            'dead': self.dead,
+        }
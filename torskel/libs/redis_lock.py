@@ -0,0 +1,100 @@
+"""
+Module contains redis lock with fencing token and XFetch early expiration
+"""
+import math
+import random
+import time
+
+from torskel.libs.redis_shards import get_related_key
+
+# takes lock with new token from monotonic counter
+ACQUIRE_SCRIPT = """
+local token = redis.call('incr', KEYS[2])
+if redis.call('set', KEYS[1], token, 'NX', 'PX', ARGV[1]) then
+    return token
+end
+return false
+"""
+
+# writes value only while lock is held by the token, then releases lock
+SET_IF_OWNER_SCRIPT = """
+if redis.call('get', KEYS[2]) == ARGV[1] then
+    redis.call('set', KEYS[1], ARGV[2], 'PX', ARGV[3])
+    redis.call('del', KEYS[2])
+    return 1
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def is_early_expired(delta, expires_at, beta=1.0) -> bool:
+    """
+    XFetch: returns True if value must be recomputed now. Probability grows
+    when expiration comes closer and when computing takes longer
+    :param delta: seconds spent on computing value
+    :param expires_at: timestamp of expiration
+    :param beta: > 1 favors earlier recomputing
+    :return: bool
+    """
+    return time.time() - delta * beta * math.log(1 - random.random()) \
+        >= expires_at
+
+
+class TorskelRedisLock:
+    """
+    Redis lock with fencing token. Value guarded by lock is written only
+    if lock was not lost by timeout and taken by other owner.
+    Tokens are taken from counter stored on the same shard as lock
+    """
+
+    def __init__(self, redis_app, name, timeout=5000):
+        self.redis_app = redis_app
+        self.name = name
+        self.fence_key = get_related_key(name, 'fence')
+        self.timeout = timeout
+        self.token = None
+
+    async def acquire(self):
+        """
+        Tries to take lock without waiting
+        :return: fencing token or None if lock is taken by other owner
+        """
+        self.token = await self.redis_app.eval_redis_script(
+            ACQUIRE_SCRIPT, [self.name, self.fence_key], [self.timeout]
+        )
+        return self.token
+
+    async def set_val(self, key, val, exp_ms) -> bool:
+        """
+        Writes value and releases lock if lock is still owned
+        :param key: key
+        :param val: encoded value
+        :param exp_ms: expire time in milliseconds
+        :return: bool, False if lock was lost
+        """
+        res = await self.redis_app.eval_redis_script(
+            SET_IF_OWNER_SCRIPT, [key, self.name],
+            [self.token, val, exp_ms]
+        )
+        self.token = None
+        return bool(res)
+
+    async def release(self) -> bool:
+        """
+        Releases lock if it is still owned
+        :return: bool
+        """
+        if self.token is None:
+            return False
+        res = await self.redis_app.eval_redis_script(
+            RELEASE_SCRIPT, [self.name], [self.token]
+        )
+        self.token = None
+        return bool(res)
@@ -0,0 +1,94 @@
+"""
+Module contains in-process cache of decoded redis values
+"""
+from torskel.libs.lru_cache import TorskelLRUCache
+
+
+class TorskelRedisNearCache:
+    """
+    Bounded in-process LRU cache with TTL in front of redis.
+    Values are stored decoded, together with decoding flags, so the same key
+    read with other flags is a miss. Values are shared between callers and
+    must not be modified.
+    Cache serves values only while it is online, i.e. while invalidation
+    messages from other workers are being received
+    """
+
+    def __init__(self, max_items=10000, ttl=5):
+        self.cache = TorskelLRUCache(max_items=max_items)
+        self.ttl = ttl
+        self.generation = 0
+        self.invalidations = 0
+        self.is_online = False
+
+    @staticmethod
+    def get_key(key) -> str:
+        """
+        Returns key of cache, redis keys can be str or bytes
+        :param key: redis key
+        :return: str
+        """
+        return key.decode('utf-8') if isinstance(key, bytes) else str(key)
+
+    def get(self, key, variant, default=None):
+        """
+        Returns decoded value by key
+        :param key: redis key
+        :param variant: decoding flags
+        :param default: value if key is missing
+        :return: value
+        """
+        if self.is_online:
+            item = self.cache.get(self.get_key(key), count_stats=False)
+            if item is not None and item[0] == variant:
+                self.cache.hits += 1
+                return item[1]
+        self.cache.misses += 1
+        return default
+
+    def store(self, key, variant, value, generation):
+        """
+        Stores decoded value. Value is not stored if any key was invalidated
+        after generation was taken, because it could be read before change
+        :param key: redis key
+        :param variant: decoding flags
+        :param value: decoded value
+        :param generation: generation taken before reading from redis
+        :return:
+        """
+        if self.is_online and generation == self.generation:
+            self.cache.set(self.get_key(key), (variant, value), self.ttl)
+
+    def invalidate(self, keys):
+        """
+        Removes values by keys
+        :param keys: list of redis keys
+        :return:
+        """
+        self.generation += 1
+        for key in keys:
+            if self.cache.delete(self.get_key(key)):
+                self.invalidations += 1
+
+    def set_online(self, is_online):
+        """
+        Switches serving of values, cache is cleared on every switch because
+        invalidation messages could be lost
+        :param is_online: bool
+        :return:
+        """
+        self.is_online = is_online
+        self.generation += 1
+        self.cache.clear()
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of cache
+        :return: dict
+        """
+        stats = self.cache.get_stats()
+        stats.update({
+            'invalidations': self.invalidations,
+            'online': self.is_online,
+        })
+        return stats
@@ -0,0 +1,163 @@
+"""
+Module contains pipeline of redis commands
+"""
+import asyncio
+from functools import partial
+
+from torskel.libs.redis_shards import TorskelShardedRedisPool
+from torskel.libs.redis_shards import get_command_keys
+
+
+# pylint: disable=W0212
+class TorskelRedisPipeline:
+    """
+    Collects redis commands and sends them through one connection
+    in one round-trip per shard, optionally as MULTI/EXEC transaction.
+    Keys changed by set_val and del_val are invalidated in near caches
+    """
+
+    def __init__(self, redis_app, transaction=False):
+        self.redis_app = redis_app
+        self.transaction = transaction
+        self.commands = []
+        self.changed_keys = []
+        self.results = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.results = await self.execute()
+
+    def execute_command(self, command, *args, decoder=None):
+        """
+        Adds command into pipeline
+        :param command: redis command
+        :param args: arguments of command
+        :param decoder: function for decoding result
+        :return:
+        """
+        self.commands.append((command, args, decoder))
+
+    def set_val(self, key, val, exp=None, **kwargs):
+        """
+        Adds SET with EX into pipeline
+        :param key: key
+        :param val: value
+        :param exp: Expire time in seconds
+        param convert_to_json: bool
+        param use_json_utils: bool use json utils from bson
+        :return:
+        """
+        val = self.redis_app._encode_redis_val(val, **kwargs)
+        self.changed_keys.append(key)
+        self.execute_command(
+            'set', *self.redis_app._get_set_args(key, val, exp)
+        )
+
+    def get_val(self, key, **kwargs):
+        """
+        Adds GET into pipeline
+        :param key: key
+        param from_json: loads from json
+        param use_json_utils: bool use json utils from bson
+        :return:
+        """
+        self.execute_command('get', key, decoder=partial(
+            self.redis_app._decode_redis_val, **kwargs
+        ))
+
+    def del_val(self, *keys):
+        """
+        Adds DEL into pipeline
+        :param keys: keys
+        :return:
+        """
+        self.changed_keys.extend(keys)
+        self.execute_command('del', *keys)
+
+    def expire(self, key, exp):
+        """
+        Adds EXPIRE into pipeline
+        :param key: key
+        :param exp: Expire time in seconds
+        :return:
+        """
+        self.execute_command('expire', key, exp)
+
+    async def _execute_on_pool(self, pool, commands) -> list:
+        """
+        Sends commands through one connection of pool
+        :param pool: redis pool
+        :param commands: list of commands
+        :return: list of results
+        """
+        async with pool.get() as conn:
+            futures = [conn.execute('multi')] if self.transaction else []
+            futures.extend(conn.execute(command, *args)
+                           for command, args, _ in commands)
+            if self.transaction:
+                futures.append(conn.execute('exec'))
+                return (await asyncio.gather(*futures))[-1]
+            return await asyncio.gather(*futures)
+
+    async def _execute_sharded(self, pool, commands) -> list:
+        """
+        Sends commands to their shards concurrently, every command must
+        have its keys on one shard, transaction must be on one shard
+        :param pool: TorskelShardedRedisPool
+        :param commands: list of commands
+        :return: list of results
+        """
+        groups = {}
+        for i, (command, args, _) in enumerate(commands):
+            node = pool.get_node(get_command_keys(command, args))
+            groups.setdefault(node, []).append(i)
+        if self.transaction and len(groups) > 1:
+            raise ValueError('Keys of transaction are on different shards, '
+                             'use hash tags')
+        groups_results = await asyncio.gather(*[
+            self._execute_on_pool(pool.pools[node],
+                                  [commands[i] for i in indexes])
+            for node, indexes in groups.items()
+        ])
+        results = [None] * len(commands)
+        for indexes, node_results in zip(groups.values(), groups_results):
+            for i, res in zip(indexes, node_results):
+                results[i] = res
+        return results
+
+    async def execute(self) -> list:
+        """
+        Sends collected commands
+        :return: list of results in order of commands
+        """
+        commands, self.commands = self.commands, []
+        changed_keys, self.changed_keys = self.changed_keys, []
+        if not commands:
+            return []
+        near_cache = self.redis_app.redis_near_cache
+        invalidation = []
+        if near_cache is not None and changed_keys:
+            # published on the same connection after the changes,
+            # so other workers can not read old values after invalidation
+            invalidation.append(('publish', (
+                self.redis_app.get_redis_invalidation_message(changed_keys)
+            ), None))
+        pool = await self.redis_app.get_redis_pool()
+        if isinstance(pool, TorskelShardedRedisPool):
+            results = await self._execute_sharded(pool, commands)
+            if invalidation:
+                # after changes on all shards
+                await pool.execute('publish', *invalidation[0][1])
+        else:
+            results = await self._execute_on_pool(
+                pool, commands + invalidation
+            )
+        if invalidation:
+            near_cache.invalidate(changed_keys)
+        return [
+            decoder(res) if decoder is not None else res
+            for res, (_, _, decoder) in zip(results, commands)
+        ]
@@ -0,0 +1,106 @@
+"""
+Module contains redis pool with acquire statistics and health state of pools
+"""
+import time
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_redis_pool_class(aioredis):
+    """
+    Returns aioredis pool class which counts time of waiting for
+    free connection
+    :param aioredis: aioredis module
+    :return: class
+    """
+    class TorskelRedisConnectionsPool(aioredis.ConnectionsPool):
+        """
+        aioredis pool with acquire statistics
+        """
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.acquires = 0
+            self.wait_time = 0.0
+            self.max_wait_time = 0.0
+
+        async def acquire(self, command=None, args=()):
+            started = time.monotonic()
+            conn = await super().acquire(command, args)
+            wait_time = time.monotonic() - started
+            self.acquires += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            return conn
+
+    return TorskelRedisConnectionsPool
+
+
+def get_redis_pool_stats(pool) -> dict:
+    """
+    Returns sizes of aioredis pool and time of waiting for connection
+    :param pool: aioredis pool
+    :return: dict
+    """
+    acquires = getattr(pool, 'acquires', 0)
+    wait_time = getattr(pool, 'wait_time', 0.0)
+    return {
+        'size': pool.size,
+        'free': pool.freesize,
+        'in_use': pool.size - pool.freesize,
+        'min_size': pool.minsize,
+        'max_size': pool.maxsize,
+        'closed': pool.closed,
+        'acquires': acquires,
+        'avg_wait_time': wait_time / acquires if acquires else 0.0,
+        'max_wait_time': getattr(pool, 'max_wait_time', 0.0),
+    }
+
+
+class TorskelRedisHealth:
+    """
+    Health state of redis by periodic checks
+    """
+
+    def __init__(self):
+        self.is_healthy = False
+        self.checks = 0
+        self.failures = 0
+        self.connects = 0
+        self.last_error = None
+        self.last_latency = None
+
+    def record_success(self, latency):
+        """
+        Records successful check
+        :param latency: seconds
+        :return:
+        """
+        self.checks += 1
+        self.is_healthy = True
+        self.last_latency = latency
+
+    def record_failure(self, error):
+        """
+        Records failed check or connection
+        :param error: exception
+        :return:
+        """
+        self.checks += 1
+        self.failures += 1
+        self.is_healthy = False
+        self.last_error = repr(error)
+
+    def get_stats(self) -> dict:
+        """
+        Returns health counters
+        :return: dict
+        """
+        return {
+            'healthy': self.is_healthy,
+            'checks': self.checks,
+            'failures': self.failures,
+            'connects': self.connects,
+            'last_error': self.last_error,
+            'last_latency': self.last_latency,
+        }
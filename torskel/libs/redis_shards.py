@@ -0,0 +1,190 @@
+"""
+Module contains client-side sharding of redis by consistent hashing
+"""
+import asyncio
+import hashlib
+from bisect import bisect
+
+# commands with any number of keys, split by shards and merged back
+SPLIT_COMMANDS = frozenset(('mget', 'del', 'unlink', 'exists', 'touch'))
+# commands without keys, sent to the first node
+NO_KEY_COMMANDS = frozenset(('publish', 'ping', 'info', 'time'))
+
+
+def parse_redis_node(node):
+    """
+    Returns address of redis node for aioredis
+    :param node: host:port, redis:// url or path of unix socket
+    :return: str or tuple
+    """
+    if node.startswith('/') or '://' in node:
+        return node
+    host, _, port = node.rpartition(':')
+    return host, int(port)
+
+
+def get_hash_tag(key) -> bytes:
+    """
+    Returns part of key which is hashed: content of first {...} if it is
+    not empty, else the whole key, as in Redis Cluster
+    :param key: str or bytes
+    :return: bytes
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    start = key.find(b'{')
+    if start != -1:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def get_related_key(key, suffix) -> str:
+    """
+    Returns key which is stored on the same shard as key
+    :param key: key
+    :param suffix: suffix of related key
+    :return: str
+    """
+    if isinstance(key, bytes):
+        key = key.decode('utf-8')
+    if get_hash_tag(key) != key.encode('utf-8'):
+        return f'{key}:{suffix}'
+    return f'{{{key}}}:{suffix}'
+
+
+def get_command_keys(command, args) -> list:
+    """
+    Returns keys of redis command
+    :param command: command
+    :param args: arguments of command
+    :return: list
+    """
+    command = command.lower()
+    if command in SPLIT_COMMANDS:
+        return list(args)
+    if command in ('eval', 'evalsha'):
+        return list(args[2:2 + int(args[1])])
+    if command in ('xgroup', 'xinfo'):
+        return list(args[1:2])
+    if command in NO_KEY_COMMANDS or not args:
+        return []
+    return [args[0]]
+
+
+def _hash(value) -> int:
+    """
+    Returns position on ring
+    :param value: bytes
+    :return: int
+    """
+    return int.from_bytes(hashlib.md5(value).digest()[:8], 'big')
+
+
+class TorskelHashRing:
+    """
+    Consistent hashing ring with virtual nodes. Adding or removing
+    a node moves about 1/N of keys
+    """
+
+    def __init__(self, nodes, vnodes=160):
+        self.nodes = list(nodes)
+        self.vnodes = vnodes
+        points = sorted(
+            (_hash(f'{node}#{i}'.encode('utf-8')), node)
+            for node in self.nodes for i in range(vnodes)
+        )
+        self.hashes = [point for point, _ in points]
+        self.ring = [node for _, node in points]
+
+    def get_node(self, key):
+        """
+        Returns node of key
+        :param key: str or bytes
+        :return: node
+        """
+        index = bisect(self.hashes, _hash(get_hash_tag(key)))
+        return self.ring[index % len(self.ring)]
+
+
+class TorskelShardedRedisPool:
+    """
+    Set of redis pools with the execute interface of aioredis pool.
+    Commands are routed by their keys, keys of MGET, DEL, EXISTS are split
+    by shards and executed concurrently. Other commands with several keys
+    must have them on one shard, use hash tags: {user:1}:name
+    """
+
+    def __init__(self, pools: dict, vnodes=160):
+        self.pools = pools
+        self.hash_ring = TorskelHashRing(pools, vnodes)
+        self.default_node = self.hash_ring.nodes[0]
+
+    def get_node(self, keys):
+        """
+        Returns node of keys
+        :param keys: list of keys
+        :return: node
+        """
+        if not keys:
+            return self.default_node
+        nodes = {self.hash_ring.get_node(key) for key in keys}
+        if len(nodes) > 1:
+            raise ValueError(f'Keys {keys} are on different shards, '
+                             f'use hash tags')
+        return nodes.pop()
+
+    def group_keys(self, keys) -> dict:
+        """
+        Returns indexes of keys by nodes
+        :param keys: list of keys
+        :return: dict node - list of indexes
+        """
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self.hash_ring.get_node(key), []).append(i)
+        return groups
+
+    async def execute(self, command, *args):
+        """
+        Executes command on shards of its keys
+        :param command: redis command
+        :param args: arguments
+        :return: result
+        """
+        keys = get_command_keys(command, args)
+        if command.lower() not in SPLIT_COMMANDS or len(keys) < 2:
+            return await self.pools[self.get_node(keys)].execute(
+                command, *args
+            )
+        groups = self.group_keys(keys)
+        if len(groups) == 1:
+            return await self.pools[next(iter(groups))].execute(
+                command, *args
+            )
+        results = await asyncio.gather(*[
+            self.pools[node].execute(command, *[keys[i] for i in indexes])
+            for node, indexes in groups.items()
+        ])
+        if command.lower() != 'mget':
+            return sum(results)
+        merged = [None] * len(keys)
+        for indexes, values in zip(groups.values(), results):
+            for i, value in zip(indexes, values):
+                merged[i] = value
+        return merged
+
+    def close(self):
+        """
+        Closes all pools
+        """
+        for pool in self.pools.values():
+            pool.close()
+
+    async def wait_closed(self):
+        """
+        Waits closing of all pools
+        """
+        await asyncio.gather(*[pool.wait_closed()
+                               for pool in self.pools.values()])
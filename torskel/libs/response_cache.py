@@ -0,0 +1,349 @@
+"""
+Module contains cache of full responses of request handlers
+"""
+import math
+import time
+import asyncio
+import functools
+
+import tornado.log
+
+from torskel.str_utils import get_hash_str
+from torskel.libs.lru_cache import TorskelLRUCache
+from torskel.libs.json_codec import json_dumps
+from torskel.libs.json_codec import json_dumps_bytes
+from torskel.libs.json_codec import json_loads
+from torskel.libs.redis_lock import TorskelRedisLock
+from torskel.libs.redis_shards import get_related_key
+
+RESPONSE_CACHE_MEMORY = 'memory'
+RESPONSE_CACHE_REDIS = 'redis'
+RESPONSE_CACHE_BOTH = 'both'
+RESPONSE_CACHE_KEY_PREFIX = 'torskel:response:'
+CACHE_STATUS_HEADER = 'X-Cache'
+
+# pylint: disable=C0103
+logger = tornado.log.gen_log
+
+
+class TorskelCachedResponse:
+    """
+    Status, headers and body of response with its freshness
+    """
+    __slots__ = ('status', 'headers', 'body', 'fresh_until', 'stale_until')
+
+    def __init__(self, status, headers, body, fresh_until, stale_until):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+    @property
+    def is_fresh(self) -> bool:
+        """
+        Returns True if response can be served without recomputing
+        :return: bool
+        """
+        return self.fresh_until > time.time()
+
+    @property
+    def ttl(self) -> float:
+        """
+        Returns seconds while response can be served, including stale period
+        :return: float
+        """
+        return self.stale_until - time.time()
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes response for redis: JSON meta, new line and body
+        :return: bytes
+        """
+        meta = json_dumps_bytes([self.status, self.headers,
+                                 self.fresh_until, self.stale_until])
+        return meta + b'\n' + self.body
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Deserializes response read from redis
+        :param data: bytes
+        :return: TorskelCachedResponse
+        """
+        meta, _, body = data.partition(b'\n')
+        status, headers, fresh_until, stale_until = json_loads(meta)
+        return cls(status, [tuple(header) for header in headers], body,
+                   fresh_until, stale_until)
+
+    def write_to(self, handler, cache_status):
+        """
+        Sends response by handler
+        :param handler: RequestHandler
+        :param cache_status: value of X-Cache header
+        :return: Future of finish
+        """
+        handler.set_status(self.status)
+        written = set()
+        for name, value in self.headers:
+            if name in written:
+                handler.add_header(name, value)
+            else:
+                handler.set_header(name, value)
+                written.add(name)
+        handler.set_header(CACHE_STATUS_HEADER, cache_status)
+        return handler.finish(self.body)
+
+
+class TorskelResponseCache:
+    """
+    Two-level cache of responses: in-memory LRU and redis.
+    Only one request per key and worker computes response,
+    others wait for it or get stale response. With redis storage
+    workers take redis lock of key, so one of them computes response.
+    Errors of redis are logged and handled as cache misses
+    """
+
+    def __init__(self, max_items=1000, max_bytes=None):
+        self.cache = TorskelLRUCache(max_items=max_items, max_bytes=max_bytes)
+        self.computing = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.waits = 0
+
+    async def get(self, app, key, storage):
+        """
+        Returns cached response which is fresh or can be served as stale
+        :param app: TorskelServer
+        :param key: key
+        :param storage: memory, redis or both
+        :return: TorskelCachedResponse or None
+        """
+        entry = None
+        if storage != RESPONSE_CACHE_REDIS:
+            entry = self.cache.get(key, count_stats=False)
+        if entry is None and storage != RESPONSE_CACHE_MEMORY:
+            try:
+                pool = await app.get_redis_pool()
+                data = await pool.execute('get', key)
+            except Exception as exc:  # pylint: disable=W0703
+                logger.warning('Can not read response from redis: %r', exc)
+                data = None
+            if data:
+                entry = TorskelCachedResponse.from_bytes(data)
+                if storage == RESPONSE_CACHE_BOTH and entry.ttl > 0:
+                    self.cache.set(key, entry, entry.ttl, len(entry.body))
+        if entry is not None and entry.ttl <= 0:
+            entry = None
+        return entry
+
+    async def store(self, app, key, entry, storage):
+        """
+        Stores response
+        :param app: TorskelServer
+        :param key: key
+        :param entry: TorskelCachedResponse
+        :param storage: memory, redis or both
+        :return:
+        """
+        if storage != RESPONSE_CACHE_REDIS:
+            self.cache.set(key, entry, entry.ttl, len(entry.body))
+        if storage != RESPONSE_CACHE_MEMORY:
+            try:
+                await app.set_redis_exp_val(key, entry.to_bytes(),
+                                            math.ceil(entry.ttl))
+            except Exception as exc:  # pylint: disable=W0703
+                logger.warning('Can not write response to redis: %r', exc)
+
+    @staticmethod
+    async def acquire_lock(app, key, timeout):
+        """
+        Takes redis lock of key for computing response. If redis is not
+        available, response is computed without lock
+        :param app: TorskelServer
+        :param key: key
+        :param timeout: lock timeout in seconds
+        :return: TorskelRedisLock or None if lock is taken by other worker
+        """
+        lock = TorskelRedisLock(app, get_related_key(key, 'lock'),
+                                int(timeout * 1000))
+        try:
+            if await lock.acquire() is None:
+                return None
+        except Exception as exc:  # pylint: disable=W0703
+            logger.warning('Can not take lock of response in redis: %r', exc)
+        return lock
+
+    @staticmethod
+    async def release_lock(lock):
+        """
+        Releases redis lock of key
+        :param lock: TorskelRedisLock
+        :return:
+        """
+        try:
+            await lock.release()
+        except Exception as exc:  # pylint: disable=W0703
+            logger.warning('Can not release lock of response in redis: %r',
+                           exc)
+
+    async def wait(self, app, key, storage, timeout):
+        """
+        Waits response computed by other worker
+        :param app: TorskelServer
+        :param key: key
+        :param storage: redis or both
+        :param timeout: seconds
+        :return: TorskelCachedResponse or None
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await self.get(app, key, RESPONSE_CACHE_REDIS)
+            if entry is not None and entry.is_fresh:
+                if storage == RESPONSE_CACHE_BOTH:
+                    self.cache.set(key, entry, entry.ttl, len(entry.body))
+                return entry
+        return None
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of cache
+        :return: dict
+        """
+        total = self.hits + self.stale_hits + self.misses
+        stats = self.cache.get_stats()
+        stats.update({
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'waits': self.waits,
+            'computing': len(self.computing),
+            'hit_ratio': (self.hits + self.stale_hits) / total
+                         if total else 0.0,
+        })
+        return stats
+
+
+def get_response_cache_key(handler, query_args=None, vary=None) -> str:
+    """
+    Returns key of response by uri path, query arguments and headers
+    :param handler: RequestHandler
+    :param query_args: names of arguments, None - all arguments
+    :param vary: names of request headers
+    :return: str
+    """
+    request = handler.request
+    if query_args is None:
+        query_args = sorted(request.query_arguments)
+    parts = [
+        request.path,
+        [[name, handler.get_query_arguments(name)] for name in query_args],
+        [[name, request.headers.get(name, '')] for name in vary or ()],
+    ]
+    return RESPONSE_CACHE_KEY_PREFIX + get_hash_str(json_dumps(parts))
+
+
+# pylint: disable=W0212
+def cache_response(ttl, stale_ttl=0, query_args=None, vary=None,
+                   headers=(), storage=RESPONSE_CACHE_MEMORY,
+                   statuses=(200,), lock_timeout=5):
+    """
+    Decorator of TorskelHandler methods, caches full response:
+        @cache_response(60, stale_ttl=300, query_args=['id'])
+        async def get(self):
+            ...
+    Fresh responses are served without calling method. While one request
+    recomputes expired response, others get stale one for stale_ttl seconds
+    or wait for the new response if there is no stale one
+    :param ttl: seconds while response is fresh
+    :param stale_ttl: seconds while stale response can be served
+    :param query_args: names of arguments for key, None - all arguments
+    :param vary: names of request headers for key
+    :param headers: names of response headers to cache besides Content-Type
+    :param storage: memory, redis or both
+    :param statuses: http codes of responses to cache
+    :param lock_timeout: seconds of redis lock of computing response,
+     other workers wait for response up to this time
+    :return: decorator
+    """
+    cached_headers = {name.lower() for name in headers}
+    cached_headers.add('content-type')
+
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(handler, *args, **kwargs):
+            cache = handler.application.response_cache
+            key = get_response_cache_key(handler, query_args, vary)
+            entry = await cache.get(handler.application, key, storage)
+            if entry is not None and entry.is_fresh:
+                cache.hits += 1
+                return entry.write_to(handler, 'HIT')
+
+            stale = entry
+            computing = cache.computing.get(key)
+            while computing is not None:
+                if stale is not None:
+                    cache.stale_hits += 1
+                    return stale.write_to(handler, 'STALE')
+                cache.waits += 1
+                entry = await asyncio.shield(computing)
+                if entry is not None and entry.is_fresh:
+                    cache.hits += 1
+                    return entry.write_to(handler, 'HIT')
+                if entry is not None:
+                    # lock was taken by other worker, stale one is served
+                    cache.stale_hits += 1
+                    return entry.write_to(handler, 'STALE')
+                # response was not cached, the next waiter computes it
+                computing = cache.computing.get(key)
+
+            computing = cache.computing[key] = asyncio.Future()
+            entry = None
+            lock = None
+            try:
+                if storage != RESPONSE_CACHE_MEMORY:
+                    lock = await cache.acquire_lock(handler.application, key,
+                                                    lock_timeout)
+                    if lock is None:
+                        if stale is not None:
+                            # waiters get the same stale response
+                            computing.set_result(stale)
+                            cache.stale_hits += 1
+                            return stale.write_to(handler, 'STALE')
+                        cache.waits += 1
+                        entry = await cache.wait(handler.application, key,
+                                                 storage, lock_timeout)
+                        if entry is not None:
+                            cache.hits += 1
+                            return entry.write_to(handler, 'HIT')
+                cache.misses += 1
+                handler.capture_response = True
+                handler.set_header(CACHE_STATUS_HEADER, 'MISS')
+                res = method(handler, *args, **kwargs)
+                if asyncio.iscoroutine(res) or asyncio.isfuture(res):
+                    res = await res
+                if not handler._finished and handler._auto_finish:
+                    handler.finish()
+                captured = handler.captured_response
+                if captured is not None and captured[0] in statuses:
+                    now = time.time()
+                    entry = TorskelCachedResponse(
+                        captured[0],
+                        [(name, value) for name, value in captured[1]
+                         if name.lower() in cached_headers],
+                        captured[2], now + ttl, now + ttl + stale_ttl
+                    )
+                    await cache.store(handler.application, key, entry,
+                                      storage)
+                return res
+            finally:
+                if lock is not None:
+                    await cache.release_lock(lock)
+                if cache.computing.get(key) is computing:
+                    del cache.computing[key]
+                if not computing.done():
+                    computing.set_result(entry)
+        return wrapper
+    return decorator
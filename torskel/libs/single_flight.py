@@ -0,0 +1,66 @@
+"""
+Module contains coalescing of identical concurrent calls
+"""
+import asyncio
+
+from tornado.httputil import HTTPHeaders
+
+
+def get_request_key(method, url, headers=None, key_headers=None) -> tuple:
+    """
+    Returns key of http request for coalescing
+    :param method: http method
+    :param url: url
+    :param headers: headers of request
+    :param key_headers: names of headers which are part of key
+    :return: tuple
+    """
+    headers = HTTPHeaders(headers or {})
+    return (
+        method.upper(),
+        url,
+        tuple((name, headers.get(name)) for name in key_headers or []),
+    )
+
+
+class TorskelSingleFlight:
+    """
+    Runs only one call for key at the same time, concurrent callers
+    with the same key wait for its result
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Calls coroutine function or joins the call in progress with
+        the same key. Result is shared between callers, so it must not be
+        modified in place
+        :param key: hashable key of call
+        :param func: coroutine function
+        :return: result of func
+        """
+        task = self.in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.shared += 1
+        # cancellation of one caller must not cancel the others
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of calls
+        :return: dict
+        """
+        return {
+            'calls': self.calls,
+            'shared': self.shared,
+            'in_flight': len(self.in_flight),
+        }
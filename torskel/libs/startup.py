@@ -2,6 +2,7 @@
 Module contains startup methods
 """
 # pylint: disable=C0103
+import os
 import logging
 import platform
 import importlib
@@ -12,10 +13,16 @@ try:
     no_unix_socket = False
 except ImportError:
     no_unix_socket = True
+from tornado.netutil import bind_sockets
 from tornado.options import options
 from tornado.httpserver import HTTPServer
 
 import torskel
+from torskel.libs.prefork import TorskelPreforkSupervisor
+from torskel.libs.prefork import get_workers_count
+from torskel.libs.handover import get_inherited_sockets
+from torskel.libs.handover import start_successor
+from torskel.libs.handover import get_ready_fd
 
 
 # pylint: disable=C0103
@@ -51,11 +58,30 @@ def _configure_graylog():
         raise ModuleNotFoundError('Required package graypy is missing')
 
 
+def _bind_server_sockets(reuse_port=False):
+    """
+    Binds listening sockets on a port or unix-socket depending on
+    the settings
+    :param reuse_port: set SO_REUSEPORT on tcp sockets
+    :return: list of sockets
+    """
+    if options.run_on_socket and not no_unix_socket:
+        logger.info('Running on socket %s', options.socket_path)
+        sockets = [bind_unix_socket(options.socket_path, 0o666)]
+    else:
+        logger.info('Running on port %s', options.port)
+        sockets = bind_sockets(options.port, reuse_port=reuse_port)
+    return sockets
+
+
 def server_init(server):
     """
-    Initializing an application on a port or socket depending on the settings
+    Initializing an application on a port or socket depending on the settings.
+    Listening sockets passed by systemd or by the previous process
+    are used instead of binding new ones.
+    If more than one worker is configured, forks worker processes
     :param server:
-    :return: None
+    :return: HTTPServer
     """
     logger.info('')
     logger.info('Starting %s v%s', server.server_name, server.server_version)
@@ -70,13 +96,29 @@ def server_init(server):
     if options.use_graylog:
         _configure_graylog()
 
-    if options.run_on_socket and not no_unix_socket:
+    workers = get_workers_count(options.workers)
+    sockets = get_inherited_sockets()
+    # with SO_REUSEPORT every worker binds its own socket after fork
+    bind_after_fork = workers > 1 and options.reuse_port \
+        and not options.run_on_socket
+    if not sockets and not bind_after_fork:
+        sockets = _bind_server_sockets()
+    server.listen_sockets = sockets
+    server.ready_fd = get_ready_fd()
 
-        unix_socket = bind_unix_socket(options.socket_path, 0o666)
-        http_server = HTTPServer(server)
-        http_server.add_socket(unix_socket)
-        logger.info('Running on socket %s', options.socket_path)
-    else:
+    if workers > 1:
+        server.supervisor = TorskelPreforkSupervisor(
+            workers, options.workers_max_restarts,
+            on_handover=lambda: start_successor(
+                sockets, options.handover_timeout, workers
+            )
+        )
+        task_id = server.supervisor.start()
+        logger.info('Worker %s started, pid %s', task_id, os.getpid())
 
-        logger.info('Running on port %s', options.port)
-        server.listen(options.port)
+    if not sockets:
+        sockets = _bind_server_sockets(reuse_port=True)
+
+    http_server = HTTPServer(server)
+    http_server.add_sockets(sockets)
+    return http_server
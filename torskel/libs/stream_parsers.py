@@ -0,0 +1,134 @@
+"""
+Module contains incremental parsers of http response body
+"""
+import importlib
+from collections import deque
+
+import tornado.locks
+
+from torskel.libs.xml_utils import TorskelXmlStreamParser
+from torskel.libs.json_codec import json_loads
+
+STREAM_FORMAT_XML = 'xml'
+STREAM_FORMAT_JSON = 'json'
+STREAM_FORMAT_JSON_LINES = 'jsonl'
+
+
+class TorskelJsonLinesStreamParser:
+    """
+    Incremental parser of JSON lines, one record per line
+    """
+
+    def __init__(self):
+        self.tail = b''
+
+    def feed(self, chunk) -> list:
+        """
+        Parses chunk of document
+        :param chunk: bytes
+        :return: list of parsed records
+        """
+        lines = (self.tail + chunk).split(b'\n')
+        self.tail = lines.pop()
+        return [json_loads(line) for line in lines if line.strip()]
+
+    def close(self) -> list:
+        """
+        Finishes parsing
+        :return: list of parsed records
+        """
+        tail, self.tail = self.tail, b''
+        return [json_loads(tail)] if tail.strip() else []
+
+
+class TorskelJsonStreamParser:
+    """
+    Incremental parser of JSON document, returns items by ijson prefix,
+    e.g. "item" for elements of top level array
+    """
+
+    def __init__(self, prefix='item'):
+        try:
+            ijson = importlib.import_module('ijson')
+        except ImportError:
+            raise ImportError('Required package ijson is missing')
+        self.records = ijson.sendable_list()
+        self.coro = ijson.items_coro(self.records, prefix)
+
+    def _pop_records(self) -> list:
+        """
+        Returns parsed records and forgets them
+        :return: list
+        """
+        records = self.records[:]
+        del self.records[:]
+        return records
+
+    def feed(self, chunk) -> list:
+        """
+        Parses chunk of document
+        :param chunk: bytes
+        :return: list of parsed records
+        """
+        self.coro.send(chunk)
+        return self._pop_records()
+
+    def close(self) -> list:
+        """
+        Finishes parsing
+        :return: list of parsed records
+        """
+        self.coro.close()
+        return self._pop_records()
+
+
+class TorskelStreamConsumer:
+    """
+    Streaming callback of http request, which parses chunks into queue
+    of records. Http-client can not pause downloading, so callback raises
+    to abort it when consumer is closed or more than max_records
+    are not consumed, 0 - unlimited
+    """
+
+    def __init__(self, parser, max_records=10000):
+        self.parser = parser
+        self.max_records = max_records
+        self.records = deque()
+        self.ready = tornado.locks.Event()
+        self.error = None
+
+    def __call__(self, chunk):
+        if self.error is None:
+            self.records.extend(self.parser.feed(chunk))
+            if self.max_records and len(self.records) > self.max_records:
+                self.error = BufferError(
+                    f'More than {self.max_records} records of stream '
+                    f'are not consumed'
+                )
+        self.ready.set()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        """
+        Aborts downloading on the next chunk
+        :return:
+        """
+        if self.error is None:
+            self.error = RuntimeError('Consumer of stream is closed')
+
+
+def get_stream_parser(stream_format, **kwargs):
+    """
+    Returns incremental parser by format
+    :param stream_format: xml, json or jsonl
+    :param kwargs: item_depth for xml, item_prefix for json
+    :return: parser with feed and close methods
+    """
+    if stream_format == STREAM_FORMAT_XML:
+        return TorskelXmlStreamParser(kwargs.get('item_depth', 2))
+    if stream_format == STREAM_FORMAT_JSON:
+        return TorskelJsonStreamParser(kwargs.get('item_prefix', 'item'))
+    if stream_format == STREAM_FORMAT_JSON_LINES:
+        return TorskelJsonLinesStreamParser()
+    raise ValueError(f'Unknown stream format {stream_format}')
@@ -0,0 +1,226 @@
+"""
+Module contains conversion of xml into plain dicts
+"""
+import re
+from xml.parsers import expat
+
+# numbers without leading zeros, so ids and zip codes stay strings
+INT_RE = re.compile(r'-?(?:0|[1-9][0-9]*)')
+FLOAT_RE = re.compile(
+    r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+(?:[eE][-+]?[0-9]+)?|[eE][-+]?[0-9]+)'
+)
+
+
+class TorskelXmlDictBuilder:
+    """
+    Expat handler which builds plain dicts in the xmltodict format:
+    attributes with "@" prefix, text of element with attributes or children
+    under "#text", repeated elements as lists.
+    Elements on item_depth are passed to item_callback and are not kept
+    """
+
+    def __init__(self, item_depth=0, item_callback=None, attr_prefix='@',
+                 cdata_key='#text', **kwargs):
+        self.item_depth = item_depth
+        self.item_callback = item_callback
+        self.attr_prefix = attr_prefix
+        self.cdata_key = cdata_key
+        self.xml_attribs = kwargs.get('xml_attribs', True)
+        self.strip_namespaces = kwargs.get('strip_namespaces', False)
+        self.coerce_types = kwargs.get('coerce_types', False)
+        self.path = []
+        self.stack = []
+        self.item = None
+        self.data = []
+
+    def start_element(self, name, attrs):
+        """
+        Expat StartElementHandler
+        :param name: name of element
+        :param attrs: dict of attributes
+        :return:
+        """
+        self.path.append(name)
+        if len(self.path) >= self.item_depth:
+            self.stack.append((self.item, self.data))
+            self.item = self._get_attrs(attrs) if attrs else None
+            self.data = []
+
+    def _get_attrs(self, attrs):
+        """
+        Returns dict of attributes with prefix
+        :param attrs: dict of attributes
+        :return: dict or None
+        """
+        if not self.xml_attribs:
+            return None
+        res = {}
+        for key, value in attrs.items():
+            if self.strip_namespaces:
+                if key == 'xmlns' or key.startswith('xmlns:'):
+                    continue
+                key = key.rpartition(':')[2]
+            res[self.attr_prefix + key] = self._coerce(value)
+        return res or None
+
+    def _build_name(self, name):
+        """
+        Returns name of element without namespace prefix if needed
+        :param name: name of element
+        :return: str
+        """
+        return name.rpartition(':')[2] if self.strip_namespaces else name
+
+    def _coerce(self, value):
+        """
+        Converts text into bool, int or float if coerce_types is set.
+        Only plain decimal numbers are converted: "007", "1_000", "nan"
+        and "inf" stay strings
+        :param value: str
+        :return: value
+        """
+        if not self.coerce_types or value is None:
+            return value
+        lowered = value.lower()
+        if lowered in ('true', 'false'):
+            return lowered == 'true'
+        if INT_RE.fullmatch(value):
+            return int(value)
+        if FLOAT_RE.fullmatch(value):
+            return float(value)
+        return value
+
+    def end_element(self, name):
+        """
+        Expat EndElementHandler
+        :param name: name of element
+        :return:
+        """
+        name = self._build_name(name)
+        if len(self.path) == self.item_depth:
+            item = self.item
+            data = ''.join(self.data) if self.data else None
+            if item is None:
+                item = self._coerce(data)
+            elif data and data.strip():
+                self._push_data(item, self.cdata_key,
+                                self._coerce(data.strip()))
+            if self.item_callback is not None:
+                self.item_callback(item)
+            self.item, self.data = self.stack.pop() if self.stack \
+                else (None, [])
+        elif self.stack:
+            data = ''.join(self.data) if self.data else None
+            item = self.item
+            self.item, self.data = self.stack.pop()
+            if data:
+                data = data.strip() or None
+            data = self._coerce(data)
+            if item is not None:
+                if data is not None:
+                    self._push_data(item, self.cdata_key, data)
+                self.item = self._push_data(self.item, name, item)
+            else:
+                self.item = self._push_data(self.item, name, data)
+        else:
+            self.item, self.data = None, []
+        self.path.pop()
+
+    def characters(self, data):
+        """
+        Expat CharacterDataHandler
+        :param data: text
+        :return:
+        """
+        self.data.append(data)
+
+    @staticmethod
+    def _push_data(item, key, data):
+        """
+        Adds child into item, repeated children are joined into list
+        :param item: dict or None
+        :param key: name of child
+        :param data: value of child
+        :return: item
+        """
+        if item is None:
+            item = {}
+        if key in item:
+            value = item[key]
+            if isinstance(value, list):
+                value.append(data)
+            else:
+                item[key] = [value, data]
+        else:
+            item[key] = data
+        return item
+
+    def create_parser(self):
+        """
+        Returns expat parser which uses this builder
+        :return: xmlparser
+        """
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.characters
+        return parser
+
+
+class TorskelXmlStreamParser:
+    """
+    Incremental xml parser. Returns elements on item_depth as soon as
+    they are parsed
+    """
+
+    def __init__(self, item_depth=2, **kwargs):
+        self.records = []
+        self.builder = TorskelXmlDictBuilder(
+            item_depth=item_depth, item_callback=self.records.append,
+            **kwargs
+        )
+        self.parser = self.builder.create_parser()
+
+    def _pop_records(self) -> list:
+        """
+        Returns parsed records and forgets them
+        :return: list
+        """
+        records = self.records[:]
+        del self.records[:]
+        return records
+
+    def feed(self, chunk) -> list:
+        """
+        Parses chunk of document
+        :param chunk: bytes
+        :return: list of parsed records
+        """
+        self.parser.Parse(chunk, False)
+        return self._pop_records()
+
+    def close(self) -> list:
+        """
+        Finishes parsing
+        :return: list of parsed records
+        """
+        self.parser.Parse(b'', True)
+        return self._pop_records()
+
+
+def xml_to_dict(xml_data, **kwargs) -> dict:
+    """
+    Converts xml into plain dicts in one pass, the same result as
+    json.loads(json.dumps(xmltodict.parse(xml_data))) without
+    the JSON round-trip
+    :param xml_data: str or bytes
+    :param kwargs:
+        xml_attribs keep attributes, default True
+        strip_namespaces remove namespace prefixes and xmlns attributes
+        coerce_types convert text into bool, int and float
+    :return: dict
+    """
+    builder = TorskelXmlDictBuilder(**kwargs)
+    builder.create_parser().Parse(xml_data, True)
+    return builder.item
@@ -5,8 +5,8 @@ import hashlib
 import re
 import ipaddress
 import datetime
-import json
-import xmltodict
+
+from torskel.libs.xml_utils import xml_to_dict
 
 ALL_HASH_RE_TMPL = r"^(?:[a-fA-F\d]{32,40})$|^(?:[a-fA-F\d]{52,60})$|" \
                    r"^(?:[a-fA-F\d]{92,100})$"
@@ -140,11 +140,11 @@ def is_number(value):
     return True
 
 
-def xml_str_to_dict(xml_str: str) -> dict:
+def xml_str_to_dict(xml_str: str, **kwargs) -> dict:
     """
     create dict from xml
     :param xml_str:
+    :param kwargs: xml_attribs, strip_namespaces, coerce_types
     :return:
     """
-    parsed_xml = xmltodict.parse(xml_str)
-    return json.loads(json.dumps(parsed_xml))
+    return xml_to_dict(xml_str, **kwargs)
@@ -3,28 +3,56 @@ Module with basic tornado application class
 """
 
 # pylint: disable=W0511
-import json
+import time
+import signal
+import asyncio
+import weakref
 import os.path
 import importlib
 import logging.handlers
 from urllib.parse import urlencode
+from urllib.parse import urlsplit
+import tornado.gen
 import tornado.log
 import tornado.web
+import tornado.locks
 import tornado.httpclient
 from tornado.options import options
 from tornado.web import Application
 from tornado.httpclient import AsyncHTTPClient
-import xmltodict
 
 from torskel.torskel_ping_handler import TorskelPingHandler
 from torskel.torskel_mixins.redis_mixin import RedisApplicationMixin
+from torskel.libs.redis_near_cache import TorskelRedisNearCache
+from torskel.libs.redis_codec import TorskelRedisValueCodec
 from torskel.torskel_mixins.log_mix import TorskelLogMixin
 from torskel.libs.db_utils.mongo import get_mongo_pool
 from torskel.libs.db_utils.mongo import bulk_mongo_insert
 from torskel.libs.str_consts import INIT_REDIS_LABEL
 from torskel.libs.str_consts import DEFAULT_SERVER_VERSION
 from torskel.libs.event_controller import TorskelEventLogController
+from torskel.libs.event_spill import TorskelEventSpill
+from torskel.libs.event_sinks import TorskelMongoEventSink
+from torskel.libs.event_sinks import TorskelFileEventSink
+from torskel.libs.event_sinks import TorskelRedisStreamEventSink
 from torskel.libs.startup import server_init
+from torskel.libs.prefork import get_workers_count
+from torskel.libs.handover import start_successor
+from torskel.libs.handover import notify_ready
+from torskel.libs.http_pools import TorskelHttpPools
+from torskel.libs.single_flight import TorskelSingleFlight
+from torskel.libs.single_flight import get_request_key
+from torskel.libs.http_cache import TorskelHttpCache
+from torskel.libs.response_cache import TorskelResponseCache
+from torskel.libs.http_resilience import IDEMPOTENT_METHODS
+from torskel.libs.http_resilience import TorskelCircuitBreaker
+from torskel.libs.http_resilience import TorskelLatencyTracker
+from torskel.libs.http_resilience import TorskelRetryPolicy
+from torskel.libs.http_resilience import is_upstream_failure
+from torskel.libs.stream_parsers import get_stream_parser
+from torskel.libs.stream_parsers import TorskelStreamConsumer
+from torskel.libs.json_codec import json_loads
+from torskel.libs.xml_utils import xml_to_dict
 
 # server params
 options.define('debug', default=True, help='debug mode', type=bool)
@@ -33,6 +61,23 @@ options.define("srv_name", 'LOCAL', help="Server verbose name", type=str)
 options.define("run_on_socket", False, help="Run on socket", type=bool)
 options.define("socket_path", None, help="Path to unix-socket", type=str)
 
+# prefork params
+options.define("workers", default=1,
+               help="Count of worker processes, 0 - count of cpu cores",
+               type=int)
+options.define("workers_max_restarts", default=100, type=int)
+options.define("reuse_port", default=False,
+               help="Bind socket in every worker with SO_REUSEPORT",
+               type=bool)
+options.define("drain_timeout", default=30,
+               help="Seconds to wait for in-flight requests on stop",
+               type=int)
+options.define("handover_timeout", default=60,
+               help="Seconds to wait for new process on restart", type=int)
+
+# json codec: json, orjson, ujson or auto - the fastest installed
+options.define("json_codec", default='json', type=str)
+
 # using uvloop
 options.define("use_uvloop", False, help="Use uvloop", type=bool)
 
@@ -50,6 +95,54 @@ options.define("ping_handler_url", default='/service/ping', type=str)
 options.define("max_http_clients", default=100, type=int)
 options.define("http_client_timeout", default=30, type=int)
 options.define("use_curl_http_client", default=False, type=bool)
+options.define("use_http_pools", default=False,
+               help="Separate http-client pool for every host, keep-alive "
+                    "connections are reused only with use_curl_http_client",
+               type=bool)
+options.define("max_http_clients_per_host", default=10, type=int)
+options.define("http_pools_max_hosts", default=100,
+               help="Max count of pools of not configured hosts", type=int)
+options.define("http_pool_queue_timeout", default=10,
+               help="Seconds to wait for free slot in http pool", type=int)
+options.define("use_http_coalescing", default=False,
+               help="Share result of identical concurrent GET requests",
+               type=bool)
+options.define("http_key_headers", default=['Accept', 'Authorization'],
+               help="Headers which are part of coalescing and cache keys",
+               type=str, multiple=True)
+options.define("http_max_retries", default=0, type=int)
+options.define("http_retry_backoff", default=0.1,
+               help="Base delay of exponential backoff in seconds",
+               type=float)
+options.define("http_retry_max_backoff", default=2.0, type=float)
+options.define("http_retry_idempotent_only", default=True, type=bool)
+options.define("http_retry_budget", default=0,
+               help="Max seconds for all attempts, 0 - unlimited", type=int)
+options.define("use_http_hedging", default=False,
+               help="Send second request if the first one is slow",
+               type=bool)
+options.define("http_hedge_percentile", default=95, type=int)
+options.define("use_http_circuit_breaker", default=False, type=bool)
+options.define("http_breaker_failures", default=5, type=int)
+options.define("http_breaker_reset_timeout", default=30, type=int)
+options.define("http_stream_max_records", default=10000,
+               help="Max count of not consumed records of stream",
+               type=int)
+options.define("http_many_concurrency", default=10,
+               help="Max concurrent requests of http_request_many",
+               type=int)
+options.define("use_http_cache", default=False,
+               help="Cache decoded responses of GET requests", type=bool)
+options.define("http_cache_max_items", default=1000, type=int)
+options.define("http_cache_max_bytes", default=64 * 1024 * 1024, type=int)
+options.define("http_cache_default_ttl", default=0,
+               help="Seconds to cache response without cache headers",
+               type=int)
+
+# response cache params
+options.define("response_cache_max_items", default=1000, type=int)
+options.define("response_cache_max_bytes", default=64 * 1024 * 1024,
+               type=int)
 
 # mail logger params
 options.define('use_mail_logging', default=False, help='SMTP log handler',
@@ -83,6 +176,29 @@ options.define("redis_port", default=6379, type=int)
 options.define("redis_socket", default='/var/run/redis/redis.sock', type=str)
 options.define("redis_psw", default='', type=str)
 options.define("redis_db", default=-1, type=int)
+options.define("redis_nodes", default=[], multiple=True,
+               help="host:port or unix socket of redis shards", type=str)
+options.define("redis_virtual_nodes", default=160,
+               help="points of every shard on consistent hashing ring",
+               type=int)
+options.define("redis_value_format", default='legacy',
+               help="legacy (JSON without header), json or msgpack",
+               type=str)
+options.define("redis_compression", default='none',
+               help="none, zlib, lz4 or zstd", type=str)
+options.define("redis_compression_threshold", default=1024,
+               help="min size of value in bytes for compression", type=int)
+options.define("redis_connect_timeout", default=1.0, type=float)
+options.define("redis_health_check_interval", default=5.0,
+               help="seconds between PING of redis", type=float)
+options.define("redis_reconnect_max_delay", default=10.0,
+               help="max seconds between reconnects to redis", type=float)
+options.define('use_redis_near_cache', default=False,
+               help='cache decoded redis values in process', type=bool)
+options.define("redis_near_cache_max_items", default=10000, type=int)
+options.define("redis_near_cache_ttl", default=5, type=float)
+options.define("redis_invalidation_channel", default='torskel:invalidate',
+               type=str)
 
 # events writer params
 options.define('use_events_writer', default=False, help='use_events_writer',
@@ -90,8 +206,45 @@ options.define('use_events_writer', default=False, help='use_events_writer',
 options.define('show_log_event_writer', default=False,
                type=bool)
 options.define('use_lite_event', default=False, type=bool)
-options.define("task_list_size", default=10, type=int)
-options.define("writer_period", default=1000*10, type=int)
+options.define("events_http_headers",
+               default=['Host', 'Referer', 'Accept-Language', 'Content-Type',
+                        'X-Forwarded-For', 'X-Real-IP'],
+               multiple=True, type=str,
+               help='headers of request which are saved in events')
+options.define("task_list_size", default=10, type=int,
+               help='max count of events in one insert, full batch is '
+                    'inserted at once')
+options.define("writer_period", default=1000*10, type=int,
+               help='max time in milliseconds event waits for insert, '
+                    'earlier versions used it as period of inserts')
+options.define("writer_concurrency", default=2, type=int,
+               help='max count of concurrent inserts of events')
+options.define("events_queue_max_size", default=100000, type=int,
+               help='max count of events in queue, 0 - unbounded')
+options.define("events_queue_overflow", default='drop_newest', type=str,
+               help='drop_newest, drop_oldest, sample or block')
+options.define("events_queue_block_timeout", default=1.0, type=float,
+               help='max time in seconds adding of event waits with '
+                    'block policy')
+options.define("events_write_timeout", default=10.0, type=float,
+               help='seconds, slower inserts are saved on disk with spill')
+options.define("events_spill_dir", default='', type=str,
+               help='directory for events which are not written into '
+                    'database, empty - events are lost')
+options.define("events_spill_segment_size", default=16 * 1024 * 1024,
+               type=int)
+options.define("events_spill_fsync_interval", default=1.0, type=float)
+options.define("events_spill_replay_rate", default=1000, type=int,
+               help='max events per second written from disk')
+options.define("events_sinks", default=['mongo'], multiple=True, type=str,
+               help='destinations of events: mongo, file, redis')
+options.define("events_sink_retries", default=2, type=int)
+options.define("events_file_path", default='events.jsonl', type=str)
+options.define("events_file_max_bytes", default=100 * 1024 * 1024,
+               type=int)
+options.define("events_file_backup_count", default=10, type=int)
+options.define("events_redis_stream", default='torskel:events', type=str)
+options.define("events_redis_max_len", default=1000000, type=int)
 options.define("events_collection_name", default='user_events', type=str)
 
 # user language settings
@@ -115,7 +268,7 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
         self.log_msg_tmpl = '%s %s'
 
         # TODO add valiate paths
-        create_http_client = settings.get('create_http_client', True)
+        self.create_http_client = settings.get('create_http_client', True)
         if root_dir is not None:
             app_static_dir = os.path.join(root_dir, "static") \
                 if static_path is None else static_path
@@ -131,10 +284,52 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
         self.server_name = options.srv_name
         self.server_version = settings.get('version', DEFAULT_SERVER_VERSION)
         self.logger = tornado.log.gen_log
-
-        tornado.ioloop.IOLoop.configure(
-            'tornado.platform.asyncio.AsyncIOMainLoop'
+        self.http_client = None
+        self.http_pools = None
+        self.http_single_flight = TorskelSingleFlight()
+        self.http_retry_policy = TorskelRetryPolicy(
+            backoff=options.http_retry_backoff,
+            max_backoff=options.http_retry_max_backoff,
+            idempotent_only=options.http_retry_idempotent_only
+        )
+        self.http_latency = TorskelLatencyTracker()
+        self.http_breakers = {}
+        self.http_cache = settings.get('http_cache') or TorskelHttpCache(
+            max_items=options.http_cache_max_items,
+            max_bytes=options.http_cache_max_bytes,
+            default_ttl=options.http_cache_default_ttl
+        )
+        self.response_cache = TorskelResponseCache(
+            max_items=options.response_cache_max_items,
+            max_bytes=options.response_cache_max_bytes
+        )
+        self.http_server = None
+        self.supervisor = None
+        self.listen_sockets = []
+        self.ready_fd = None
+        self.active_handlers = weakref.WeakSet()
+        self.is_stopping = False
+        # Application.__init__ does not call __init__ of mixins
+        RedisApplicationMixin.__init__(
+            self,
+            near_cache=TorskelRedisNearCache(
+                max_items=options.redis_near_cache_max_items,
+                ttl=options.redis_near_cache_ttl
+            ) if options.use_redis_near_cache else None,
+            value_codec=TorskelRedisValueCodec(
+                options.redis_value_format, options.redis_compression,
+                options.redis_compression_threshold
+            )
         )
+        self.mongo_pool = None
+
+        # IOLoop runs on asyncio loop since tornado 5. There configuring
+        # AsyncIOMainLoop binds a new IOLoop to the current asyncio loop,
+        # which fails when several servers are created in one process
+        if tornado.version_info < (5, 0):
+            tornado.ioloop.IOLoop.configure(
+                'tornado.platform.asyncio.AsyncIOMainLoop'
+            )
 
         if options.use_mail_logging:
             self._set_mail_logging()
@@ -151,12 +346,14 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
                 raise ImportError('Required package for CurlAsyncHTTPClient '
                                   'pycurl is missing')
 
-        self.http_client = AsyncHTTPClient(
-            max_clients=options.max_http_clients
-        ) if create_http_client else None
-
-        self._configure_mongo()
-        self.event_writer = TorskelEventLogController()
+        self.event_writer = TorskelEventLogController(
+            options.events_queue_max_size, options.events_queue_overflow,
+            block_timeout=options.events_queue_block_timeout
+        )
+        self.events_spill = None
+        # in prefork mode connections are created in every worker after fork
+        if get_workers_count(options.workers) == 1:
+            self._configure_worker()
         self._configure_ping_handler()
         self.log_info('Configuring loop')
         self._configure_loop()
@@ -174,6 +371,43 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
             except ImportError:
                 raise ImportError('Required package uvloop is missing')
 
+    def _configure_worker(self):
+        """
+        Creates http-client and connections pools, which can not be
+        shared between processes
+        :return:
+        """
+        self.http_client = AsyncHTTPClient(
+            max_clients=options.max_http_clients
+        ) if self.create_http_client else None
+        if options.use_http_pools:
+            self.http_pools = TorskelHttpPools(
+                max_clients=options.max_http_clients_per_host,
+                queue_timeout=options.http_pool_queue_timeout,
+                max_hosts=options.http_pools_max_hosts
+            )
+
+        self._configure_mongo()
+        self._configure_events_spill()
+
+    def _configure_events_spill(self):
+        """
+        Configuration of spill of mongo events sink, every worker has its
+        own directory, old and new processes of handover share it
+        :return:
+        """
+        if options.use_events_writer and options.events_spill_dir:
+            directory = options.events_spill_dir
+            if self.task_id is not None:
+                directory = os.path.join(directory, f'worker-{self.task_id}')
+            self.events_spill = TorskelEventSpill(
+                directory,
+                segment_size=options.events_spill_segment_size,
+                fsync_interval=options.events_spill_fsync_interval,
+                replay_rate=options.events_spill_replay_rate,
+                batch_size=options.task_list_size
+            )
+
     def _configure_mongo(self):
         """
         Configuration mongodb connection
@@ -216,9 +450,147 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
          the settings
         :return: None
         """
-        server_init(self)
+        self.http_server = server_init(self)
+        if self.task_id is not None:
+            self._configure_worker()
         self.init_with_loop()
-        tornado.ioloop.IOLoop.current().start()
+        self._configure_signals()
+        loop = tornado.ioloop.IOLoop.current()
+        loop.add_callback(notify_ready, self.ready_fd)
+        loop.start()
+
+    def _configure_signals(self):
+        """
+        Configuration of signal handlers. SIGTERM and SIGINT stop server
+        gracefully, SIGUSR2 restarts server without dropping connections
+        :return:
+        """
+        loop = tornado.ioloop.IOLoop.current()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.asyncio_loop.add_signal_handler(
+                sig, loop.spawn_callback, self.shutdown
+            )
+        if hasattr(signal, 'SIGUSR2'):
+            loop.asyncio_loop.add_signal_handler(
+                signal.SIGUSR2, loop.spawn_callback, self.handover
+            )
+
+    # ######################### #
+    #  Restart and stop server  #
+    # ######################### #
+
+    def register_handler(self, handler):
+        """
+        Registers request handler as in-flight until request is finished
+        :param handler: request handler
+        :return:
+        """
+        self.active_handlers.add(handler)
+
+    def log_request(self, handler):
+        """
+        Marks request as finished and writes access log
+        :param handler: request handler
+        :return:
+        """
+        self.active_handlers.discard(handler)
+        super().log_request(handler)
+
+    @property
+    def requests_in_flight(self) -> int:
+        """
+        Returns count of not finished requests
+        :return: int
+        """
+        return len(self.active_handlers)
+
+    async def drain_requests(self, timeout=None):
+        """
+        Stops accepting new connections and waits for in-flight requests
+        :param timeout: max time in seconds to wait, default drain_timeout
+        :return:
+        """
+        if timeout is None:
+            timeout = options.drain_timeout
+        if self.http_server is not None:
+            self.http_server.stop()
+        loop = tornado.ioloop.IOLoop.current()
+        deadline = loop.time() + timeout
+        self.log_info(f'Draining {self.requests_in_flight} requests')
+        while self.active_handlers and loop.time() < deadline:
+            await tornado.gen.sleep(0.1)
+        if self.active_handlers:
+            self.log_err(f'{self.requests_in_flight} requests '
+                         f'are not finished after {timeout}s')
+        if self.http_server is not None:
+            await self.http_server.close_all_connections()
+
+    async def handover(self):
+        """
+        Starts new copy of server, which inherits listening sockets,
+        waits until it accepts connections, then drains in-flight requests
+        and stops current process. If new server is not started, current
+        one goes on serving. In prefork mode new server is started
+        by the parent process
+        :return:
+        """
+        if self.supervisor is None:
+            if self.is_stopping:
+                return
+            ready = await tornado.ioloop.IOLoop.current().run_in_executor(
+                None, start_successor, self.listen_sockets,
+                options.handover_timeout
+            )
+            if not ready:
+                self.log_err('Handover is cancelled')
+                return
+        await self.shutdown()
+
+    async def shutdown(self):
+        """
+        Stops server: stops accepting connections, waits for in-flight
+        requests, writes events left in the queue and closes connections
+        :return:
+        """
+        if self.is_stopping:
+            return
+        self.is_stopping = True
+        self.log_info('Shutting down')
+        await self.drain_requests()
+        await self.event_writer.stop()
+        if options.use_events_writer:
+            await self.flush_events()
+        await self.event_writer.close()
+        await self.close_connections()
+        tornado.ioloop.IOLoop.current().stop()
+
+    async def close_connections(self):
+        """
+        Closes redis and mongodb pools and http-client
+        :return:
+        """
+        if self.redis_connection_pool is not None \
+                or self.redis_health_task is not None:
+            self.log_info('Closing redis connection pool')
+            await self.close_redis_pool()
+        if self.mongo_pool is not None:
+            self.log_info('Closing mongodb connection pool')
+            self.mongo_pool.client.close()
+            self.mongo_pool = None
+        if self.http_client is not None:
+            self.http_client.close()
+            self.http_client = None
+        if self.http_pools is not None:
+            self.http_pools.close()
+            self.http_pools = None
+
+    @property
+    def task_id(self):
+        """
+        Returns number of worker process in prefork mode, otherwise None
+        :return: int
+        """
+        return self.supervisor.task_id if self.supervisor else None
 
     @staticmethod
     def get_secret_key() -> str:
@@ -270,17 +642,21 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
             self.log_info("Init Redis connection pool... ")
             self.log_info(f"ADDR={self.redis_addr} DB={self.redis_db}",
                           grep_label=INIT_REDIS_LABEL)
+            if options.redis_nodes:
+                self.log_info(f"SHARDS={','.join(options.redis_nodes)}",
+                              grep_label=INIT_REDIS_LABEL)
             self.log_info(f"MIN_POOL_SIZE={self.redis_min_con} "
                           f"MAX_POOL_SIZE={self.redis_max_con}",
                           grep_label=INIT_REDIS_LABEL)
             self.init_redis_pool()
+            self.start_redis_invalidation_listener()
         if options.use_events_writer:
             self.log_info('Init events writer')
-            event_writer = tornado.ioloop.PeriodicCallback(
-                self.write_log_from_queue,
-                options.writer_period
-            )
-            event_writer.start()
+            for sink in self.get_event_sinks():
+                self.log_info(f'Events sink {sink.name}')
+                self.event_writer.add_sink(sink)
+                sink.start()
+            self.event_writer.start(self.event_writer.write_to_sinks)
 
     # ############################# #
     #  Async Http-client functions  #
@@ -315,6 +691,205 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
 
         return res
 
+    def configure_http_pool(self, name, hosts=None, max_clients=None,
+                            queue_timeout=None):
+        """
+        Configures http pool for host or for named upstream
+        :param name: host or name of upstream
+        :param hosts: list of hosts of upstream, default [name]
+        :param max_clients: max count of concurrent requests
+        :param queue_timeout: max time in seconds to wait for free slot
+        :return: TorskelHttpPool
+        """
+        if self.http_pools is None:
+            raise ValueError('Http pools are disabled, '
+                             'turn on use_http_pools option')
+        return self.http_pools.configure(name, hosts, max_clients,
+                                         queue_timeout)
+
+    def get_http_pools_stats(self) -> dict:
+        """
+        Returns counters of http pools
+        :return: dict
+        """
+        return self.http_pools.get_stats() if self.http_pools else {}
+
+    async def _fetch(self, url, **kwargs):
+        """
+        Performs http request by pool of url host or by common http-client
+        and tracks its latency
+        :param url: url
+        :param kwargs: params of HTTPRequest
+        :return: HTTPResponse
+        """
+        start = time.monotonic()
+        if self.http_pools is not None:
+            res = await self.http_pools.fetch(url, **kwargs)
+        else:
+            res = await self.http_client.fetch(url, **kwargs)
+        self.http_latency.add(urlsplit(url).netloc,
+                              time.monotonic() - start)
+        return res
+
+    async def _hedged_fetch(self, url, **kwargs):
+        """
+        Performs http request and sends the second one if the first
+        is slower than http_hedge_percentile of host latency.
+        Returns the first successful response
+        :param url: url
+        :param kwargs: params of HTTPRequest
+        :return: HTTPResponse
+        """
+        delay = self.http_latency.get_percentile(
+            urlsplit(url).netloc, options.http_hedge_percentile
+        )
+        first = asyncio.ensure_future(self._fetch(url, **kwargs))
+        if delay is None:
+            return await first
+        done, _ = await asyncio.wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        self.log_debug(url, grep_label='HEDGED_REQUEST')
+        second = asyncio.ensure_future(self._fetch(url, **kwargs))
+        futures = [first, second]
+        while True:
+            done, _ = await asyncio.wait(
+                futures, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None or not futures:
+                    for loser in futures:
+                        # result of the slower request is not needed
+                        loser.add_done_callback(
+                            lambda f: f.cancelled() or f.exception()
+                        )
+                    return future.result()
+
+    async def http_fetch(self, url, **kwargs):
+        """
+        Performs http request with retries, hedging and circuit breaker
+        depending on the settings
+        :param url: url
+        :param kwargs: params of HTTPRequest
+        param max_retries: overrides http_max_retries option
+        param hedge: overrides use_http_hedging option
+        :return: HTTPResponse
+        """
+        method = kwargs.get('method', 'GET').upper()
+        max_retries = kwargs.pop('max_retries', options.http_max_retries)
+        hedge = kwargs.pop('hedge', options.use_http_hedging) \
+            and method in IDEMPOTENT_METHODS
+        host = urlsplit(url).netloc
+        breaker = self.get_http_breaker(host) \
+            if options.use_http_circuit_breaker else None
+        loop = tornado.ioloop.IOLoop.current()
+        deadline = loop.time() + options.http_retry_budget \
+            if options.http_retry_budget else None
+
+        attempt = 0
+        while True:
+            if breaker is not None and not breaker.allow():
+                raise tornado.httpclient.HTTPError(
+                    599, f'Circuit breaker is open for {host}'
+                )
+            try:
+                if hedge:
+                    res = await self._hedged_fetch(url, **kwargs)
+                else:
+                    res = await self._fetch(url, **kwargs)
+            except (tornado.httpclient.HTTPError, OSError) as exception:
+                # downloading is aborted by consumer of stream
+                aborted = getattr(kwargs.get('streaming_callback'), 'error',
+                                  None)
+                if aborted is not None:
+                    if breaker is not None:
+                        breaker.release()
+                    raise aborted from exception
+                code = getattr(exception, 'code', None)
+                if breaker is not None:
+                    # upstream which responds with 4xx is available
+                    if is_upstream_failure(code):
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                delay = self.http_retry_policy.get_delay(attempt)
+                if not self.http_retry_policy.should_retry(
+                        method, code, attempt, max_retries) or (
+                            deadline and loop.time() + delay >= deadline):
+                    raise
+                attempt += 1
+                self.log_debug(f'{url} attempt {attempt} failed with '
+                               f'{exception}', grep_label='HTTP_RETRY')
+                await tornado.gen.sleep(delay)
+                continue
+            except BaseException:
+                if breaker is not None:
+                    breaker.release()
+                raise
+            if breaker is not None:
+                breaker.record_success()
+            return res
+
+    def get_http_breaker(self, host) -> TorskelCircuitBreaker:
+        """
+        Returns circuit breaker of host
+        :param host: host
+        :return: TorskelCircuitBreaker
+        """
+        breaker = self.http_breakers.get(host)
+        if breaker is None:
+            breaker = TorskelCircuitBreaker(
+                host,
+                failure_threshold=options.http_breaker_failures,
+                reset_timeout=options.http_breaker_reset_timeout
+            )
+            self.http_breakers[host] = breaker
+        return breaker
+
+    def get_http_breakers_stats(self) -> dict:
+        """
+        Returns state of circuit breakers
+        :return: dict
+        """
+        return {
+            host: breaker.get_stats()
+            for host, breaker in self.http_breakers.items()
+        }
+
+    @staticmethod
+    def _decode_http_response(res_fetch, from_json=False, from_xml=False):
+        """
+        Returns body of response as str, dict from json or dict from xml
+        :param res_fetch: HTTPResponse
+        :param from_json: convert json to dict
+        :param from_xml: convert xml to dict
+        :return: decoded body
+        """
+        if res_fetch is None:
+            return None
+        # decoders read bytes without decoding to str
+        if from_xml:
+            return xml_to_dict(res_fetch.body)
+        if from_json:
+            return json_loads(res_fetch.body)
+        return res_fetch.body.decode(encoding="utf-8")
+
+    def get_http_cache_stats(self) -> dict:
+        """
+        Returns counters of http responses cache
+        :return: dict
+        """
+        return self.http_cache.get_stats() if self.http_cache else {}
+
+    def get_response_cache_stats(self) -> dict:
+        """
+        Returns counters of handlers responses cache
+        :return: dict
+        """
+        return self.response_cache.get_stats()
+
     async def http_request_post(self, url, body, **kwargs):
         """
         http request. Method POST
@@ -339,18 +914,11 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
             headers = None
             param_s = urlencode(body)
 
-            res_fetch = await self.http_client.fetch(url, method='POST',
-                                                     body=param_s,
-                                                     headers=headers, **kwargs)
+            res_fetch = await self.http_fetch(url, method='POST',
+                                              body=param_s,
+                                              headers=headers, **kwargs)
 
-            res_s = res_fetch.body.decode(encoding="utf-8") \
-                if res_fetch is not None else res_fetch
-
-            res = res_s
-            if from_json:
-                res = json.loads(res_s)
-            if from_xml:
-                res = json.loads(json.dumps(xmltodict.parse(res_s)))
+            res = self._decode_http_response(res_fetch, from_json, from_xml)
         except tornado.httpclient.HTTPError as exception:
             if exception.code == 599:
                 if log_timeout_exc is True:
@@ -369,8 +937,26 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
         :param url: url
         param from_json: boolean, convert response to dict
         none_if_err return None if failed request, default True
+        coalesce: share one request and its result between identical
+         concurrent calls, default use_http_coalescing option
+        use_cache: use cache of decoded responses, default use_http_cache
+         option
+        Results of coalesced and cached calls are the same object for all
+        callers, they are read-only: copy result before modifying it
         :return: response
         """
+        coalesce = kwargs.pop('coalesce', options.use_http_coalescing)
+        if coalesce:
+            key = get_request_key(
+                'GET', url, kwargs.get('headers'),
+                options.http_key_headers
+            ) + (kwargs.get('from_json', False), kwargs.get('from_xml', False))
+            return await self.http_single_flight.do(
+                key, self.http_request_get, url, coalesce=False, **kwargs
+            )
+
+        use_cache = kwargs.pop('use_cache', options.use_http_cache) \
+            and self.http_cache is not None
         from_json = kwargs.get('from_json', False)
         from_xml = kwargs.get('from_xml', False)
         log_timeout_exc = kwargs.get('log_timeout_exc', True)
@@ -384,18 +970,26 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
 
         self.log_debug(log_timeout_exc, grep_label='log_timeout_exc')
         res = None
+        cache_key = get_request_key(
+            'GET', url, kwargs.get('headers'), options.http_key_headers
+        ) + (from_json, from_xml) if use_cache else None
+        cache_entry = self.http_cache.get(cache_key) if use_cache else None
+        if cache_entry is not None:
+            if cache_entry.is_fresh:
+                return cache_entry.result
+            headers = dict(kwargs.get('headers') or {})
+            headers.update(cache_entry.get_validators())
+            kwargs['headers'] = headers
         try:
-            res_fetch = await self.http_client.fetch(url, **kwargs)
-            res_s = res_fetch.body.decode(encoding="utf-8") \
-                if res_fetch is not None else res_fetch
-
-            res = res_s
-            if from_json:
-                res = json.loads(res_s)
-
-            if from_xml:
-                res = json.loads(json.dumps(xmltodict.parse(res_s)))
+            res_fetch = await self.http_fetch(url, **kwargs)
+            res = self._decode_http_response(res_fetch, from_json, from_xml)
+            if use_cache and res_fetch is not None:
+                self.http_cache.store(cache_key, res_fetch, res)
         except tornado.httpclient.HTTPError as exception:
+            if cache_entry is not None and exception.code == 304:
+                self.http_cache.revalidated(cache_key, cache_entry,
+                                            exception.response)
+                return cache_entry.result
             if exception.code == 599:
                 if log_timeout_exc is True:
                     self.log_exc('http_request_get failed by timeout url = %s'
@@ -407,6 +1001,174 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
 
         return res
 
+    async def http_request_stream(self, url, stream_format, **kwargs):
+        """
+        http request which parses response body while it is downloaded.
+        Memory does not depend on size of response, failed request raises
+        HTTPError
+        :param url: url
+        :param stream_format: xml, json (needs ijson) or jsonl
+        param item_depth: depth of xml elements to yield, default 2
+        param item_prefix: ijson prefix of json items, default "item"
+        param max_records: max count of not consumed records, request
+         is aborted with BufferError when it is exceeded,
+         default http_stream_max_records
+        :return: async iterator of records
+        """
+        parser = get_stream_parser(
+            stream_format,
+            item_depth=kwargs.pop('item_depth', 2),
+            item_prefix=kwargs.pop('item_prefix', 'item')
+        )
+        consumer = TorskelStreamConsumer(
+            parser,
+            kwargs.pop('max_records', options.http_stream_max_records)
+        )
+
+        # retried or hedged request would yield records twice
+        fetch_future = asyncio.ensure_future(self.http_fetch(
+            url, streaming_callback=consumer, max_retries=0, hedge=False,
+            **kwargs
+        ))
+        fetch_future.add_done_callback(lambda _: consumer.ready.set())
+        try:
+            while True:
+                await consumer.ready.wait()
+                consumer.ready.clear()
+                while consumer.records:
+                    yield consumer.records.popleft()
+                if fetch_future.done():
+                    fetch_future.result()
+                    for record in parser.close():
+                        yield record
+                    break
+        finally:
+            # downloading goes on after cancel until callback raises
+            consumer.abort()
+            fetch_future.cancel()
+
+    async def _http_request_one(self, request, **kwargs):
+        """
+        Performs one request of http_request_many
+        :param request: url or dict with url, method, body and params
+         of http_request_get/http_request_post
+        :param kwargs: params common for all requests
+        :return: response
+        """
+        params = dict(kwargs)
+        params.update({'url': request} if isinstance(request, str)
+                      else request)
+        url = params.pop('url')
+        method = params.pop('method', 'GET').upper()
+        if method == 'POST':
+            return await self.http_request_post(
+                url, params.pop('body', {}), **params
+            )
+        if method == 'GET':
+            return await self.http_request_get(url, **params)
+        raise ValueError(f'Method {method} is not supported')
+
+    def _start_requests(self, requests, concurrency=None, **kwargs):
+        """
+        Starts requests with limit of concurrent requests
+        :param requests: list of urls or dicts
+        :param concurrency: max count of concurrent requests
+        :param kwargs: params common for all requests
+        :return: list of futures
+        """
+        semaphore = tornado.locks.Semaphore(
+            concurrency or options.http_many_concurrency
+        )
+
+        async def run(request):
+            async with semaphore:
+                return await self._http_request_one(request, **kwargs)
+
+        return [asyncio.ensure_future(run(request)) for request in requests]
+
+    @staticmethod
+    def _get_request_result(future, none_if_err=True):
+        """
+        Returns result of request started by _start_requests
+        :param future: future of request
+        :param none_if_err: return None if request failed or not finished
+        :return: response
+        """
+        if not future.done():
+            future.cancel()
+            if none_if_err:
+                return None
+            raise tornado.httpclient.HTTPError(
+                599, 'Timeout of http_request_many'
+            )
+        if future.exception() is not None and none_if_err:
+            return None
+        return future.result()
+
+    async def http_request_many(self, requests, concurrency=None,
+                                timeout=None, **kwargs) -> list:
+        """
+        Performs many http requests concurrently
+        :param requests: list of urls or dicts with url, method (GET or POST),
+         body and params of http_request_get/http_request_post
+        :param concurrency: max count of concurrent requests,
+         default http_many_concurrency option
+        :param timeout: max time in seconds for all requests
+        :param kwargs: params common for all requests: from_json, from_xml,
+         none_if_err etc.
+        :return: list of responses in order of requests
+        """
+        none_if_err = kwargs.get('none_if_err', True)
+        futures = self._start_requests(requests, concurrency, **kwargs)
+        if futures:
+            await asyncio.wait(futures, timeout=timeout)
+        try:
+            res = [self._get_request_result(future, none_if_err)
+                   for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+        return res
+
+    async def http_request_many_iter(self, requests, concurrency=None,
+                                     timeout=None, **kwargs):
+        """
+        Performs many http requests concurrently and yields responses
+        as they complete
+        :param requests: list of urls or dicts, see http_request_many
+        :param concurrency: max count of concurrent requests,
+         default http_many_concurrency option
+        :param timeout: max time in seconds for all requests
+        :param kwargs: params common for all requests
+        :return: async iterator of (index of request, response)
+        """
+        none_if_err = kwargs.get('none_if_err', True)
+        futures = self._start_requests(requests, concurrency, **kwargs)
+        indexes = {future: i for i, future in enumerate(futures)}
+        loop = tornado.ioloop.IOLoop.current()
+        deadline = loop.time() + timeout if timeout is not None else None
+        pending = set(futures)
+        try:
+            while pending:
+                remaining = deadline - loop.time() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in sorted(done, key=indexes.get):
+                    yield indexes[future], self._get_request_result(
+                        future, none_if_err
+                    )
+            for future in sorted(pending, key=indexes.get):
+                yield indexes[future], self._get_request_result(
+                    future, none_if_err
+                )
+        finally:
+            for future in futures:
+                future.cancel()
+
     def _set_mail_logging(self, log_level=logging.ERROR):
         """
         Init SMTP log handler for sendig log to email
@@ -433,6 +1195,48 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
         mail_logging.setLevel(log_level)
         self.logger.addHandler(mail_logging)
 
+    def get_event_sinks(self) -> list:
+        """
+        Returns destinations of events by events_sinks option,
+        can be overridden for sinks with custom settings
+        :return: list of TorskelEventSink
+        """
+        common = {
+            'max_queue_size': options.events_queue_max_size,
+            'write_timeout': options.events_write_timeout or None,
+            'retries': options.events_sink_retries,
+        }
+        sinks = []
+        for name in options.events_sinks:
+            if name == 'mongo':
+                sinks.append(TorskelMongoEventSink(
+                    lambda: self.mongo_pool, options.events_collection_name,
+                    spill=self.events_spill, **common
+                ))
+            elif name == 'file':
+                path = options.events_file_path
+                if self.task_id is not None:
+                    path = f'{path}.{self.task_id}'
+                sinks.append(TorskelFileEventSink(
+                    path, options.events_file_max_bytes,
+                    options.events_file_backup_count, **common
+                ))
+            elif name == 'redis':
+                sinks.append(TorskelRedisStreamEventSink(
+                    self, options.events_redis_stream,
+                    options.events_redis_max_len, **common
+                ))
+            else:
+                raise ValueError(f'Unknown events sink {name}')
+        return sinks
+
+    def get_events_writer_stats(self) -> dict:
+        """
+        Returns throughput of events writer and lag of events in queue
+        :return: dict
+        """
+        return self.event_writer.get_stats()
+
     async def write_log_from_queue(self) -> type(None):
         """
          Retrieves events from the queue.
@@ -447,3 +1251,19 @@ class TorskelServer(Application, RedisApplicationMixin, TorskelLogMixin):
                 options.events_collection_name,
                 bulk_mongo_insert
             )
+
+    # pylint: disable=W0703
+    async def flush_events(self) -> type(None):
+        """
+        Writes all events from the queue into sinks and stops sinks,
+        events which can not be written are saved on disk if spill is set
+        """
+        await self.event_writer.drain(self.event_writer.write_to_sinks)
+        for sink in self.event_writer.sinks:
+            qsize = sink.get_stats()['queue_size']
+            self.log_info(f'Writing {qsize} events into {sink.name}')
+            await sink.stop()
+            spilled = sink.get_stats()['spill']
+            if spilled is not None and spilled['segments']:
+                self.log_err(f'{spilled["spilled"]} events of {sink.name} '
+                             'are saved on disk')
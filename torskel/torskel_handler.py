@@ -3,28 +3,24 @@ Module with RequestHandler
 """
 
 # pylint: disable=W0511
-import json
-from datetime import datetime
+import time
 
 import xmltodict
 
-from user_agents import parse
-
+import tornado.escape
 from tornado.options import options
 from tornado.web import RequestHandler
 from torskel.str_utils import get_hash_str
 from torskel.str_utils import is_hash_str
 from torskel.torskel_mixins.log_mix import TorskelLogMixin
-from torskel.libs.str_consts import EVENTS_USER_AGENT
-from torskel.libs.str_consts import EVENTS_DATE
-from torskel.libs.str_consts import EVENTS_IP
-from torskel.libs.str_consts import EVENTS_METHOD
-from torskel.libs.str_consts import EVENTS_URL
-from torskel.libs.str_consts import EVENTS_SRV_NAME
-from torskel.libs.str_consts import EVENTS_HTTP_HEADERS
 from torskel.str_utils import default_json_dt
 from torskel.libs.auth.jwt import jwt_encode
 from torskel.libs.auth.jwt import jwt_decode
+from torskel.libs.json_codec import json_dumps
+from torskel.libs.event_controller import EVENT_DROPPED
+from torskel.libs.event_record import TorskelEventRecord
+from torskel.libs.event_record import get_headers_items
+from torskel.libs.event_record import get_user_agent_name
 
 
 # pylint: disable=W0223
@@ -32,8 +28,20 @@ class TorskelHandler(RequestHandler, TorskelLogMixin):
     """
     Request Handler class
     """
+    # chunks of body written before the first flush,
+    # None after flush, clear is called by RequestHandler.__init__
+    captured_chunks = None
+
     def __init__(self, application, request, **kwargs):
         super(TorskelHandler, self).__init__(application, request, **kwargs)
+        # handlers can be mounted in plain tornado Application
+        register_handler = getattr(self.application, 'register_handler',
+                                   None)
+        if register_handler is not None:
+            register_handler(self)
+        self.capture_response = False
+        self.captured_response = None
+        self.captured_chunks = []
         # filter dict by list of keys
         # pylint: disable=R1717
         self.filter_dict = lambda x, y: dict(
@@ -132,6 +140,55 @@ class TorskelHandler(RequestHandler, TorskelLogMixin):
         remote_ip = x_real_ip or self.request.remote_ip
         return remote_ip
 
+    def write(self, chunk):
+        """
+        Writes chunk into output buffer, keeps it for response cache
+        if capture_response is set
+        :param chunk: bytes, str or dict
+        :return:
+        """
+        super(TorskelHandler, self).write(chunk)
+        if self.capture_response and self.captured_chunks is not None:
+            if isinstance(chunk, dict):
+                chunk = tornado.escape.json_encode(chunk)
+            self.captured_chunks.append(tornado.escape.utf8(chunk))
+
+    def flush(self, include_footers=False):
+        """
+        Sends output buffer, response is not captured after it
+        :param include_footers: finish chunked response
+        :return: Future
+        """
+        self.captured_chunks = None
+        return super(TorskelHandler, self).flush(include_footers)
+
+    def clear(self):
+        """
+        Resets headers and body of response
+        :return:
+        """
+        super(TorskelHandler, self).clear()
+        if self.captured_chunks is not None:
+            self.captured_chunks = []
+
+    def finish(self, chunk=None):
+        """
+        Finishes response, keeps status, headers and body for response cache
+        if capture_response is set and nothing was flushed before
+        :param chunk: last chunk of body
+        :return: Future
+        """
+        if self.capture_response and self.captured_chunks is not None:
+            if chunk is not None:
+                self.write(chunk)
+                chunk = None
+            # pylint: disable=W0212
+            self.captured_response = (
+                self.get_status(), list(self._headers.get_all()),
+                b''.join(self.captured_chunks)
+            )
+        return super(TorskelHandler, self).finish(chunk)
+
     def _handle_request_exception(self, e):
         super(TorskelHandler, self)._handle_request_exception(e)
         msg = '''handler classname = %s \n
@@ -160,6 +217,43 @@ class TorskelHandler(RequestHandler, TorskelLogMixin):
         """
         return await self.application.http_request_post(url, body, **kwargs)
 
+    async def http_request_stream(self, url, stream_format, **kwargs):
+        """
+        async http request, yields records while response is downloaded
+        :param url: url
+        :param stream_format: xml, json or jsonl
+        :return: async iterator of records
+        """
+        async for record in self.application.http_request_stream(
+                url, stream_format, **kwargs):
+            yield record
+
+    async def http_request_many(self, requests, concurrency=None,
+                                timeout=None, **kwargs):
+        """
+        async http requests with limit of concurrent requests
+        :param requests: list of urls or dicts with url, method, body
+        :param concurrency: max count of concurrent requests
+        :param timeout: max time in seconds for all requests
+        :return: list of responses in order of requests
+        """
+        return await self.application.http_request_many(
+            requests, concurrency, timeout, **kwargs
+        )
+
+    async def http_request_many_iter(self, requests, concurrency=None,
+                                     timeout=None, **kwargs):
+        """
+        async http requests, yields responses as they complete
+        :param requests: list of urls or dicts with url, method, body
+        :param concurrency: max count of concurrent requests
+        :param timeout: max time in seconds for all requests
+        :return: async iterator of (index of request, response)
+        """
+        async for item in self.application.http_request_many_iter(
+                requests, concurrency, timeout, **kwargs):
+            yield item
+
     # TODO refact add params to kwargs
     async def set_redis_exp_val(self, key, val, exp=None, **kwargs):
         """
@@ -191,6 +285,65 @@ class TorskelHandler(RequestHandler, TorskelLogMixin):
         res = await self.application.get_redis_val(key, **kwargs)
         return res
 
+    async def get_redis_vals(self, keys, **kwargs):
+        """
+        get values from redis by list of keys
+        :param keys: list of keys
+        :param from_json: loads from json
+        :param use_json_utils: bool use json utils from bson
+        :return: list of values
+        """
+        return await self.application.get_redis_vals(keys, **kwargs)
+
+    async def set_redis_vals(self, values, exp=None, **kwargs):
+        """
+        Write values to redis
+        :param values: dict key - value
+        :param exp: Expire time in seconds, int or dict key - expire time
+        :param convert_to_json: bool
+        :param use_json_utils: bool use json utils from bson
+        """
+        await self.application.set_redis_vals(values, exp, **kwargs)
+
+    async def del_redis_vals(self, keys):
+        """
+        delete values from redis by list of keys
+        :param keys: list of keys
+        :return: count of deleted keys
+        """
+        return await self.application.del_redis_vals(keys)
+
+    def redis_pipeline(self, transaction=False):
+        """
+        Returns pipeline of redis commands
+        :param transaction: wrap commands into MULTI/EXEC
+        :return: TorskelRedisPipeline
+        """
+        return self.application.redis_pipeline(transaction)
+
+    async def get_or_compute_redis_val(self, key, compute, exp, **kwargs):
+        """
+        Returns value from redis or computes it under redis lock
+        :param key: key
+        :param compute: function or coroutine function without arguments
+        :param exp: Expire time in seconds
+        :param stale_exp: seconds while stale value can be returned
+        :return: value
+        """
+        return await self.application.get_or_compute_redis_val(
+            key, compute, exp, **kwargs
+        )
+
+    async def enqueue_redis_job(self, queue, job, payload=None):
+        """
+        Adds background job into redis queue
+        :param queue: TorskelJobQueue
+        :param job: name of job
+        :param payload: JSON serializable arguments of job
+        :return: id of job
+        """
+        return await self.application.enqueue_redis_job(queue, job, payload)
+
     def get_current_url(self):
         """
         Get current handler url for urls named by class name
@@ -203,11 +356,9 @@ class TorskelHandler(RequestHandler, TorskelLogMixin):
         Defines the device, OS and user browser by the User-Agent header
         :return: str
         """
-        try:
-            ua_string = self.request.headers["User-Agent"]
-            user_agent = str(parse(ua_string))
-        except KeyError:
-            user_agent = 'Unknown'
+        user_agent = get_user_agent_name(
+            self.request.headers.get('User-Agent')
+        )
         self.log_debug(user_agent, grep_label='USER_AGENT')
         return user_agent
 
@@ -229,60 +380,45 @@ class TorskelHandler(RequestHandler, TorskelLogMixin):
 
     def add_log_event(self, event=None, use_legacy_event=True):
         """
-        Add event into LOgWriter queue
+        Add event into LOgWriter queue. Result can be awaited, with block
+        overflow policy it waits free place in full queue
         :param event:
         :param use_legacy_event:
-        :return:
+        :return: awaitable, result is False if event is dropped
         """
-        if event is None:
+        if not isinstance(event, dict):
             event = {}
         if use_legacy_event:
-            legacy_event = self._get_event_skeleton(options.use_lite_event)
+            compl_event = self._get_event_skeleton(options.use_lite_event)
+            compl_event.update(event)
         else:
-            legacy_event = {}
-
-        if isinstance(event, dict):
-            legacy_event.update(event)
-            compl_event = legacy_event
-        else:
-            compl_event = legacy_event
+            compl_event = event
 
         if compl_event:
-            self.application.event_writer.add_log_event(compl_event)
+            return self.application.event_writer.add_log_event(compl_event)
+        return EVENT_DROPPED
 
     def _get_event_skeleton(self, lite_event=False):
         """
-        Returns skeleton of event for logging
+        Returns skeleton of event for logging. Only raw values are kept,
+        user agent is parsed by events writer. Record supports item
+        access and update like dict, to_dict returns document
         :param lite_event: flag for using lite event dict
-        :return: dict
-        """
-        user_agent = self.get_user_agent()
-        url = self.request.uri
-        try:
-            user_agent = user_agent[:128]
-            url = url[:128]
-        except TypeError:
-            pass
-
-        # pylint: disable=C0103
-        ip = self.get_user_ip()
-        res = {
-            EVENTS_DATE: datetime.now(),
-            EVENTS_USER_AGENT: user_agent,
-            EVENTS_IP: ip,
-            EVENTS_HTTP_HEADERS: self.request.headers
-        }
-
+        :return: TorskelEventRecord
+        """
+        request = self.request
+        headers = request.headers
+        record = TorskelEventRecord(
+            time.time(),
+            headers.get('User-Agent'),
+            self.get_user_ip(),
+            get_headers_items(headers, options.events_http_headers)
+        )
         if not lite_event:
-            add_info = {
-                EVENTS_URL: url,
-                EVENTS_SRV_NAME: self.application.server_name,
-                EVENTS_METHOD: self.request.method,
-
-            }
-            res.update(add_info)
-
-        return res
+            record.url = request.uri
+            record.server_name = self.application.server_name
+            record.method = request.method
+        return record
 
     @staticmethod
     def default_json_dt(json_object):
@@ -313,7 +449,7 @@ class TorskelHandler(RequestHandler, TorskelLogMixin):
         res = {res_code_key: code, res_msg_key: msg}
         res.update(additional_dict)
         if kwargs.get('to_json', False):
-            res = json.dumps(res)
+            res = json_dumps(res)
         return res
 
     @staticmethod
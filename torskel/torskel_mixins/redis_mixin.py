@@ -1,9 +1,11 @@
 """
 Module contains class for work with Redis
 """
-import json
+import time
 import asyncio
+import hashlib
 import importlib
+from functools import lru_cache
 
 import tornado.web
 import tornado.httpclient
@@ -11,21 +13,65 @@ import tornado.log
 
 from tornado.options import options
 
+from torskel.libs.json_codec import json_dumps_bytes
+from torskel.libs.json_codec import json_loads
+from torskel.libs.redis_codec import TorskelRedisValueCodec
+from torskel.libs.redis_codec import is_encoded
+from torskel.libs.redis_codec import VALUE_FORMAT_LEGACY
+from torskel.libs.redis_jobs import TorskelJobWorker
+from torskel.libs.redis_pipeline import TorskelRedisPipeline
+from torskel.libs.redis_pool import TorskelRedisHealth
+from torskel.libs.redis_pool import get_redis_pool_class
+from torskel.libs.redis_pool import get_redis_pool_stats
+from torskel.libs.redis_lock import TorskelRedisLock
+from torskel.libs.redis_lock import is_early_expired
+from torskel.libs.redis_shards import TorskelShardedRedisPool
+from torskel.libs.redis_shards import get_related_key
+from torskel.libs.redis_shards import parse_redis_node
+from torskel.libs.single_flight import TorskelSingleFlight
+
+_MISSING = object()
+
+
+@lru_cache(maxsize=None)
+def _get_script_sha(script) -> str:
+    """
+    Returns SHA1 of lua script for EVALSHA
+    :param script: lua script
+    :return: str
+    """
+    return hashlib.sha1(script.encode('utf-8')).hexdigest()
+
 
 class RedisApplicationMixin():
     """
     Redis controller
     """
-    def __init__(self):
+    def __init__(self, near_cache=None, value_codec=None):
+        """
+        :param near_cache: TorskelRedisNearCache or None
+        :param value_codec: TorskelRedisValueCodec, default json
+        """
         self.logger = tornado.log.gen_log
         self.redis_connection_pool = None
+        self.redis_near_cache = near_cache
+        self.redis_invalidation_task = None
+        self.redis_single_flight = TorskelSingleFlight()
+        self.redis_value_codec = value_codec or TorskelRedisValueCodec()
+        self.redis_pool_future = None
+        self.redis_health_task = None
+        self.redis_health = TorskelRedisHealth()
+        self.redis_job_workers = []
 
     @property
     def redis_addr(self) -> str:
         """
-        Returns address for connecting to redis
+        Returns address for connecting to redis, the first node
+        if redis is sharded
         :return: str
         """
+        if options.redis_nodes:
+            return parse_redis_node(options.redis_nodes[0])
         redis_addr = options.redis_socket if options.use_redis_socket \
             else (options.redis_host, options.redis_port)
         return redis_addr
@@ -83,24 +129,373 @@ class RedisApplicationMixin():
             json_util = False
         return json_util
 
+    def _get_json_default(self, use_json_utils=False):
+        """
+        Returns default hook for JSON encoding
+        :param use_json_utils: use json utils from bson
+        :return: callable or None
+        """
+        if not use_json_utils:
+            return None
+        json_util = self._get_json_util()
+        if not json_util:
+            raise ImportError('Can not import json_util. '
+                              'Module bson is missing')
+        return json_util.default
+
+    def _get_json_object_hook(self, use_json_utils=False):
+        """
+        Returns object hook for JSON decoding
+        :param use_json_utils: use json utils from bson
+        :return: callable or None
+        """
+        if not use_json_utils:
+            return None
+        json_util = self._get_json_util()
+        if not json_util:
+            raise ImportError('Can not import json_util. '
+                              'Module bson is missing')
+        return json_util.object_hook
+
+    async def _create_redis_pool(self, addr):
+        """
+        Creates redis connection pool, minsize connections are opened
+        on creation
+        :param addr: address of redis
+        :return: pool
+        """
+        try:
+            aioredis = importlib.import_module('aioredis')
+        except ImportError:
+            raise ImportError('Required package aioredis is missing')
+        return await aioredis.create_pool(
+            addr,
+            password=self.redis_psw,
+            db=self.redis_db,
+            minsize=self.redis_min_con,
+            maxsize=self.redis_max_con,
+            create_connection_timeout=options.redis_connect_timeout,
+            pool_cls=get_redis_pool_class(aioredis)
+        )
+
+    async def create_redis_connection_pool(self):
+        """
+        Creates pool of redis or sharded pool if redis_nodes are set
+        :return: pool or TorskelShardedRedisPool
+        """
+        if not options.redis_nodes:
+            return await self._create_redis_pool(self.redis_addr)
+        pools = await asyncio.gather(*[
+            self._create_redis_pool(parse_redis_node(node))
+            for node in options.redis_nodes
+        ], return_exceptions=True)
+        errors = [pool for pool in pools if isinstance(pool, Exception)]
+        if errors:
+            for pool in pools:
+                if not isinstance(pool, Exception):
+                    pool.close()
+            raise errors[0]
+        return TorskelShardedRedisPool(
+            dict(zip(options.redis_nodes, pools)),
+            vnodes=options.redis_virtual_nodes
+        )
+
+    async def get_redis_pool(self):
+        """
+        Returns redis pool, connects on first use.
+        Concurrent callers wait for the same connection
+        :return: pool or TorskelShardedRedisPool
+        """
+        pool = self.redis_connection_pool
+        if pool is not None:
+            return pool
+        if self.redis_pool_future is None:
+            self.redis_pool_future = asyncio.ensure_future(
+                self._connect_redis()
+            )
+        return await asyncio.shield(self.redis_pool_future)
+
+    async def _connect_redis(self):
+        """
+        Creates redis pool, next call of get_redis_pool tries again
+        if connection is failed
+        :return: pool or TorskelShardedRedisPool
+        """
+        try:
+            started = time.monotonic()
+            pool = await self.create_redis_connection_pool()
+        except Exception as exc:
+            self._record_redis_failure(exc)
+            raise
+        finally:
+            self.redis_pool_future = None
+        self.redis_health.connects += 1
+        self.redis_health.record_success(time.monotonic() - started)
+        self.redis_connection_pool = pool
+        self.logger.info('Redis connection pool is created')
+        return pool
+
+    async def create_redis_connection(self, key=None):
+        """
+        Opens connection outside of pool for blocking commands,
+        to the node of key if redis is sharded
+        :param key: key
+        :return: connection
+        """
+        try:
+            aioredis = importlib.import_module('aioredis')
+        except ImportError:
+            raise ImportError('Required package aioredis is missing')
+        addr = self.redis_addr
+        pool = await self.get_redis_pool()
+        if isinstance(pool, TorskelShardedRedisPool):
+            addr = parse_redis_node(pool.get_node([key] if key else []))
+        return await aioredis.create_connection(
+            addr, password=self.redis_psw, db=self.redis_db,
+            timeout=options.redis_connect_timeout
+        )
+
+    def _get_redis_pools(self) -> dict:
+        """
+        Returns pools of redis nodes
+        :return: dict address - pool
+        """
+        pool = self.redis_connection_pool
+        if pool is None:
+            return {}
+        if isinstance(pool, TorskelShardedRedisPool):
+            return pool.pools
+        addr = self.redis_addr
+        if isinstance(addr, tuple):
+            addr = '{}:{}'.format(*addr)
+        return {addr: pool}
+
+    def _record_redis_failure(self, exc):
+        """
+        Records failure of redis, logs only the first one in a row
+        :param exc: exception
+        :return:
+        """
+        if self.redis_health.is_healthy or not self.redis_health.failures:
+            self.logger.warning('Redis is not available: %r', exc)
+        self.redis_health.record_failure(exc)
+
+    async def check_redis_health(self) -> bool:
+        """
+        Connects to redis if needed and sends PING to every node
+        :return: bool
+        """
+        try:
+            await self.get_redis_pool()
+        except Exception:  # pylint: disable=W0703
+            return False
+        try:
+            started = time.monotonic()
+            await asyncio.wait_for(asyncio.gather(*[
+                pool.execute('ping') for pool in
+                self._get_redis_pools().values()
+            ]), options.redis_connect_timeout)
+        except Exception as exc:  # pylint: disable=W0703
+            self._record_redis_failure(exc)
+            return False
+        if not self.redis_health.is_healthy and self.redis_health.failures:
+            self.logger.info('Redis is available again')
+        self.redis_health.record_success(time.monotonic() - started)
+        return True
+
+    async def monitor_redis(self):
+        """
+        Checks redis every redis_health_check_interval seconds, after
+        failures checks are repeated with exponential backoff.
+        aioredis pool replaces broken connections itself
+        :return:
+        """
+        backoff = 0.1
+        while True:
+            if await self.check_redis_health():
+                backoff = 0.1
+                await asyncio.sleep(options.redis_health_check_interval)
+            else:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, options.redis_reconnect_max_delay)
+
     def init_redis_pool(self):
         """
-        Init redis connection pool
+        Starts connecting to redis and health checks without blocking,
+        requests wait for connection on first use
+        """
+        if self.redis_health_task is None:
+            self.redis_health_task = asyncio.ensure_future(
+                self.monitor_redis()
+            )
+
+    def get_redis_pool_stats(self) -> dict:
+        """
+        Returns health state and sizes of redis pools
+        :return: dict
+        """
+        stats = self.redis_health.get_stats()
+        stats['pools'] = {
+            addr: get_redis_pool_stats(pool)
+            for addr, pool in self._get_redis_pools().items()
+        }
+        return stats
+
+    async def close_redis_pool(self):
+        """
+        Close redis connection pool
+        """
+        await self.stop_redis_job_workers()
+        for task_name in ('redis_invalidation_task', 'redis_health_task'):
+            task = getattr(self, task_name)
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                setattr(self, task_name, None)
+        if self.redis_connection_pool is not None:
+            self.redis_connection_pool.close()
+            await self.redis_connection_pool.wait_closed()
+            self.redis_connection_pool = None
+
+    # ############ #
+    #  Near cache  #
+    # ############ #
+
+    def start_redis_invalidation_listener(self):
+        """
+        Starts listening of near cache invalidation messages
+        :return:
+        """
+        if self.redis_near_cache is not None \
+                and self.redis_invalidation_task is None:
+            self.redis_invalidation_task = asyncio.ensure_future(
+                self.listen_redis_invalidations()
+            )
+
+    async def listen_redis_invalidations(self):
+        """
+        Subscribes to invalidation channel and removes changed keys from
+        near cache. Near cache is offline while subscription is broken,
+        subscription is restored with exponential backoff
+        :return:
         """
         try:
             aioredis = importlib.import_module('aioredis')
-            self.redis_connection_pool \
-                = asyncio.get_event_loop().run_until_complete(
-                    aioredis.create_pool(
-                        self.redis_addr,
-                        password=self.redis_psw,
-                        db=self.redis_db,
-                        minsize=self.redis_min_con,
-                        maxsize=self.redis_max_con
-                    )
-                )
         except ImportError:
             raise ImportError('Required package aioredis is missing')
+        delay = 0.1
+        while True:
+            conn = None
+            try:
+                conn = await aioredis.create_connection(
+                    self.redis_addr, password=self.redis_psw
+                )
+                channel = aioredis.Channel(
+                    options.redis_invalidation_channel, is_pattern=False
+                )
+                await conn.execute_pubsub('subscribe', channel)
+                self.redis_near_cache.set_online(True)
+                delay = 0.1
+                async for msg in channel.iter():
+                    self.redis_near_cache.invalidate(json_loads(msg))
+                self.logger.warning('Redis invalidation channel is closed')
+            except (OSError, aioredis.RedisError, ValueError) as exc:
+                self.logger.warning('Redis invalidation listener error: %s',
+                                    exc)
+            finally:
+                self.redis_near_cache.set_online(False)
+                if conn is not None:
+                    conn.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 10)
+
+    def get_redis_invalidation_message(self, keys):
+        """
+        Returns arguments of PUBLISH command which invalidates keys
+        in near caches of all workers
+        :param keys: list of keys
+        :return: list
+        """
+        return [
+            options.redis_invalidation_channel,
+            json_dumps_bytes([self.redis_near_cache.get_key(key)
+                              for key in keys])
+        ]
+
+    @staticmethod
+    def _get_near_cache_variant(**kwargs) -> tuple:
+        """
+        Returns decoding flags of value
+        :return: tuple
+        """
+        return (kwargs.get('from_json', False),
+                kwargs.get('use_json_utils', False))
+
+    def get_redis_near_cache_stats(self) -> dict:
+        """
+        Returns counters of near cache
+        :return: dict or None if near cache is disabled
+        """
+        if self.redis_near_cache is None:
+            return None
+        return self.redis_near_cache.get_stats()
+
+    def _encode_redis_val(self, val, **kwargs):
+        """
+        Encodes value for writing to redis
+        :param val: value
+        param convert_to_json: bool
+        param use_json_utils: bool use json utils from bson
+        :return: value
+        """
+        if kwargs.get('convert_to_json', False):
+            val = self.redis_value_codec.encode(
+                val, default=self._get_json_default(
+                    kwargs.get('use_json_utils', False)
+                )
+            )
+        return val
+
+    def _decode_redis_val(self, val, **kwargs):
+        """
+        Decodes value read from redis. If value codec is not legacy,
+        values written by it are decoded without from_json
+        :param val: bytes
+        param from_json: loads from json
+        param use_json_utils: bool use json utils from bson
+        :return: value
+        """
+        if val:
+            if kwargs.get('from_json', False) or (
+                    self.redis_value_codec.value_format != VALUE_FORMAT_LEGACY
+                    and is_encoded(val)):
+                res = self.redis_value_codec.decode(
+                    val, object_hook=self._get_json_object_hook(
+                        kwargs.get('use_json_utils', False)
+                    )
+                )
+            else:
+                res = val.decode('utf-8')
+        else:
+            res = None
+        return res
+
+    @staticmethod
+    def _get_set_args(key, val, exp=None) -> list:
+        """
+        Returns arguments of SET command
+        :param key: key
+        :param val: value
+        :param exp: Expire time in seconds
+        :return: list
+        """
+        args = [key, val]
+        if isinstance(exp, int):
+            args.extend(['EX', exp])
+        return args
 
     async def set_redis_exp_val(self, key, val, exp=None, **kwargs):
         """
@@ -112,23 +507,15 @@ class RedisApplicationMixin():
         param use_json_utils: bool use json utils from bson
 
         """
-
-        convert_to_json = kwargs.get('convert_to_json', False)
-        use_json_utils = kwargs.get('use_json_utils', False)
-        if convert_to_json:
-            if use_json_utils:
-                json_util = self._get_json_util()
-                if json_util:
-                    val = json.dumps(val, default=json_util.default)
-                else:
-                    raise ImportError('Can not import json_util. '
-                                      'Module bson is missing')
-            else:
-                val = json.dumps(val)
-
-        await self.redis_connection_pool.execute('set', key, val)
-        if isinstance(exp, int):
-            await self.redis_connection_pool.execute('expire', key, exp)
+        if self.redis_near_cache is not None:
+            async with self.redis_pipeline() as pipe:
+                pipe.set_val(key, val, exp, **kwargs)
+            return
+        val = self._encode_redis_val(val, **kwargs)
+        pool = await self.get_redis_pool()
+        await pool.execute(
+            'set', *self._get_set_args(key, val, exp)
+        )
 
     async def del_redis_val(self, key):
         """
@@ -136,8 +523,7 @@ class RedisApplicationMixin():
         :param key: key
 
         """
-
-        await self.redis_connection_pool.execute('del', key)
+        await self.del_redis_vals([key])
 
     async def get_redis_val(self, key: str, **kwargs):
         """
@@ -145,27 +531,277 @@ class RedisApplicationMixin():
         :param key: key
         param from_json: loads from json
         param use_json_utils: bool use json utils from bson
+        param near_cache: use near cache if it is enabled, default True
         :return: value
         """
+        near_cache = self.redis_near_cache \
+            if kwargs.pop('near_cache', True) else None
+        if near_cache is None:
+            pool = await self.get_redis_pool()
+            val = await pool.execute('get', key)
+            return self._decode_redis_val(val, **kwargs)
 
-        from_json = kwargs.get('from_json', False)
-        use_json_utils = kwargs.get('use_json_utils', False)
+        variant = self._get_near_cache_variant(**kwargs)
+        res = near_cache.get(key, variant, _MISSING)
+        if res is _MISSING:
+            generation = near_cache.generation
+            pool = await self.get_redis_pool()
+            val = await pool.execute('get', key)
+            res = self._decode_redis_val(val, **kwargs)
+            near_cache.store(key, variant, res, generation)
+        return res
 
-        val = await self.redis_connection_pool.execute('get', key)
-        redis_val = val.decode('utf-8') if val is not None else val
-        if redis_val:
-            if use_json_utils:
-                json_util = self._get_json_util()
-                if json_util:
-                    res = json.loads(
-                        redis_val, object_hook=json_util.object_hook
-                    ) if from_json else redis_val
-                else:
-                    raise ImportError('Can not import json_util. '
-                                      'Module bson is missing')
+    # ################# #
+    #  Batch functions  #
+    # ################# #
 
-            else:
-                res = json.loads(redis_val) if from_json else redis_val
-        else:
-            res = None
+    async def get_redis_vals(self, keys, **kwargs) -> list:
+        """
+        get values from redis by list of keys with one MGET
+        :param keys: list of keys
+        param from_json: loads from json
+        param use_json_utils: bool use json utils from bson
+        param near_cache: use near cache if it is enabled, default True
+        :return: list of values in order of keys, None for missing keys
+        """
+        if not keys:
+            return []
+        near_cache = self.redis_near_cache \
+            if kwargs.pop('near_cache', True) else None
+        if near_cache is None:
+            pool = await self.get_redis_pool()
+            vals = await pool.execute('mget', *keys)
+            return [self._decode_redis_val(val, **kwargs) for val in vals]
+
+        variant = self._get_near_cache_variant(**kwargs)
+        res = [near_cache.get(key, variant, _MISSING) for key in keys]
+        missed = [key for key, val in zip(keys, res) if val is _MISSING]
+        if missed:
+            generation = near_cache.generation
+            pool = await self.get_redis_pool()
+            vals = iter(await pool.execute('mget', *missed))
+            for i, val in enumerate(res):
+                if val is _MISSING:
+                    res[i] = self._decode_redis_val(next(vals), **kwargs)
+                    near_cache.store(keys[i], variant, res[i], generation)
         return res
+
+    async def set_redis_vals(self, values: dict, exp=None, **kwargs):
+        """
+        Write values to redis in one pipeline
+        :param values: dict key - value
+        :param exp: Expire time in seconds, int for all keys
+         or dict key - expire time
+        param convert_to_json: bool
+        param use_json_utils: bool use json utils from bson
+        """
+        async with self.redis_pipeline() as pipe:
+            for key, val in values.items():
+                key_exp = exp.get(key) if isinstance(exp, dict) else exp
+                pipe.set_val(key, val, key_exp, **kwargs)
+
+    async def del_redis_vals(self, keys) -> int:
+        """
+        delete values from redis by list of keys with one DEL
+        :param keys: list of keys
+        :return: count of deleted keys
+        """
+        if not keys:
+            return 0
+        if self.redis_near_cache is not None:
+            async with self.redis_pipeline() as pipe:
+                pipe.del_val(*keys)
+            return pipe.results[0]
+        pool = await self.get_redis_pool()
+        return await pool.execute('del', *keys)
+
+    def redis_pipeline(self, transaction=False):
+        """
+        Returns pipeline, commands are sent in one round-trip on exit
+        from context manager:
+            async with self.redis_pipeline() as pipe:
+                pipe.set_val('key', 'val', 10)
+                pipe.get_val('key2')
+            pipe.results
+        :param transaction: wrap commands into MULTI/EXEC
+        :return: TorskelRedisPipeline
+        """
+        return TorskelRedisPipeline(self, transaction)
+
+    # ###### #
+    #  Jobs  #
+    # ###### #
+
+    async def enqueue_redis_job(self, queue, job, payload=None) -> str:
+        """
+        Adds job into queue, handler returns without waiting for it
+        :param queue: TorskelJobQueue
+        :param job: name of job
+        :param payload: JSON serializable arguments of job
+        :return: id of job
+        """
+        return await queue.enqueue(self, job, payload)
+
+    def start_redis_job_worker(self, queue, **kwargs):
+        """
+        Starts consuming jobs of queue in this process
+        :param queue: TorskelJobQueue
+        param concurrency: max count of running jobs, default 10
+        param consumer: name of consumer, default host-pid
+        :return: TorskelJobWorker
+        """
+        worker = TorskelJobWorker(self, queue, **kwargs)
+        worker.start()
+        self.redis_job_workers.append(worker)
+        return worker
+
+    async def stop_redis_job_workers(self, timeout=None):
+        """
+        Stops job workers, waits running jobs
+        :param timeout: seconds, default job_timeout of queues
+        :return:
+        """
+        workers, self.redis_job_workers = self.redis_job_workers, []
+        await asyncio.gather(*[worker.stop(timeout) for worker in workers])
+
+    def get_redis_job_workers_stats(self) -> dict:
+        """
+        Returns counters of job workers
+        :return: dict name of queue - list of stats
+        """
+        stats = {}
+        for worker in self.redis_job_workers:
+            stats.setdefault(worker.queue.name, []).append(
+                worker.get_stats()
+            )
+        return stats
+
+    # ################ #
+    #  Get or compute  #
+    # ################ #
+
+    async def eval_redis_script(self, script, keys, args):
+        """
+        Executes lua script by EVALSHA, sends script body only if it is
+        not cached by redis yet
+        :param script: lua script
+        :param keys: list of keys
+        :param args: list of arguments
+        :return: result of script
+        """
+        sha = _get_script_sha(script)
+        pool = await self.get_redis_pool()
+        try:
+            return await pool.execute(
+                'evalsha', sha, len(keys), *keys, *args
+            )
+        except Exception as exc:  # pylint: disable=W0703
+            if 'NOSCRIPT' not in str(exc):
+                raise
+        return await pool.execute(
+            'eval', script, len(keys), *keys, *args
+        )
+
+    async def get_or_compute_redis_val(self, key, compute, exp, **kwargs):
+        """
+        Returns value from redis or computes and writes it. Only one caller
+        in cluster computes value under redis lock, others get stale value
+        or wait for new one. Value is recomputed before expiration with
+        probability growing to expiration (XFetch).
+        Value is stored as JSON with time of computing and expiration,
+        so key must be read only by this function
+        :param key: key
+        :param compute: function or coroutine function without arguments
+        :param exp: Expire time in seconds
+        param stale_exp: seconds while stale value can be returned
+        param lock_timeout: lock timeout in milliseconds, default 5000
+        param wait_timeout: seconds to wait value computed by other
+         caller, default lock timeout
+        param beta: XFetch factor, > 1 favors earlier recomputing
+        param use_json_utils: bool use json utils from bson
+        :return: value
+        """
+        return await self.redis_single_flight.do(
+            key, self._get_or_compute_redis_val, key, compute, exp, **kwargs
+        )
+
+    async def _get_compute_envelope(self, key, use_json_utils=False):
+        """
+        Returns stored value with time of computing and expiration
+        :param key: key
+        :param use_json_utils: bool use json utils from bson
+        :return: list or None
+        """
+        pool = await self.get_redis_pool()
+        val = await pool.execute('get', key)
+        return self._decode_redis_val(val, from_json=True,
+                                      use_json_utils=use_json_utils)
+
+    async def _wait_compute_envelope(self, key, timeout, use_json_utils=False):
+        """
+        Waits value computed by other caller
+        :param key: key
+        :param timeout: seconds
+        :param use_json_utils: bool use json utils from bson
+        :return: list or None if timeout is over
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            envelope = await self._get_compute_envelope(key, use_json_utils)
+            if envelope is not None:
+                return envelope
+            delay = min(delay * 2, 0.2)
+        return None
+
+    async def _get_or_compute_redis_val(self, key, compute, exp, **kwargs):
+        """
+        Get or compute without coalescing of local callers
+        """
+        use_json_utils = kwargs.get('use_json_utils', False)
+        lock_timeout = kwargs.get('lock_timeout', 5000)
+        envelope = await self._get_compute_envelope(key, use_json_utils)
+        if envelope is not None:
+            val, delta, expires_at = envelope
+            if not is_early_expired(delta, expires_at,
+                                    kwargs.get('beta', 1.0)):
+                return val
+
+        lock = TorskelRedisLock(self, get_related_key(key, 'lock'),
+                                lock_timeout)
+        if await lock.acquire() is None:
+            if envelope is None:
+                envelope = await self._wait_compute_envelope(
+                    key, kwargs.get('wait_timeout', lock_timeout / 1000),
+                    use_json_utils
+                )
+            if envelope is not None:
+                return envelope[0]
+            self.logger.warning('Value of %s was not computed in time, '
+                                'computing without lock', key)
+
+        started = time.monotonic()
+        try:
+            val = compute()
+            if asyncio.iscoroutine(val) or asyncio.isfuture(val):
+                val = await val
+        except Exception:
+            await lock.release()
+            if envelope is None:
+                raise
+            self.logger.exception('Computing of %s failed, '
+                                  'stale value is returned', key)
+            return envelope[0]
+
+        if lock.token is not None:
+            data = self._encode_redis_val(
+                [val, time.monotonic() - started, time.time() + exp],
+                convert_to_json=True, use_json_utils=use_json_utils
+            )
+            if not await lock.set_val(
+                    key, data, int((exp + kwargs.get('stale_exp', 0)) * 1000)
+            ):
+                self.logger.warning('Lock of %s was lost, computed value '
+                                    'is not stored', key)
+        return val